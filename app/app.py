@@ -2,6 +2,8 @@ from flask import Flask, render_template, request, redirect, url_for, session
 from elasticsearch import Elasticsearch
 from elastic.semantic import semantic
 from elastic.semantic import semantic_search
+from elastic.metrics import metrics
+from elastic.ingest import ingest
 import traceback
 
 
@@ -10,6 +12,8 @@ SEARCH_SIZE = 5
 app = Flask(__name__)
 app.secret_key = "lockheed"
 app.register_blueprint(semantic)
+app.register_blueprint(metrics)
+app.register_blueprint(ingest)
 
 users = {"user1": "password1", "user2": "password2"}  #please do not keep it like this, this is just a very rudamentary way to implement it
 
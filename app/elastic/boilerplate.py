@@ -0,0 +1,67 @@
+import re
+from collections import defaultdict
+
+EDGE_ENTRIES = 3  # text blocks at the top and at the bottom of a page that can be running headers / footers
+EDGE_MAX_CHARS = 120  # running headers and footers are a line or two, longer blocks are body text
+MIN_PAGES = 3  # a block has to recur on at least this many pages of a document...
+MIN_PAGE_SHARE = 0.2  # ...and on this share of its pages to count as boilerplate
+MIN_NOTICE_PAGES = 5  # notices ("INSERT LATEST CHANGED PAGES") recur anywhere on the page, but need more pages
+NOTICE_MAX_CHARS = 120  # notices are a line or two, a recurring paragraph (a WARNING repeated where it applies) is content
+
+
+# Text of a block with the parts that change from page to page (page numbers, dates, spacing) taken out,
+# so "2-5" and "3-1" or "Change 2 - 1 May 2019" and "Change 3 - 4 Jun 2020" compare equal
+def block_signature(text):
+    text = re.sub(r"\d+", "#", text.lower())
+    text = re.sub(r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b", "<month>", text)
+    return " ".join(text.split())
+
+
+# Positions of a page's entries counted from the nearest edge, e.g. ("top", 0) for the first block.
+# Entries in the middle of a page have no edge position.
+def edge_position(index, count):
+    if index < EDGE_ENTRIES:
+        return ("top", index)
+    if count - 1 - index < EDGE_ENTRIES:
+        return ("bottom", count - 1 - index)
+    return None
+
+
+# Recurring blocks of the parser output, grouped per document. Returns the (page index, subheader) entries
+# to drop: blocks that come back at the same edge position of many pages (running headers, footers, page
+# numbers, compared by signature) and short blocks that come back verbatim on many pages wherever they are
+# (notices). The first copy of a notice is kept, so its text stays searchable once.
+def find_boilerplate(pages):
+    by_document = defaultdict(list)
+    for page_index, page in enumerate(pages):
+        by_document[page.get("document_url", "")].append(page_index)
+
+    boilerplate = set()
+    for page_indexes in by_document.values():
+        threshold = max(MIN_PAGES, MIN_PAGE_SHARE * len(page_indexes))
+        at_edge = defaultdict(set)
+        anywhere = defaultdict(set)
+        entries = []
+        for page_index in page_indexes:
+            subheaders = pages[page_index].get("subheader", {})
+            for i, (subheader, content) in enumerate(subheaders.items()):
+                if not isinstance(content, str) or not content.strip():
+                    continue  # only the content of an entry becomes a passage
+                signature = block_signature(content)
+                verbatim = " ".join(content.split())
+                position = edge_position(i, len(subheaders)) if len(verbatim) <= EDGE_MAX_CHARS else None
+                entries.append((page_index, subheader, signature, verbatim, position))
+                if position is not None:
+                    at_edge[(position, signature)].add(page_index)
+                if len(verbatim) <= NOTICE_MAX_CHARS:
+                    anywhere[verbatim].add(page_index)
+        kept_notices = set()
+        for page_index, subheader, signature, verbatim, position in entries:
+            if position is not None and len(at_edge[(position, signature)]) >= threshold:
+                boilerplate.add((page_index, subheader))
+            elif len(anywhere[verbatim]) >= max(threshold, MIN_NOTICE_PAGES):
+                if verbatim in kept_notices:
+                    boilerplate.add((page_index, subheader))
+                else:
+                    kept_notices.add(verbatim)
+    return boilerplate
@@ -0,0 +1,133 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from elasticsearch import TransportError, helpers
+
+BULK_CHUNK_SIZE = 500  # documents per _bulk request
+BULK_THREADS = 4  # _bulk requests in flight at once
+BULK_MAX_RETRIES = 5  # retries of the rejected part of a chunk
+BULK_INITIAL_BACKOFF = 1.0  # seconds, doubled on every retry
+BULK_MAX_BACKOFF = 30.0
+
+
+# Counters for one bulk load, shared by the sender threads
+class BulkStats:
+    def __init__(self):
+        self.docs = 0
+        self.failed = 0
+        self.rejected = 0  # documents or chunks ES answered with 429
+        self.retries = 0
+        self.es_rejections = 0  # increase of the write thread pool "rejected" counter on the cluster
+        self.seconds = 0.0
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def add(self, docs=0, failed=0, rejected=0, retries=0, error=None):
+        with self._lock:
+            self.docs += docs
+            self.failed += failed
+            self.rejected += rejected
+            self.retries += retries
+            if error is not None and len(self.errors) < 10:
+                self.errors.append(error)
+
+    def docs_per_second(self):
+        return self.docs / self.seconds if self.seconds else 0.0
+
+    def report(self):
+        return (f"Bulk load: {self.docs} docs in {self.seconds:.1f}s ({self.docs_per_second():.0f} docs/sec), "
+                f"{self.failed} failed, {self.rejected} rejected, {self.retries} retries, "
+                f"{self.es_rejections} ES write thread pool rejections.")
+
+
+def _chunks(actions, chunk_size):
+    actions = iter(actions)
+    while True:
+        chunk = list(islice(actions, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Sum of the "rejected" counter of the write thread pool over all nodes
+def _write_rejections(es):
+    try:
+        rows = es.cat.thread_pool(thread_pool_patterns="write", format="json", h="rejected")
+        return sum(int(row.get("rejected") or 0) for row in rows)
+    except Exception as e:
+        print("Could not read write thread pool stats:", str(e))
+        return 0
+
+
+# Send one chunk, retrying only the documents ES rejected with 429 (or the whole chunk if the request was rejected)
+def _send_chunk(es, chunk, stats, max_retries, initial_backoff):
+    pending = chunk
+    for attempt in range(max_retries + 1):
+        if attempt:
+            stats.add(retries=1)
+            time.sleep(min(initial_backoff * 2 ** (attempt - 1), BULK_MAX_BACKOFF))
+        body = []
+        for action in pending:
+            header, source = helpers.expand_action(action)
+            body.append(header)
+            if source is not None:
+                body.append(source)
+        try:
+            response = es.bulk(body=body)
+        except TransportError as e:
+            if e.status_code == 429:
+                stats.add(rejected=len(pending))
+                continue
+            stats.add(failed=len(pending), error=str(e))
+            return
+        retry = []
+        for action, item in zip(pending, response["items"]):
+            result = next(iter(item.values()))
+            status = result.get("status", 500)
+            if status == 429:
+                retry.append(action)
+            elif status >= 300:
+                stats.add(failed=1, error=str(result.get("error")))
+            else:
+                stats.add(docs=1)
+        if retry:
+            stats.add(rejected=len(retry))
+        pending = retry
+        if not pending:
+            return
+    stats.add(failed=len(pending), error=f"{len(pending)} documents still rejected after {max_retries} retries")
+
+
+# Stream actions into the index with several _bulk requests in flight. Refresh and replicas are
+# switched off for the duration of the load and restored afterwards, even if the load fails.
+def bulk_load(es, index, actions, chunk_size=BULK_CHUNK_SIZE, threads=BULK_THREADS,
+              max_retries=BULK_MAX_RETRIES, initial_backoff=BULK_INITIAL_BACKOFF):
+    stats = BulkStats()
+    settings = es.indices.get_settings(index=index, flat_settings=True)[index]["settings"]
+    original = {
+        "index.refresh_interval": settings.get("index.refresh_interval"),  # None resets to the cluster default
+        "index.number_of_replicas": settings.get("index.number_of_replicas")
+    }
+    rejections_before = _write_rejections(es)
+    start = time.perf_counter()
+    es.indices.put_settings(index=index, body={"index.refresh_interval": "-1", "index.number_of_replicas": 0})
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            in_flight = set()
+            for chunk in _chunks(actions, chunk_size):
+                # Bound the number of queued chunks so the action stream is consumed at the pace ES accepts it
+                if len(in_flight) >= threads * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(executor.submit(_send_chunk, es, chunk, stats, max_retries, initial_backoff))
+            for future in in_flight:
+                future.result()
+    finally:
+        es.indices.put_settings(index=index, body=original)
+        es.indices.refresh(index=index)
+        stats.seconds = time.perf_counter() - start
+        stats.es_rejections = _write_rejections(es) - rejections_before
+    print(stats.report())
+    return stats
@@ -0,0 +1,110 @@
+import os
+import threading
+import numpy as np
+
+EMBEDDING_DIMS = 768  # BERT base hidden size
+DIGEST_SIZE = 32  # raw sha256 digest length in the index sidecar
+
+
+# Content-addressed store for passage embeddings, keyed by the same sha256(text) used as the ES document id.
+# Vectors are appended to a flat float32 file (one row per passage) which is memory-mapped for reads,
+# and the sidecar index holds the raw digest of every row in the same order.
+class EmbeddingCache:
+    def __init__(self, directory, dims=EMBEDDING_DIMS):
+        self.directory = directory
+        self.dims = dims
+        self.vectors_path = os.path.join(directory, "embeddings.f32")
+        self.index_path = os.path.join(directory, "embeddings.idx")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._rows = {}  # hex digest -> row in the vectors file
+        self._ids = []  # hex digest of every stored row, in row order
+        self._pending = {}  # hex digest -> vector not yet written to disk
+        self._matrix = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # Read the sidecar index and map the vectors file, dropping any row that was only half written
+    def _load(self):
+        digests = b""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as file:
+                digests = file.read()
+        row_bytes = self.dims * 4
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        count = min(len(digests) // DIGEST_SIZE, vector_rows)
+
+        if count * DIGEST_SIZE != len(digests):
+            with open(self.index_path, "r+b") as file:
+                file.truncate(count * DIGEST_SIZE)
+        if os.path.exists(self.vectors_path) and count * row_bytes != os.path.getsize(self.vectors_path):
+            with open(self.vectors_path, "r+b") as file:
+                file.truncate(count * row_bytes)
+
+        self._ids = [digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE].hex() for i in range(count)]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._remap()
+
+    def _remap(self):
+        count = len(self._ids)
+        if count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dims))
+        else:
+            self._matrix = np.zeros((0, self.dims), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._rows) + len(self._pending)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._rows or doc_id in self._pending
+
+    # Returns the cached vector for doc_id, or None if it has never been encoded
+    def get(self, doc_id):
+        vector = self._pending.get(doc_id)
+        if vector is None:
+            row = self._rows.get(doc_id)
+            if row is not None:
+                vector = self._matrix[row]
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def put(self, doc_id, vector):
+        if doc_id in self:
+            return
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dims)
+        with self._lock:
+            self._pending[doc_id] = vector
+
+    # Append pending vectors to disk. The vectors are written before their digests so a crash
+    # in between leaves rows without an index entry, which _load discards.
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending = list(self._pending.items())
+            with open(self.vectors_path, "ab") as file:
+                file.write(np.stack([vector for _, vector in pending]).tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            with open(self.index_path, "ab") as file:
+                file.write(b"".join(bytes.fromhex(doc_id) for doc_id, _ in pending))
+                file.flush()
+                os.fsync(file.fileno())
+            # Remap before publishing the new rows so concurrent readers never see a row past the end of the map
+            first_row = len(self._ids)
+            self._ids = self._ids + [doc_id for doc_id, _ in pending]
+            self._remap()
+            for offset, (doc_id, _) in enumerate(pending):
+                self._rows[doc_id] = first_row + offset
+            self._pending = {}
+
+    # Ids and the memory-mapped float32 matrix of every flushed vector, in row order
+    def ids(self):
+        return list(self._ids)
+
+    def vectors(self):
+        return self._matrix
@@ -0,0 +1,184 @@
+import itertools
+import os
+import queue
+import threading
+from time import sleep
+from elastic.encoders import Encoder, BertServiceEncoder
+
+# Comma separated host:port:port_out of every bert-serving-start replica
+BERT_ENDPOINTS = os.environ.get("BERT_ENDPOINTS", "bert:5555:5556")
+POOL_STRATEGY = os.environ.get("ENCODER_POOL_STRATEGY", "least-outstanding")  # or "round-robin"
+POOL_CLIENT_TIMEOUT = 2000  # ms, passed to every BertClient
+POOL_MAX_CLIENTS = 8  # idle connections kept per replica
+POOL_HEALTH_INTERVAL = 10  # seconds between health checks
+POOL_IN_FLIGHT_PER_REPLICA = 2  # batches kept in flight per replica while encoding the corpus
+POOL_MAX_FAILURES = 3  # consecutive failed encode calls that take a replica out of rotation until a health check passes
+
+
+def parse_endpoints(endpoints):
+    parsed = []
+    for endpoint in endpoints.split(","):
+        if endpoint.strip():
+            ip, port, port_out = endpoint.strip().split(":")
+            parsed.append((ip, int(port), int(port_out)))
+    return parsed
+
+
+# One bert-serving-start replica and the idle connections to it. A BertClient is a pair of zmq sockets
+# that must not be shared between threads, so each encode call checks one out for itself.
+class Replica:
+    def __init__(self, ip, port, port_out, timeout):
+        self.ip = ip
+        self.port = port
+        self.port_out = port_out
+        self.timeout = timeout
+        self.healthy = False
+        self.outstanding = 0
+        self.failures = 0  # consecutive failed encode calls
+        self.idle = queue.LifoQueue()
+
+    def __str__(self):
+        return f"{self.ip}:{self.port}"
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return BertServiceEncoder(self.ip, self.port, self.port_out, timeout=self.timeout, max_retries=1, verbose=False)
+
+    def release(self, client):
+        if self.healthy and self.idle.qsize() < POOL_MAX_CLIENTS:
+            self.idle.put(client)
+        else:
+            client.close()
+
+    def close_idle(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # A fresh connection that answers a server_status request within the timeout
+    def check(self):
+        try:
+            client = BertServiceEncoder(self.ip, self.port, self.port_out, timeout=self.timeout, max_retries=1, verbose=False)
+            client.client.server_status
+            client.close()
+            return True
+        except Exception:
+            return False
+
+
+# Thread-safe encoder over one or more bert-as-service replicas. Every call gets its own connection,
+# replicas are chosen by least outstanding requests or round-robin, and a background thread takes
+# failing replicas out of rotation and puts them back once they answer again.
+class BertServicePool(Encoder):
+    name = "bert-service"
+
+    def __init__(self, endpoints=BERT_ENDPOINTS, strategy=POOL_STRATEGY, timeout=POOL_CLIENT_TIMEOUT,
+                 health_interval=POOL_HEALTH_INTERVAL, max_retries=5, wait_seconds=5):
+        self.replicas = [Replica(ip, port, port_out, timeout) for ip, port, port_out in parse_endpoints(endpoints)]
+        if not self.replicas:
+            raise ValueError("No BERT endpoints configured.")
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._round_robin = itertools.count()
+        self._stopped = threading.Event()
+
+        #retry until at least one replica answers because bert takes a while to load the model
+        for attempt in range(max_retries):
+            self.check_replicas()
+            if self.healthy_replicas():
+                print(f"Connected to BERT replicas: {', '.join(str(r) for r in self.healthy_replicas())}.")
+                break
+            print(f"Connection attempt {attempt + 1}/{max_retries} failed: no BERT replica answered.")
+            if attempt < max_retries - 1:
+                print(f"Retrying in {wait_seconds} seconds...")
+                sleep(wait_seconds)
+        else:
+            raise ConnectionError("Could not connect to the BERT server after several retries.")
+
+        self._health_thread = threading.Thread(target=self._health_loop, args=(health_interval,), daemon=True)
+        self._health_thread.start()
+
+    def healthy_replicas(self):
+        return [replica for replica in self.replicas if replica.healthy]
+
+    # Number of encode calls worth running at once, used to parallelise corpus encoding
+    @property
+    def concurrency(self):
+        return max(1, len(self.healthy_replicas()) * POOL_IN_FLIGHT_PER_REPLICA)
+
+    def check_replicas(self):
+        for replica in self.replicas:
+            healthy = replica.check()
+            if healthy != replica.healthy:
+                print(f"BERT replica {replica} is {'back in rotation' if healthy else 'down, removed from rotation'}.")
+            replica.healthy = healthy
+            if healthy:
+                replica.failures = 0
+            else:
+                replica.close_idle()
+
+    def _health_loop(self, interval):
+        while not self._stopped.wait(interval):
+            self.check_replicas()
+
+    def _pick(self, exclude):
+        with self._lock:
+            candidates = [r for r in self.replicas if r.healthy and r not in exclude]
+            if not candidates:
+                raise ConnectionError("No healthy BERT replica available.")
+            if self.strategy == "round-robin":
+                replica = candidates[next(self._round_robin) % len(candidates)]
+            else:
+                replica = min(candidates, key=lambda r: r.outstanding)
+            replica.outstanding += 1
+            return replica
+
+    # Encode on one replica, moving on to the next one if it fails. A single failure only skips the replica for
+    # this call, it leaves the rotation after POOL_MAX_FAILURES failures in a row.
+    def encode(self, texts):
+        texts = list(texts)
+        tried = []
+        error = None
+        while True:
+            try:
+                replica = self._pick(tried)
+            except ConnectionError:
+                if error is None:
+                    raise
+                raise error  # every replica was tried, report why the last one failed
+            try:
+                client = replica.acquire()
+                try:
+                    result = client.encode(texts)
+                except Exception:
+                    client.close()
+                    raise
+                replica.release(client)
+                with self._lock:
+                    replica.failures = 0
+                return result
+            except Exception as e:
+                print(f"Encode on BERT replica {replica} failed: {e}")
+                error = e
+                with self._lock:
+                    replica.failures += 1
+                    evict = replica.failures >= POOL_MAX_FAILURES and replica.healthy
+                    if evict:
+                        replica.healthy = False
+                if evict:
+                    print(f"BERT replica {replica} is down after {replica.failures} failed calls, removed from rotation.")
+                    replica.close_idle()
+                tried.append(replica)
+            finally:
+                with self._lock:
+                    replica.outstanding -= 1
+
+    def close(self):
+        self._stopped.set()
+        for replica in self.replicas:
+            replica.healthy = False
+            replica.close_idle()
@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+import numpy as np
+
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "bert-service")  # "bert-service" (zmq replicas) or "cpu" (in-process)
+
+# bert-serving-start settings the in-process encoder has to reproduce to stay in the same vector space
+CPU_MODEL_NAME = os.environ.get("ENCODER_MODEL", "bert-base-cased")  # same weights as cased_L-12_H-768_A-12
+CPU_MAX_SEQ_LEN = int(os.environ.get("ENCODER_MAX_SEQ_LEN", "25"))  # bert-serving-start default max_seq_len
+CPU_POOLING_LAYER = -2  # bert-serving-start default pooling_layer, averaged with REDUCE_MEAN
+CPU_THREADS = int(os.environ.get("ENCODER_THREADS", str(os.cpu_count() or 1)))
+CPU_QUANTIZE = os.environ.get("ENCODER_QUANTIZE", "true").lower() == "true"
+CPU_BATCH_SIZE = 32
+ENCODE_BATCH_SIZE = 64  # texts per encode call when embedding the corpus
+LENGTH_BUCKETING = os.environ.get("LENGTH_BUCKETING", "true").lower() == "true"
+
+
+# Turns a list of texts into a (len(texts), 768) float32 array
+class Encoder:
+    name = "encoder"
+    concurrency = 1  # encode calls that may run at the same time from different threads
+
+    def encode(self, texts):
+        raise NotImplementedError
+
+    # Rough sequence lengths used to group texts of similar size into the same batch
+    def token_lengths(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def close(self):
+        pass
+
+
+# A single connection to a bert-as-service container over zmq. Not thread-safe, the bert-service
+# backend hands these out one per call through BertServicePool.
+class BertServiceEncoder(Encoder):
+    name = "bert-client"
+
+    def __init__(self, ip="bert", port=5555, port_out=5556, timeout=2000, max_retries=5, wait_seconds=5, verbose=True):
+        from bert_serving.client import BertClient
+
+        #retry initializing bert client because it doesnt auto retry and will hang
+        for attempt in range(max_retries):
+            try:
+                # Attempt to connect to the BERT server
+                self.client = BertClient(check_length=False, ip=ip, timeout=timeout, port=port, port_out=port_out)
+                if verbose:
+                    print("Connected to BERT server.")
+                break
+            except Exception as e:
+                if verbose:
+                    print(f"Connection attempt {attempt + 1}/{max_retries} failed: {e}")
+                if attempt < max_retries - 1:
+                    print(f"Retrying in {wait_seconds} seconds...")
+                    sleep(wait_seconds)
+                else:
+                    raise ConnectionError("Could not connect to the BERT server after several retries.") from e
+
+    def encode(self, texts):
+        return np.asarray(self.client.encode(list(texts)), dtype=np.float32)
+
+    def close(self):
+        self.client.close()
+
+
+# Cased BERT-base running inside the app process on CPU, for sites without a GPU. Linear layers are
+# dynamically quantized to int8 and every batch is padded only to its own longest sequence.
+class CpuBertEncoder(Encoder):
+    name = "cpu"
+
+    def __init__(self, model_name=CPU_MODEL_NAME, max_seq_len=CPU_MAX_SEQ_LEN, threads=CPU_THREADS,
+                 quantize=CPU_QUANTIZE, batch_size=CPU_BATCH_SIZE):
+        # torch and transformers are only needed for this backend (see requirements-cpu.txt)
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.max_seq_len = max_seq_len
+        self.batch_size = batch_size
+        torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name, output_hidden_states=True).eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        print(f"Loaded CPU encoder {model_name} ({'int8' if quantize else 'fp32'}, {threads} threads).")
+
+    def token_lengths(self, texts):
+        return [len(ids) for ids in self.tokenizer(list(texts), truncation=True, max_length=self.max_seq_len)["input_ids"]]
+
+    def encode(self, texts):
+        texts = list(texts)
+        output = np.zeros((len(texts), 768), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            inputs = self.tokenizer(batch, padding="longest", truncation=True, max_length=self.max_seq_len,
+                                    return_tensors="pt")
+            with self.torch.inference_mode():
+                hidden = self.model(**inputs).hidden_states[CPU_POOLING_LAYER]
+            # REDUCE_MEAN over the real tokens ([CLS] and [SEP] included, padding excluded), as bert-as-service does
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            output[start:start + len(batch)] = pooled.numpy()
+        return output
+
+
+# Encode a corpus in batches of texts with similar token length, so little compute goes to padding
+# short subheaders up to the longest paragraph of their batch. Rows come back in the input order.
+def encode_bucketed(encoder, texts, batch_size=ENCODE_BATCH_SIZE, bucketing=LENGTH_BUCKETING):
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 768), dtype=np.float32)
+    if bucketing:
+        lengths = encoder.token_lengths(texts)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    else:
+        order = list(range(len(texts)))
+    output = np.zeros((len(texts), 768), dtype=np.float32)
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+    def encode_batch(rows):
+        output[rows] = encoder.encode([texts[i] for i in rows])
+
+    # Thread-safe encoders (the replica pool) get several batches in flight at once
+    if encoder.concurrency > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(encoder.concurrency, len(batches))) as executor:
+            list(executor.map(encode_batch, batches))
+    else:
+        for rows in batches:
+            encode_batch(rows)
+    return output
+
+
+def create_encoder(backend=ENCODER_BACKEND, **kwargs):
+    # the pool module builds on this one, so it is imported here rather than at the top
+    from elastic.encoder_pool import BertServicePool
+
+    encoders = {BertServicePool.name: BertServicePool, CpuBertEncoder.name: CpuBertEncoder}
+    if backend not in encoders:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {sorted(encoders)}")
+    return encoders[backend](**kwargs)
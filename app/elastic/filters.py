@@ -0,0 +1,144 @@
+import re
+import numpy as np
+
+# Passage metadata copied from the parser output into every indexed document
+METADATA_MAPPING = {
+    "document_url": {"type": "keyword"},
+    "document_title": {"type": "keyword"},
+    "page_number": {"type": "integer"},
+    "traceability": {
+        "properties": {
+            "source": {"type": "keyword"},
+            "manual_reference": {"type": "keyword"},
+            "exact_location": {"type": "keyword"}
+        }
+    },
+    # every source of a passage that near-duplicates were collapsed into (see near_duplicates.py)
+    "locations": {
+        "properties": {
+            "document_url": {"type": "keyword"},
+            "document_title": {"type": "keyword"},
+            "page_number": {"type": "integer"},
+            "exact_location": {"type": "keyword"}
+        }
+    }
+}
+CITATION_FIELDS = ["text", "document_url", "document_title", "page_number", "locations"]
+
+
+# The parser writes page numbers as "Page_12" (or "Page_Page_12"), keep only the number
+def parse_page_number(page_number):
+    if isinstance(page_number, int):
+        return page_number
+    match = re.search(r"(\d+)$", str(page_number or ""))
+    return int(match.group(1)) if match else None
+
+
+# Why the request filters cannot be applied, or None when they can
+def filter_error(filters):
+    if filters is None:
+        return None
+    if not isinstance(filters, dict):
+        return "filters must be an object"
+    for field in ("document", "source"):
+        if filters.get(field) is not None and not isinstance(filters[field], str):
+            return f"filters.{field} must be a string"
+    for field in ("page_from", "page_to"):
+        if filters.get(field) is not None:
+            if isinstance(filters[field], bool):
+                return f"filters.{field} must be an integer"
+            try:
+                int(filters[field])
+            except (TypeError, ValueError, OverflowError):
+                return f"filters.{field} must be an integer"
+    return None
+
+
+# Translate the request filters into ES filter clauses:
+#   {"document": url or title, "page_from": int, "page_to": int, "source": str}
+def build_es_filter(filters):
+    clauses = []
+    if not filters:
+        return clauses
+    if filters.get("document"):
+        clauses.append({"bool": {"should": [
+            {"term": {"document_url": filters["document"]}},
+            {"term": {"document_title": filters["document"]}},
+            {"term": {"locations.document_url": filters["document"]}},
+            {"term": {"locations.document_title": filters["document"]}}
+        ], "minimum_should_match": 1}})
+    page_range = {}
+    if filters.get("page_from") is not None:
+        page_range["gte"] = int(filters["page_from"])
+    if filters.get("page_to") is not None:
+        page_range["lte"] = int(filters["page_to"])
+    if page_range:
+        clauses.append({"range": {"page_number": page_range}})
+    if filters.get("source"):
+        clauses.append({"term": {"traceability.source": filters["source"]}})
+    return clauses
+
+
+# Filters wrapped around the base query so scoring only runs on documents that pass them
+def filtered_query(query, filters):
+    clauses = build_es_filter(filters)
+    if not clauses:
+        return query
+    return {"bool": {"must": query, "filter": clauses}}
+
+
+# The same filters as column arrays aligned with the quantized index rows, so the in-memory
+# search can mask out rows with numpy instead of asking ES which documents match. The index covers the
+# whole embedding cache, rows of passages that are not indexed (retired, boilerplate, collapsed into a
+# near-duplicate) are always masked out.
+class RowMetadata:
+    def __init__(self, ids, passages):
+        self.values = {}
+        self.indexed = np.array([doc_id in passages for doc_id in ids], dtype=bool)
+        columns = {"document_url": [], "document_title": [], "source": []}
+        pages = []
+        self.other_documents = {}  # row -> documents of the near-duplicates collapsed into it
+        for row, doc_id in enumerate(ids):
+            passage = passages.get(doc_id, {})
+            if passage.get("locations"):
+                self.other_documents[row] = {location.get(field) for location in passage["locations"]
+                                             for field in ("document_url", "document_title")}
+            columns["document_url"].append(passage.get("document_url") or "")
+            columns["document_title"].append(passage.get("document_title") or "")
+            columns["source"].append(passage.get("traceability", {}).get("source") or "")
+            page = passage.get("page_number")
+            pages.append(-1 if page is None else page)
+        self.codes = {}
+        for name, column in columns.items():
+            self.values[name], self.codes[name] = np.unique(np.array(column, dtype=object).astype(str), return_inverse=True)
+        self.pages = np.array(pages, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def _equals(self, name, value):
+        position = np.searchsorted(self.values[name], value)
+        if position >= len(self.values[name]) or self.values[name][position] != value:
+            return np.zeros(len(self.pages), dtype=bool)
+        return self.codes[name] == position
+
+    def _in_other_documents(self, value):
+        rows = np.zeros(len(self.pages), dtype=bool)
+        rows[[row for row, documents in self.other_documents.items() if value in documents]] = True
+        return rows
+
+    # Boolean row mask for the request filters, or None when every row can be returned
+    def mask(self, filters):
+        if not filters:
+            return None if self.indexed.all() else self.indexed.copy()
+        mask = self.indexed.copy()
+        if filters.get("document"):
+            mask &= self._equals("document_url", filters["document"]) | self._equals("document_title", filters["document"]) \
+                | self._in_other_documents(filters["document"])
+        if filters.get("page_from") is not None:
+            mask &= self.pages >= int(filters["page_from"])
+        if filters.get("page_to") is not None:
+            mask &= (self.pages >= 0) & (self.pages <= int(filters["page_to"]))
+        if filters.get("source"):
+            mask &= self._equals("source", filters["source"])
+        return mask
@@ -0,0 +1,506 @@
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from elasticsearch import helpers
+from flask import Blueprint, request, jsonify
+from werkzeug.utils import secure_filename
+import PyPDF2
+from elastic.semantic import (es, INDEX_NAME, UPLOAD_DIR, BUNDLED_DATA, ENCODE_WINDOW, embedding_cache, index_stats,
+                              load_data, load_uploaded_passages, page_passages, embed_passages, passage_id,
+                              collapse_passages, sync_passages, document_passage_ids)
+from elastic.metrics import Callback, Histogram
+from elastic.pipeline import Pipeline, Stage
+
+ingest = Blueprint("ingest", __name__)
+
+PARSER_SCRIPT = os.environ.get("PARSER_SCRIPT", "../utils/pdf_parser_json_printing.py")
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))  # parse/embed/index jobs running at once
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "8"))  # jobs waiting for a worker, more uploads get a 503
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "512"))
+PARSER_NICE = 10  # the parser (OCR included) runs at a lower CPU priority than the search endpoint
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # the upload is copied to disk this much at a time, never held in memory whole
+INDEX_CHUNK_SIZE = 500
+STREAMING_INGEST = os.environ.get("STREAMING_INGEST", "true").lower() == "true"  # index pages while the parser runs
+CHUNK_BATCH_PAGES = 16  # parsed pages turned into passages together while streaming
+JOB_HISTORY = 100  # finished jobs kept for the progress endpoint
+PAGE_LINE = re.compile(r"\[INFO\] Processing Page (\d+)")
+CHANGED_LINE = re.compile(r"\[INFO\] Changed pages: (\d+) of (\d+)")
+PAGE_RECORD = "[PAGE] "  # parser line carrying one page, see PARSER_EMIT_PAGES and PARSER_PAGES_FD in the parser
+JOB_FILE = "job.json"  # what a job directory holds, used to find the previous revision of a document
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+_slots = threading.BoundedSemaphore(INGEST_WORKERS + INGEST_MAX_PENDING)
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+ingest_stage_seconds = Histogram("ingest_stage_seconds", "Time spent in each stage of an upload job.",
+                                 buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+
+
+class UploadRejected(Exception):
+    pass
+
+
+def new_job(filename, document):
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "filename": filename,
+        "document": document,  # uploads of the same document are revisions, the newest one replaces the others
+        "status": "queued",  # queued, running, done or failed
+        "stage": "upload",  # upload, stream and chunk (or parse, chunk, embed and index), reconcile, retire
+        "bytes": 0,
+        "pages_total": None,
+        "pages_done": 0,
+        "pages_changed": None,
+        "pages_reused": 0,
+        "passages": 0,
+        "passages_boilerplate": 0,
+        "passages_near_duplicate": 0,
+        "passages_embedded": 0,
+        "passages_indexed": 0,
+        "passages_retired": 0,
+        "passages_streamed": 0,
+        "first_searchable_seconds": None,  # from the start of the parse to the first passages in the index
+        "pipeline": None,  # per stage counters of the streaming pipeline
+        "previous_job_id": None,
+        "stage_seconds": {},
+        "created": time.time(),
+        "finished": None,
+        "error": None,
+    }
+    with _jobs_lock:
+        _jobs[job["job_id"]] = job
+        # forget the oldest finished jobs, never the ones still queued or running
+        finished = [job_id for job_id, old in _jobs.items() if old["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del _jobs[job_id]
+    return job
+
+
+def update(job, **fields):
+    with _jobs_lock:
+        job.update(fields)
+
+
+def save_job_record(record, job_dir):
+    with open(os.path.join(job_dir, JOB_FILE), "w") as f:
+        json.dump({field: record.get(field) for field in ("job_id", "document", "filename", "status", "created")}, f)
+
+
+# The newest successfully indexed upload of the same document, or None
+def previous_revision(document, job_id):
+    latest = None
+    for path in glob.glob(os.path.join(UPLOAD_DIR, "*", JOB_FILE)):
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except Exception:
+            continue
+        if record.get("document") != document or record.get("status") != "done" or record.get("job_id") == job_id:
+            continue
+        if latest is None or record["created"] > latest["created"]:
+            latest = record
+    return latest
+
+
+@contextmanager
+def job_stage(job, stage):
+    update(job, stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _jobs_lock:
+            job["stage_seconds"][stage] = round(elapsed, 3)
+        ingest_stage_seconds.observe(elapsed, stage=stage)
+
+
+# Copy the request body (a raw PDF, or the "file" part of a form) to disk in fixed size chunks
+def save_upload(path):
+    if request.mimetype == "multipart/form-data":
+        # werkzeug spools form parts larger than 500 KB to a temporary file, not to memory
+        upload = request.files.get("file")
+        if upload is None:
+            raise UploadRejected("no file part in the form")
+        stream = upload.stream
+    else:
+        stream = request.stream
+    limit = MAX_UPLOAD_MB * 1024 * 1024
+    written = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if written == 0 and not chunk.startswith(b"%PDF"):
+                raise UploadRejected("file is not a PDF")
+            written += len(chunk)
+            if written > limit:
+                raise UploadRejected(f"file is larger than {MAX_UPLOAD_MB} MB")
+            f.write(chunk)
+    if written == 0:
+        raise UploadRejected("empty upload")
+    return written
+
+
+def _lower_priority():
+    os.nice(PARSER_NICE)
+
+
+def extracted_path(job_dir):
+    return os.path.join(job_dir, "app", "data", "extracted_data.json")
+
+
+# Run the PDF parser in its own process, inside the job directory so its output and temporary files
+# never collide with another job. Page progress is read from the parser's output as it runs. With a
+# previous revision, the parser only extracts the pages whose fingerprint is not in that revision.
+# With stream_pages, the parser writes every output page to a pipe of its own as it is done (its stdout
+# also carries the page workers' output) and they are yielded here, while a thread follows the progress.
+def run_parser(job, job_dir, filename, previous, stream_pages=False):
+    with open(os.path.join(job_dir, filename), "rb") as f:
+        update(job, pages_total=len(PyPDF2.PdfReader(f).pages))
+    os.makedirs(os.path.join(job_dir, "app", "data"), exist_ok=True)
+    command = [sys.executable, os.path.abspath(PARSER_SCRIPT), filename]
+    if previous is not None:
+        command.append(os.path.abspath(extracted_path(os.path.join(UPLOAD_DIR, previous["job_id"]))))
+    env = {**os.environ, "PARSER_EMIT_PAGES": "true" if stream_pages else "false"}
+    pages_read = pages_write = None
+    if stream_pages:
+        pages_read, pages_write = os.pipe()
+        env["PARSER_PAGES_FD"] = str(pages_write)
+    try:
+        process = subprocess.Popen(command, cwd=job_dir, env=env, pass_fds=(pages_write,) if stream_pages else (),
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace",
+                                   preexec_fn=_lower_priority if os.name == "posix" else None)
+    finally:
+        if pages_write is not None:
+            os.close(pages_write)
+    output = deque(maxlen=20)
+    progress = None
+    try:
+        if stream_pages:
+            progress = threading.Thread(target=follow_parser, args=(job, process.stdout, output),
+                                        name=f"parser-{job['job_id']}", daemon=True)
+            progress.start()
+            with open(pages_read, errors="replace") as pages:
+                pages_read = None
+                for line in pages:
+                    try:
+                        record = json.loads(line[len(PAGE_RECORD):]) if line.startswith(PAGE_RECORD) else None
+                    except ValueError as e:
+                        record = None
+                        print(f"Error reading a streamed page of upload {job['job_id']}:", str(e))
+                    # a page that is not streamed is still indexed by the reconcile stage
+                    if record is not None:
+                        yield record
+            progress.join()
+        else:
+            follow_parser(job, process.stdout, output)
+        if process.wait() != 0:
+            raise RuntimeError(f"parser exited with status {process.returncode}: {output[-1] if output else ''}")
+        update(job, pages_done=job["pages_total"])
+    finally:
+        # the job failed or stopped reading early
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if progress is not None:
+            progress.join()
+        if pages_read is not None:
+            os.close(pages_read)
+        process.stdout.close()
+
+
+# Page progress from the parser's output lines; the last lines are kept in output for the error message
+def follow_parser(job, stdout, output):
+    pages_done = 0
+    for line in stdout:
+        output.append(line.rstrip())
+        if PAGE_LINE.search(line):
+            update(job, pages_done=pages_done)
+            pages_done += 1
+            continue
+        match = CHANGED_LINE.search(line)
+        if match:
+            pages_done = int(match.group(2)) - int(match.group(1))
+            update(job, pages_changed=int(match.group(1)), pages_reused=pages_done, pages_done=pages_done)
+
+
+def parse_pdf(job, job_dir, filename, previous):
+    for _ in run_parser(job, job_dir, filename, previous):
+        pass
+    return extracted_path(job_dir)
+
+
+# Parser pages to passages, pointing at the stored upload; saved so they are loaded again at startup
+def chunk_passages(job, job_dir, filename, extracted_path):
+    stats = {}
+    passages = load_data(extracted_path, stats)
+    for passage in passages:
+        passage["document_url"] = os.path.join(UPLOAD_DIR, job["job_id"], filename)
+        passage["document_title"] = passage["document_title"] or job["filename"]
+    passages, collapsed = collapse_passages(passages)
+    with open(os.path.join(job_dir, "passages.json"), "w") as f:
+        json.dump(passages, f)
+    update(job, passages=len(passages), passages_boilerplate=stats["boilerplate"], passages_near_duplicate=collapsed)
+    return passages
+
+
+# Only creates: an id that is already indexed belongs to a passage with the same text, possibly from another
+# document, and is left alone until the reconcile stage merges the two
+def passage_action(doc_id, passage, embedding):
+    return {
+        "_op_type": "create",
+        "_index": INDEX_NAME,
+        "_id": doc_id,
+        "_source": {
+            **passage,
+            "embedding": embedding.tolist()
+        }
+    }
+
+
+def embed_actions(job, passages):
+    actions = []
+    for start in range(0, len(passages), ENCODE_WINDOW):
+        window = passages[start:start + ENCODE_WINDOW]
+        ids, embeddings = embed_passages(window)
+        actions.extend(passage_action(doc_id, passage, embedding)
+                       for passage, doc_id, embedding in zip(window, ids, embeddings))
+        update(job, passages_embedded=start + len(window))
+    return actions
+
+
+# Ids of the passages the create actions added; a conflict means the id was already indexed, any other error
+# fails the job
+def create_passages(actions):
+    _, errors = helpers.bulk(es, actions, raise_on_error=False)
+    failed = [error for error in errors if error["create"].get("status") != 409]
+    if failed:
+        raise RuntimeError(f"{len(failed)} passages failed to index: {failed[0]['create'].get('error')}")
+    # the same text twice in one chunk gives one create and one conflict
+    conflicts = Counter(error["create"]["_id"] for error in errors)
+    created = []
+    for action in actions:
+        if conflicts[action["_id"]]:
+            conflicts[action["_id"]] -= 1
+        else:
+            created.append(action["_id"])
+    return created
+
+
+def index_actions(job, actions):
+    start = time.perf_counter()
+    created = []
+    for offset in range(0, len(actions), INDEX_CHUNK_SIZE):
+        chunk = actions[offset:offset + INDEX_CHUNK_SIZE]
+        created.extend(create_passages(chunk))
+        update(job, passages_indexed=offset + len(chunk))
+    es.indices.refresh(index=INDEX_NAME)
+    index_stats["documents"] += len(created)
+    index_stats["seconds"] += time.perf_counter() - start
+    return created
+
+
+# Parse, chunk, embed and index at the same time, each stage in its own thread with bounded queues in between
+# (see elastic/pipeline.py): the passages of a page are searchable moments after the parser is done with it,
+# and the job takes about as long as its slowest stage instead of the sum of all of them. Returns the ids of
+# the passages it created.
+def stream_document(job, job_dir, filename, previous):
+    document_url = os.path.join(UPLOAD_DIR, job["job_id"], filename)
+    streamed = []
+    start = time.perf_counter()
+
+    def chunk(pages):
+        passages = [passage for page in pages for passage in page_passages(page)]
+        for passage in passages:
+            passage["document_url"] = document_url
+            passage["document_title"] = passage["document_title"] or job["filename"]
+        update(job, passages_streamed=job["passages_streamed"] + len(passages))
+        return passages
+
+    def embed(passages):
+        ids, embeddings = embed_passages(passages)
+        update(job, passages_embedded=job["passages_embedded"] + len(passages))
+        return [passage_action(doc_id, passage, embedding)
+                for passage, doc_id, embedding in zip(passages, ids, embeddings)]
+
+    def index(actions):
+        index_start = time.perf_counter()
+        created = create_passages(actions)
+        es.indices.refresh(index=INDEX_NAME)
+        index_stats["documents"] += len(created)
+        index_stats["seconds"] += time.perf_counter() - index_start
+        streamed.extend(created)
+        update(job, passages_indexed=job["passages_indexed"] + len(actions))
+        if job["first_searchable_seconds"] is None:
+            update(job, first_searchable_seconds=round(time.perf_counter() - start, 3))
+
+    pipeline = Pipeline(run_parser(job, job_dir, filename, previous, stream_pages=True), [
+        Stage("chunk", chunk, CHUNK_BATCH_PAGES),
+        Stage("embed", embed, ENCODE_WINDOW),
+        Stage("index", index, INDEX_CHUNK_SIZE),
+    ])
+    try:
+        pipeline.run()
+    finally:
+        update(job, pipeline=pipeline.summary())
+    return streamed
+
+
+# Boilerplate and near-duplicates are only known once every page is parsed, and passages whose text another
+# document already had were not written. Both are brought in line with every current document: created passages
+# the final ones leave out are deleted, and passages the upload shares with other documents cite all of them.
+# Their embeddings are cached.
+def reconcile_passages(job, created, passages, previous):
+    ids = set(created) | {passage_id(passage["text"]) for passage in passages}
+    written, deleted = sync_passages(ids, current_passages(job, passages, previous))
+    update(job, passages_embedded=len(passages), passages_indexed=len(passages))
+    print(f"Upload {job['job_id']}: {len(deleted)} created passages removed, {len(written)} rewritten.")
+
+
+# Passages of every current document, with this upload in place of the revision it replaces
+def current_passages(job, passages, previous):
+    skip = {job["job_id"]} | ({previous["job_id"]} if previous is not None else set())
+    return load_data(BUNDLED_DATA) + load_uploaded_passages(skip) + passages
+
+
+# Remove the passages of the previous revision that the new one no longer has. Ids are text hashes, so the
+# previous revision's ids are compared with every current document: a passage another document (or this
+# upload) still has keeps its document, now citing the documents that have it, only the others are deleted.
+def retire_revision(job, previous, passages):
+    previous_dir = os.path.join(UPLOAD_DIR, previous["job_id"])
+    path = os.path.join(previous_dir, "passages.json")
+    with open(path) as f:
+        old_passages = json.load(f)
+    _, retired = sync_passages({passage_id(passage["text"]) for passage in old_passages},
+                               current_passages(job, passages, previous))
+    update(job, passages_retired=len(retired))
+    # the old revision is no longer loaded at startup
+    os.replace(path, os.path.join(previous_dir, "passages.superseded.json"))
+    save_job_record({**previous, "status": "superseded"}, previous_dir)
+
+
+# A failed job leaves no documents behind: every passage that cites the upload (streamed before the failure,
+# or merged into a passage another document has) is brought back to what the current documents have, which
+# deletes the ones only this upload had. The previous revision's passages are synced too, in case the retire
+# was cut short.
+def discard_upload(job, filename, previous):
+    ids = document_passage_ids(os.path.join(UPLOAD_DIR, job["job_id"], filename))
+    if previous is not None:
+        path = os.path.join(UPLOAD_DIR, previous["job_id"], "passages.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                ids |= {passage_id(passage["text"]) for passage in json.load(f)}
+    written, deleted = sync_passages(ids, load_data(BUNDLED_DATA) + load_uploaded_passages({job["job_id"]}))
+    print(f"Upload {job['job_id']} discarded: {len(deleted)} passages removed, {len(written)} restored.")
+
+
+def run_job(job, job_dir, filename):
+    previous = None
+    try:
+        update(job, status="running")
+        previous = previous_revision(job["document"], job["job_id"])
+        if previous is not None:
+            update(job, previous_job_id=previous["job_id"])
+        try:
+            if STREAMING_INGEST:
+                with job_stage(job, "stream"):
+                    streamed = stream_document(job, job_dir, filename, previous)
+                with job_stage(job, "chunk"):
+                    passages = chunk_passages(job, job_dir, filename, extracted_path(job_dir))
+                with job_stage(job, "reconcile"):
+                    reconcile_passages(job, streamed, passages, previous)
+            else:
+                with job_stage(job, "parse"):
+                    extracted = parse_pdf(job, job_dir, filename, previous)
+                with job_stage(job, "chunk"):
+                    passages = chunk_passages(job, job_dir, filename, extracted)
+                with job_stage(job, "embed"):
+                    actions = embed_actions(job, passages)
+                with job_stage(job, "index"):
+                    created = index_actions(job, actions)
+                with job_stage(job, "reconcile"):
+                    reconcile_passages(job, created, passages, previous)
+        finally:
+            embedding_cache.flush()
+        if previous is not None:
+            with job_stage(job, "retire"):
+                retire_revision(job, previous, passages)
+        update(job, status="done", finished=time.time())
+        print(f"Upload {job['job_id']} ({job['filename']}) indexed: {len(passages)} passages, "
+              f"{job['pages_reused']} unchanged pages reused, {job['passages_retired']} passages retired.")
+    except Exception as e:
+        print(f"Error ingesting upload {job['job_id']}:", str(e))
+        update(job, status="failed", error=str(e), finished=time.time())
+        try:
+            discard_upload(job, filename, previous)
+        except Exception as cleanup_error:
+            print(f"Error discarding upload {job['job_id']}:", str(cleanup_error))
+    finally:
+        save_job_record(job, job_dir)
+        _slots.release()
+
+
+# Store a PDF and queue it for parsing and indexing. The body is either the raw PDF (with ?filename=...)
+# or a multipart form with a "file" part. An upload with the same document name (?document=..., the file
+# name by default) as an earlier one is a new revision of it. Answers 202 with the job id right away.
+@ingest.route('/api/upload', methods=["POST"])
+def upload_pdf():
+    if not _slots.acquire(blocking=False):
+        response = jsonify({"error": "too many uploads in progress, try again later"})
+        response.headers["Retry-After"] = "60"
+        return response, 503
+    try:
+        upload = request.files.get("file") if request.mimetype == "multipart/form-data" else None
+        original = (upload.filename if upload else None) or request.args.get("filename") or "upload.pdf"
+        filename = secure_filename(original) or "upload.pdf"
+        document = (request.form.get("document") if upload else None) or request.args.get("document") or original
+        job = new_job(original, document)
+        job_dir = os.path.join(UPLOAD_DIR, job["job_id"])
+        os.makedirs(job_dir)
+        try:
+            update(job, bytes=save_upload(os.path.join(job_dir, filename)))
+        except UploadRejected as e:
+            update(job, status="failed", error=str(e), finished=time.time())
+            shutil.rmtree(job_dir, ignore_errors=True)
+            _slots.release()
+            return jsonify({"job_id": job["job_id"], "error": str(e)}), 400
+        save_job_record(job, job_dir)
+        _executor.submit(run_job, job, job_dir, filename)
+    except Exception as e:
+        print("Error receiving upload:", str(e))
+        _slots.release()
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"job_id": job["job_id"], "status_url": f"/api/upload/{job['job_id']}"}), 202
+
+
+@ingest.route('/api/upload/<job_id>', methods=["GET"])
+def upload_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "unknown job"}), 404
+        return jsonify({**job, "stage_seconds": dict(job["stage_seconds"])})
+
+
+@ingest.route('/api/upload', methods=["GET"])
+def upload_jobs():
+    with _jobs_lock:
+        return jsonify([{**job, "stage_seconds": dict(job["stage_seconds"])} for job in reversed(_jobs.values())])
+
+
+Callback("ingest_jobs", "Upload jobs by status.", "gauge",
+         lambda: [({"status": status}, sum(job["status"] == status for job in list(_jobs.values())))
+                  for status in ("queued", "running", "done", "failed")])
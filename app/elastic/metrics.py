@@ -0,0 +1,152 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from flask import Blueprint, Response
+
+metrics = Blueprint("metrics", __name__)
+
+# Upper bounds in seconds, tuned for a search request of a few hundred milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DRAIN_THRESHOLD = 10000  # pending observations before a request thread folds them in itself
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+# Observations are appended to a deque (atomic in CPython, no lock on the request path) and folded into
+# the totals when /metrics is scraped. A request thread only drains when the backlog is large, and never
+# waits for the lock to do it.
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._pending = deque()
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _record(self, item):
+        self._pending.append(item)
+        if len(self._pending) > DRAIN_THRESHOLD and self._lock.acquire(blocking=False):
+            try:
+                self._drain()
+            finally:
+                self._lock.release()
+
+    def _drain(self):
+        while True:
+            try:
+                self._fold(*self._pending.popleft())
+            except IndexError:
+                return
+
+    def collect(self):
+        with self._lock:
+            self._drain()
+            return self._samples()
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        self._record((tuple(sorted(labels.items())), amount))
+
+    def _fold(self, labels, amount):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        self._record((tuple(sorted(labels.items())), value))
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _fold(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _samples(self):
+        samples = []
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                samples.append((self.name + "_bucket", labels + (("le", str(bound)),), cumulative))
+            samples.append((self.name + "_sum", labels, series[-1]))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+# A value read from somewhere else (ES, the embedding cache, indexing stats) when /metrics is scraped.
+# fn returns a number, or a list of (labels dict, number).
+class Callback:
+    def __init__(self, name, help_text, metric_type, fn):
+        self.name = name
+        self.help = help_text
+        self.type = metric_type
+        self.fn = fn
+        _registry.append(self)
+
+    def collect(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}:", str(e))
+            return []
+        if isinstance(value, list):
+            return [(self.name, tuple(sorted(labels.items())), number) for labels, number in value]
+        return [(self.name, (), value)]
+
+
+# Prometheus text exposition format
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.collect():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+@metrics.route('/metrics')
+def scrape():
+    return Response(render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+# Search path instrumentation shared by the semantic blueprint
+search_stage_seconds = Histogram("search_stage_seconds", "Time spent in each stage of a search request.")
+search_request_seconds = Histogram("search_request_seconds", "Total time of a search request, by the path that served it.")
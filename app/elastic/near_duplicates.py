@@ -0,0 +1,160 @@
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+
+SHINGLE_WORDS = 3  # passages are compared as sets of overlapping 3 word shingles
+NUM_PERMUTATIONS = 64
+BANDS = 8  # LSH bands of NUM_PERMUTATIONS / BANDS rows, pairs above ~0.77 similarity share a band bucket
+SIMILARITY_THRESHOLD = 0.8  # estimated Jaccard similarity from which two passages are the same passage
+HASH_PRIME = (1 << 31) - 1
+SEED = 1
+LOCATION_FIELDS = ("document_url", "document_title", "page_number")
+# Dates may change between copies of a passage, other numbers (torque values, limits, part numbers) may not
+MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+DATE_PATTERN = re.compile(r"\b(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{4}|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{4}|"
+                          rf"\d{{1,2}} {MONTHS},? \d{{4}}|{MONTHS} \d{{1,2}},? \d{{4}}|{MONTHS} \d{{4}})\b")
+
+_rng = np.random.default_rng(SEED)
+_perm_a = _rng.integers(1, HASH_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_perm_b = _rng.integers(0, HASH_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+# Lowercase, rejoin words hyphenated across a line break ("hard- ened") and collapse whitespace
+def normalize_text(text):
+    text = re.sub(r"(\w)-\s+(\w)", r"\1\2", text.lower())
+    return " ".join(text.split())
+
+
+def shingles(text):
+    words = normalize_text(text).split()
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+# Tokens with a digit in them, dates left out: two passages are only the same passage if these match
+def numbers(text):
+    text = DATE_PATTERN.sub(" ", normalize_text(text))
+    return sorted(token.strip(".,;:()[]") for token in text.split() if any(char.isdigit() for char in token))
+
+
+# MinHash signature: per permutation (a * x + b) mod p, the minimum over the shingle hashes x
+def minhash(text):
+    hashes = np.array([zlib.crc32(shingle.encode()) for shingle in shingles(text)], dtype=np.uint64) % HASH_PRIME
+    return ((_perm_a[:, None] * hashes[None, :] + _perm_b[:, None]) % HASH_PRIME).min(axis=1)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent, i, j):
+    root_i, root_j = _find(parent, i), _find(parent, j)
+    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+# Groups of near-duplicate passage indexes (in passage order, singletons included). Every passage is hashed
+# once and only compared to the first passage of each LSH bucket it lands in, so the pass stays linear in
+# the number of passages instead of comparing all pairs. Passages whose numbers differ are never merged.
+def find_near_duplicates(texts):
+    signatures = [minhash(text) for text in texts]
+    text_numbers = [numbers(text) for text in texts]
+    rows = NUM_PERMUTATIONS // BANDS
+    parent = list(range(len(texts)))
+    for band in range(BANDS):
+        first_in_bucket = {}
+        for i, signature in enumerate(signatures):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            j = first_in_bucket.setdefault(key, i)
+            if j == i:
+                continue
+            root_i, root_j = _find(parent, i), _find(parent, j)
+            if root_i != root_j and np.mean(signatures[i] == signatures[j]) >= SIMILARITY_THRESHOLD \
+                    and text_numbers[i] == text_numbers[j]:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+    groups = defaultdict(list)
+    for i in range(len(texts)):
+        groups[_find(parent, i)].append(i)
+    return list(groups.values())
+
+
+def passage_location(passage):
+    location = {field: passage.get(field) for field in LOCATION_FIELDS}
+    location["exact_location"] = passage.get("traceability", {}).get("exact_location", "")
+    return location
+
+
+# Collapse every group of passages to one canonical passage, which keeps the source location of every member in
+# "locations". Passages come oldest document first, and the canonical passage is the first one of the newest
+# document in its group, so a search cites the current revision first. Returns the
+# canonical passages, in order, and the number of passages dropped.
+def collapse_groups(passages, groups):
+    document_order = {}
+    for passage in passages:
+        document_order.setdefault(passage.get("document_url"), len(document_order))
+    canonical = []
+    for group in groups:
+        chosen = min(group, key=lambda i: (-document_order[passages[i].get("document_url")], i))
+        passage = passages[chosen]
+        if len(group) > 1:
+            locations = {}
+            for i in group:
+                # passages collapsed on an earlier load bring the locations they already carry
+                for location in passages[i].get("locations") or [passage_location(passages[i])]:
+                    locations.setdefault(tuple(location.values()), location)
+            passage = {**passage, "locations": list(locations.values())}
+        canonical.append((chosen, passage))
+    canonical.sort(key=lambda item: item[0])
+    return [passage for _, passage in canonical], len(passages) - len(canonical)
+
+
+# Near-duplicates are only looked for within a document (repeated notes, a changed date): a near copy in
+# another manual may differ where it matters, and a search filtered to one manual must show its own text.
+# Identical texts are one passage (one id) whichever documents they are in.
+def near_duplicate_groups(passages):
+    parent = list(range(len(passages)))
+    by_document = defaultdict(list)
+    for i, passage in enumerate(passages):
+        by_document[passage.get("document_url")].append(i)
+    for members in by_document.values():
+        for group in find_near_duplicates([passages[i]["text"] for i in members]):
+            for i in group[1:]:
+                _union(parent, members[group[0]], members[i])
+    for group in exact_duplicate_groups(passages):
+        for i in group[1:]:
+            _union(parent, group[0], i)
+    groups = defaultdict(list)
+    for i in range(len(passages)):
+        groups[_find(parent, i)].append(i)
+    return list(groups.values())
+
+
+def collapse_near_duplicates(passages):
+    return collapse_groups(passages, near_duplicate_groups(passages))
+
+
+# The same text on several pages or in several documents is one indexed passage (its id is the text hash),
+# collapsed like near-duplicates so it cites all of them instead of whichever was written last
+def exact_duplicate_groups(passages):
+    groups = defaultdict(list)
+    for i, passage in enumerate(passages):
+        groups[passage["text"]].append(i)
+    return list(groups.values())
+
+
+def collapse_exact_duplicates(passages):
+    return collapse_groups(passages, exact_duplicate_groups(passages))
+
+
+# Key of a source location, the same for a passage and for the locations of the passage it was collapsed into
+def location_key(location):
+    return tuple(location.get(field) for field in LOCATION_FIELDS + ("exact_location",))
+
+
+# Location keys of a passage: its own, or those of the passages it already stands for
+def passage_location_keys(passage):
+    return {location_key(location) for location in passage.get("locations") or [passage_location(passage)]}
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+PIPELINE_QUEUE_SIZE = 1000  # items (pages, passages, index actions) waiting between two stages
+POLL_SECONDS = 0.1  # how often a blocked stage checks whether another stage failed
+
+_END = object()
+
+
+class PipelineFailed(Exception):
+    pass
+
+
+# One stage of a pipeline: fn receives a batch of up to batch_size items, as many as are waiting (never
+# waiting for a full batch), and returns the items for the next stage
+class Stage:
+    def __init__(self, name, fn, batch_size=1):
+        self.name = name
+        self.fn = fn
+        self.batch_size = batch_size
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0  # inside fn
+        self.blocked_seconds = 0.0  # waiting for room in the next stage's queue (backpressure)
+
+    def summary(self):
+        return {"items_in": self.items_in, "items_out": self.items_out,
+                "busy_seconds": round(self.busy_seconds, 3), "blocked_seconds": round(self.blocked_seconds, 3)}
+
+
+# Run a source generator and a chain of stages concurrently, one thread each, connected by bounded queues.
+# A stage that falls behind fills its input queue and the stages before it wait, so nothing piles up in
+# memory and the whole run takes about as long as its slowest stage. The first error stops every stage and
+# is raised here.
+class Pipeline:
+    def __init__(self, source, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        self.source = source
+        self.source_stage = Stage("source", None)
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.seconds = 0.0
+        self._failed = threading.Event()
+        self._errors = []
+
+    def _put(self, stage, q, item):
+        start = time.perf_counter()
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        stage.blocked_seconds += time.perf_counter() - start
+        if self._failed.is_set():
+            raise PipelineFailed()
+
+    def _get_batch(self, q, batch_size):
+        while True:
+            try:
+                batch = [q.get(timeout=POLL_SECONDS)]
+                break
+            except queue.Empty:
+                if self._failed.is_set():
+                    raise PipelineFailed()
+        while len(batch) < batch_size and batch[-1] is not _END:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _fail(self, stage, error):
+        if not isinstance(error, PipelineFailed):
+            self._errors.append((stage.name, error))
+        self._failed.set()
+
+    def _run_source(self):
+        stage = self.source_stage
+        try:
+            for item in self.source:
+                stage.items_out += 1
+                self._put(stage, self.queues[0], item)
+            self._put(stage, self.queues[0], _END)
+        except BaseException as e:
+            self._fail(stage, e)
+        finally:
+            if hasattr(self.source, "close"):  # lets a generator source clean up (e.g. stop its subprocess)
+                self.source.close()
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        try:
+            while True:
+                batch = self._get_batch(inbox, stage.batch_size)
+                done = batch[-1] is _END
+                if done:
+                    batch.pop()
+                if batch:
+                    stage.items_in += len(batch)
+                    start = time.perf_counter()
+                    results = stage.fn(batch) or []
+                    stage.busy_seconds += time.perf_counter() - start
+                    for item in results:
+                        stage.items_out += 1
+                        if outbox is not None:
+                            self._put(stage, outbox, item)
+                if done:
+                    if outbox is not None:
+                        self._put(stage, outbox, _END)
+                    return
+        except BaseException as e:
+            self._fail(stage, e)
+
+    def run(self):
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, name="pipeline-source", daemon=True)]
+        threads += [threading.Thread(target=self._run_stage, args=(i,), name=f"pipeline-{stage.name}", daemon=True)
+                    for i, stage in enumerate(self.stages)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.seconds = time.perf_counter() - start
+        if self._errors:
+            name, error = self._errors[0]
+            raise RuntimeError(f"{name} stage failed: {error}") from error
+
+    def summary(self):
+        return {"seconds": round(self.seconds, 3),
+                **{stage.name: stage.summary() for stage in [self.source_stage] + self.stages}}
@@ -0,0 +1,167 @@
+import numpy as np
+
+PQ_SUBSPACES = 96  # 768 dims / 96 = 8 dims per sub-vector, 96 bytes per passage
+PQ_CENTROIDS = 256  # one uint8 code per sub-vector
+PQ_TRAIN_SAMPLE = 20000
+PQ_ITERATIONS = 15
+SCORE_CHUNK_ROWS = 65536  # rows de-quantized at a time while scoring, bounds temporary memory
+
+
+# Scale every vector to unit length so a dot product is the same cosine similarity ES computes
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# Scalar quantization: each dimension is mapped linearly from its [min, max] range onto 256 levels
+class Int8Quantizer:
+    kind = "int8"
+
+    def __init__(self, offset=None, scale=None):
+        self.offset = offset
+        self.scale = scale
+
+    def fit(self, vectors):
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = np.maximum((high - low) / 255.0, 1e-12).astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        codes = np.rint((vectors - self.offset) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    # Approximate dot products: q . (codes * scale + offset) = (q * scale) . codes + q . offset
+    def score(self, query, codes):
+        weighted = query * self.scale
+        bias = float(query @ self.offset)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_CHUNK_ROWS] = chunk @ weighted + bias
+        return scores
+
+    def state(self):
+        return {"offset": self.offset, "scale": self.scale}
+
+
+# Product quantization: the vector is split into sub-vectors and each is replaced by its nearest k-means centroid
+class ProductQuantizer:
+    kind = "pq"
+
+    def __init__(self, centroids=None, subspaces=PQ_SUBSPACES):
+        self.centroids = centroids  # (subspaces, centroids, sub_dims)
+        self.subspaces = subspaces if centroids is None else centroids.shape[0]
+
+    def fit(self, vectors, seed=0):
+        rng = np.random.default_rng(seed)
+        if len(vectors) > PQ_TRAIN_SAMPLE:
+            vectors = vectors[np.sort(rng.choice(len(vectors), PQ_TRAIN_SAMPLE, replace=False))]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        sub_dims = vectors.shape[1] // self.subspaces
+        centroid_count = min(PQ_CENTROIDS, len(vectors))
+        self.centroids = np.zeros((self.subspaces, centroid_count, sub_dims), dtype=np.float32)
+        for j in range(self.subspaces):
+            part = vectors[:, j * sub_dims:(j + 1) * sub_dims]
+            self.centroids[j] = _kmeans(part, centroid_count, rng)
+        return self
+
+    def encode(self, vectors):
+        sub_dims = self.centroids.shape[2]
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            part = vectors[:, j * sub_dims:(j + 1) * sub_dims]
+            codes[:, j] = _nearest(part, self.centroids[j])
+        return codes
+
+    # Asymmetric distance computation: one lookup table per query, then a gather-and-sum per passage
+    def score(self, query, codes):
+        sub_dims = self.centroids.shape[2]
+        table = np.einsum("jkd,jd->jk", self.centroids, query.reshape(self.subspaces, sub_dims))
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.subspaces):
+            scores += table[j][codes[:, j]]
+        return scores
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+
+def _nearest(points, centroids):
+    distances = (centroids ** 2).sum(axis=1) - 2.0 * points @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def _kmeans(points, count, rng):
+    centroids = points[rng.choice(len(points), count, replace=False)].copy()
+    for _ in range(PQ_ITERATIONS):
+        assignment = _nearest(points, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        counts = np.bincount(assignment, minlength=count)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+QUANTIZERS = {"int8": Int8Quantizer, "pq": ProductQuantizer}
+
+
+# Compressed copy of the embedding cache used for first-stage search. Rows line up with the
+# EmbeddingCache rows, so the top candidates can be rescored against the full-precision vectors.
+class QuantizedIndex:
+    def __init__(self, quantizer, ids, codes):
+        self.quantizer = quantizer
+        self.ids = list(ids)
+        self.codes = codes
+
+    @classmethod
+    def build(cls, kind, ids, vectors):
+        vectors = normalize(vectors)
+        quantizer = QUANTIZERS[kind]().fit(vectors)
+        return cls(quantizer, ids, quantizer.encode(vectors))
+
+    # Encode rows appended to the cache since the index was built, reusing the trained quantizer
+    def add(self, ids, vectors):
+        if len(ids):
+            self.ids.extend(ids)
+            self.codes = np.concatenate([self.codes, self.quantizer.encode(normalize(vectors))])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        return self.codes.nbytes
+
+    # Returns [(doc_id, score)] with the score on the same cosine + 1.0 scale as the ES script.
+    # With full_vectors the top rescore_depth candidates are re-ranked at full precision.
+    def search(self, query, k, rescore_depth=100, full_vectors=None, mask=None):
+        query = normalize(query)
+        scores = self.quantizer.score(query, self.codes)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        depth = min(max(k, rescore_depth if full_vectors is not None else k), len(scores))
+        if depth == 0:
+            return []
+        rows = np.argpartition(-scores, depth - 1)[:depth]
+        rows = rows[np.isfinite(scores[rows])]
+        if full_vectors is not None:
+            rows = np.sort(rows)  # sequential reads from the memory map
+            scores_rows = normalize(full_vectors[rows]) @ query
+        else:
+            scores_rows = scores[rows]
+        order = np.argsort(-scores_rows)[:k]
+        return [(self.ids[rows[i]], float(scores_rows[i]) + 1.0) for i in order]
+
+    def save(self, path):
+        np.savez(path, kind=self.quantizer.kind, ids=np.array(self.ids), codes=self.codes, **self.quantizer.state())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            kind = str(data["kind"])
+            state = {name: data[name] for name in data.files if name not in ("kind", "ids", "codes")}
+            return cls(QUANTIZERS[kind](**state), data["ids"].tolist(), data["codes"])
@@ -0,0 +1,81 @@
+import json
+import os
+import queue
+import threading
+import time
+
+QUERY_LOG_QUEUE = 10000  # records waiting for the writer thread, newer records are dropped beyond this
+QUERY_LOG_FLUSH_SECONDS = 1.0  # the writer flushes at least this often while records keep coming in
+QUERY_LOG_MAX_BYTES = 100 * 2 ** 20  # the file is rolled over to <path>.1 past this size
+
+
+# Append-only JSON lines log written by a background thread. log() only puts the record on a bounded
+# queue and never waits: when the writer falls behind the record is dropped and counted, the request
+# that produced it is never slowed down.
+class QueryLog:
+    def __init__(self, path, max_queue=QUERY_LOG_QUEUE, max_bytes=QUERY_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def log(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _rollover(self):
+        self._file.close()
+        os.replace(self.path, self.path + ".1")
+        self._open()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + QUERY_LOG_FLUSH_SECONDS
+            # take whatever else is already queued, up to the flush interval, and write it in one go
+            while time.monotonic() < deadline:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self._file is None:
+                    self._open()
+                self._file.write("".join(json.dumps(record) + "\n" for record in batch))
+                self._file.flush()
+                self.written += len(batch)
+                if self._file.tell() > self.max_bytes:
+                    self._rollover()
+            except Exception as e:
+                self.dropped += len(batch)
+                print("Error writing query log:", str(e))
+            for _ in batch:
+                self._queue.task_done()
+
+    # Block until the queued records are on disk
+    def drain(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+# Read a query log back, skipping a line cut short by a crash
+def read_query_log(path):
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
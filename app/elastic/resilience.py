@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+STAGE_WORKERS = 16  # threads running encoder calls that are abandoned once their deadline passes
+
+_stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="search-stage")
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+# Wall clock budget of one request, shared by all its stages
+class Deadline:
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    # Time left for a stage, capped by the stage's own limit. Raises when nothing is left.
+    def stage_timeout(self, stage_limit):
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise BudgetExceeded("search latency budget exhausted")
+        return min(remaining, stage_limit)
+
+
+# Closed: calls go through. After failure_threshold consecutive failures it opens and rejects calls
+# immediately for reset_seconds, then lets a single trial call through (half open) to decide whether to close.
+# is_failure decides which exceptions count as failures, by default all of them.
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_seconds=30, is_failure=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.is_failure = is_failure or (lambda error: True)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"Circuit breaker {self.name} opened after {self.failures} failures.")
+                self.opened_at = time.monotonic()
+
+    def record_ignored(self):
+        with self._lock:
+            self._trial_running = False
+
+    # Run fn through the breaker: rejected while open, failures (including timeouts) are counted. Other
+    # exceptions are raised without counting either way.
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpen(f"circuit breaker {self.name} is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                self.record_ignored()
+            raise
+        self.record_success()
+        return result
+
+
+# Run a blocking call on the stage pool and stop waiting for it after timeout seconds
+def call_with_timeout(timeout, fn, *args, **kwargs):
+    future = _stage_executor.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise BudgetExceeded(f"{getattr(fn, '__name__', 'call')} exceeded {timeout * 1000:.0f} ms")
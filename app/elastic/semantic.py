@@ -1,40 +1,93 @@
 import json
+import glob
 import hashlib
+import os
 import sys
-from bert_serving.client import BertClient
-from elasticsearch import Elasticsearch, helpers
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from elasticsearch import Elasticsearch, TransportError, helpers
+from elasticsearch import ConnectionError as ElasticConnectionError
 from flask import Blueprint, request, jsonify
-from time import sleep
+from elastic.embedding_cache import EmbeddingCache
+from elastic.encoders import create_encoder, encode_bucketed, ENCODER_BACKEND, ENCODE_BATCH_SIZE, LENGTH_BUCKETING
+from elastic.quantization import QuantizedIndex
+from elastic.bulk_ingest import bulk_load, BULK_CHUNK_SIZE, BULK_THREADS
+from elastic.filters import METADATA_MAPPING, CITATION_FIELDS, RowMetadata, filter_error, filtered_query, parse_page_number
+from elastic.resilience import BudgetExceeded, CircuitBreaker, Deadline, call_with_timeout
+from elastic.metrics import Callback, search_stage_seconds, search_request_seconds
+from elastic.query_log import QueryLog
+from elastic.boilerplate import find_boilerplate
+from elastic.near_duplicates import (collapse_groups, near_duplicate_groups, exact_duplicate_groups, location_key,
+                                     passage_location_keys)
 
 semantic = Blueprint("semantic", __name__)
 
-max_retries = 5
-wait_seconds = 5
+# Initialize the encoder, the bert container by default or the in-process CPU model with ENCODER_BACKEND=cpu
+try:
+    encoder = create_encoder(ENCODER_BACKEND)
+except Exception as e:
+    print(f"Could not initialize the {ENCODER_BACKEND} encoder: {e}")
+    sys.exit(1)
 
-#retry initializing bert client because it doesnt auto retry and will hang
-for attempt in range(max_retries):
-    try:
-        # Attempt to connect to the BERT server
-        bc = BertClient(check_length=False, ip="bert", timeout=2000, port=5555, port_out=5556)
-        print("Connected to BERT server.")
-        break
-    except Exception as e:
-        print(f"Connection attempt {attempt + 1}/{max_retries} failed: {e}")
-        if attempt < max_retries - 1:
-            print(f"Retrying in {wait_seconds} seconds...")
-            sleep(wait_seconds)
-        else:
-            print("Could not connect to the BERT server after several retries.")
-            sys.exit(1)
+ES_TIMEOUT = 10  # seconds, default for indexing and admin calls, searches pass their own deadline
 
 # Initialize Elasticsearch client
 try:
-    es = Elasticsearch(hosts=["http://elasticsearch:9200"])
+    es = Elasticsearch(hosts=["http://elasticsearch:9200"], timeout=ES_TIMEOUT)
     print("Elasticsearch client initialized successfully.")
 except Exception as e:
     print("Error initializing Elasticsearch client:", str(e))
 
 INDEX_NAME = "semantic_search"
+EMBEDDING_CACHE_DIR = "./data/embedding_cache"
+BUNDLED_DATA = "./data/extracted_data.json"  # parser output of the manuals shipped with the image
+UPLOAD_DIR = "./data/uploads"  # one directory per upload job, see elastic/ingest.py
+VECTOR_STORAGE = os.environ.get("VECTOR_STORAGE", "float")  # "float" searches ES directly, "int8" or "pq" search a quantized copy
+RESCORE_DEPTH = 100  # quantized candidates re-ranked with the full precision vectors
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "vector")  # "vector" scores every passage, "hybrid" rescores BM25 candidates
+HYBRID_CANDIDATES = 300  # BM25 hits per shard that get cosine rescoring in hybrid mode
+HYBRID_VECTOR_WEIGHT = 0.8  # final score = (1 - weight) * BM25 + weight * (cosine + 1)
+SEARCH_BUDGET_MS = int(os.environ.get("SEARCH_BUDGET_MS", "1500"))  # whole semantic path of one search request
+ENCODE_TIMEOUT_MS = 500  # stage limits inside that budget
+VECTOR_TIMEOUT_MS = 1000
+LEXICAL_TIMEOUT_MS = 1000  # the BM25 fallback always gets this much, even after the budget is spent
+ENCODE_WINDOW = 1024  # passages embedded together while streaming actions to the bulk loader
+MGET_CHUNK_SIZE = 1000  # ids fetched per mget when comparing indexed documents with the passages
+BULK_INGEST = os.environ.get("BULK_INGEST", "false").lower() == "true"  # stream the whole corpus through bulk_load
+QUERY_LOG = os.environ.get("QUERY_LOG", "true").lower() == "true"  # record every search for offline replay
+QUERY_LOG_PATH = os.environ.get("QUERY_LOG_PATH", "./logs/queries.jsonl")
+STRIP_BOILERPLATE = os.environ.get("STRIP_BOILERPLATE", "true").lower() == "true"  # drop running headers, footers and notices
+NEAR_DUPLICATES = os.environ.get("NEAR_DUPLICATES", "true").lower() == "true"  # index one passage per group of near-duplicates
+BATCH_MAX_QUERIES = 64  # queries one /api/elastic_search/batch request may carry
+BATCH_MS_PER_QUERY = int(os.environ.get("BATCH_MS_PER_QUERY", "100"))  # added to the budget and stage limits per batch query
+
+# Embeddings are kept on disk by document hash so reindexing never has to call BERT twice for the same text
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR)
+quantized_index = None
+row_metadata = None
+passages_by_id = {}  # metadata of every indexed passage, for the row filters of the quantized index
+quantized_refresh_lock = threading.Lock()
+encode_stats = {"passages": 0, "seconds": 0.0}
+index_stats = {"documents": 0, "seconds": 0.0}
+
+# Only an unreachable, overloaded or slow dependency counts against a breaker, not an error the request caused
+def is_outage(error):
+    if isinstance(error, (BudgetExceeded, TimeoutError, ConnectionError, ElasticConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+# Repeated encoder or vector query failures stop sending traffic there for a while, searches go straight to BM25
+encoder_breaker = CircuitBreaker("encoder", is_failure=is_outage)
+vector_breaker = CircuitBreaker("vector-search", is_failure=is_outage)
+# Batches keep their own, so a slow batch never sends interactive searches to BM25
+batch_encoder_breaker = CircuitBreaker("batch-encoder", is_failure=is_outage)
+batch_vector_breaker = CircuitBreaker("batch-vector-search", is_failure=is_outage)
+
+# Query, results and stage timings of every search, written off the request thread (see benchmarks/replay_queries.py)
+query_log = QueryLog(QUERY_LOG_PATH) if QUERY_LOG else None
 
 
 # Ensure the index exists
@@ -43,90 +96,707 @@ try:
         es.indices.create(index=INDEX_NAME, body={
             "mappings": {
                 "properties": {
+                    "text": {
+                        "type": "text"  # analyzed for the BM25 stage of hybrid search
+                    },
                     "embedding": {
                         "type": "dense_vector",
                         "dims": 768  # Assuming BERT base model
-                    }
+                    },
+                    **METADATA_MAPPING
                 }
             }
         })
+    else:
+        # Older indexes were created without the metadata fields, new fields can be added in place
+        es.indices.put_mapping(index=INDEX_NAME, body={"properties": METADATA_MAPPING})
     print("Index created/exists successfully.")
 except Exception as e:
     print("Error creating index:", str(e))
 
-def load_data(filepath):
+# Create a hash of the text content to recognize if it was previously indexed
+def passage_id(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# Passages of one parser page, leaving out the subheaders in skip
+def page_passages(item, skip=()):
+    passages = []
+    #funky custom data scraper from json to pull all dictionary elements listed under "subheader"
+    subheaders = item.get("subheader", {})
+    #page level metadata travels with every passage so searches can filter and cite pages
+    traceability = item.get("traceability", {})
+    for subheader_title, subheader_content in subheaders.items():
+        if subheader_title in skip:
+            continue
+        if isinstance(subheader_content, str) and subheader_content.strip():
+            passages.append({
+                "text": subheader_content,
+                "document_url": item.get("document_url", ""),
+                "document_title": item.get("document_title", ""),
+                "page_number": parse_page_number(item.get("page_number")),
+                "traceability": {
+                    "source": traceability.get("source", ""),
+                    "manual_reference": traceability.get("manual_reference", ""),
+                    "exact_location": traceability.get("exact_location", "")
+                }
+            })
+    return passages
+
+# stats, if given, receives the number of passages and of boilerplate passages left out
+def load_data(filepath, stats=None):
     with open(filepath, 'r') as file:
         data = json.load(file)
-        texts = []
-        #funky custom data scraper from json to pull all dictionary elements listed under "subheader"
-        for item in data:
-            subheaders = item.get("subheader", {})
-            for subheader_title, subheader_content in subheaders.items():
-                if isinstance(subheader_content, str) and subheader_content.strip():
-                    texts.append(subheader_content)
-        return texts
-
-def index_data(data):
+        passages = []
+        #blocks repeated across the pages of a document (running headers, footers, notices) are not worth indexing
+        boilerplate = find_boilerplate(data) if STRIP_BOILERPLATE else set()
+        skip = defaultdict(set)
+        for page_index, subheader in boilerplate:
+            skip[page_index].add(subheader)
+        for page_index, item in enumerate(data):
+            passages.extend(page_passages(item, skip.get(page_index, ())))
+        if boilerplate:
+            print(f"Stripped {len(boilerplate)} boilerplate passages from {filepath}, {len(passages)} left.")
+        if stats is not None:
+            stats["passages"] = len(passages)
+            stats["boilerplate"] = len(boilerplate)
+        return passages
+
+# One canonical passage per group of near-duplicates (whitespace, hyphenation or a changed date apart),
+# carrying the source location of every member, so each group costs one encode call and one index slot.
+# Identical texts are always collapsed, they share one document id.
+def collapse_passages(passages, groups=None):
+    if groups is None:
+        groups = passage_groups(passages)
+    if not NEAR_DUPLICATES:
+        return collapse_groups(passages, groups)
+    start = time.perf_counter()
+    canonical, collapsed = collapse_groups(passages, groups)
+    if collapsed:
+        print(f"Collapsed {collapsed} near-duplicate passages into {len(canonical)} "
+              f"({time.perf_counter() - start:.1f}s).")
+    return canonical, collapsed
+
+# Groups of passage indexes that are indexed as one passage: near-duplicates, or only identical texts with
+# NEAR_DUPLICATES=false
+def passage_groups(passages):
+    return near_duplicate_groups(passages) if NEAR_DUPLICATES else exact_duplicate_groups(passages)
+
+# Ids and embeddings of the passages, in order. Cached vectors are reused and the rest are encoded
+# together, batched by token length
+def embed_passages(passages):
+    ids = [passage_id(passage["text"]) for passage in passages]
+    embeddings = [embedding_cache.get(doc_id) for doc_id in ids]
+    missing = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(ids[i], []).append(i)
+    if missing:
+        start = time.perf_counter()
+        vectors = encode_bucketed(encoder, [passages[rows[0]]["text"] for rows in missing.values()],
+                                  ENCODE_BATCH_SIZE, LENGTH_BUCKETING)
+        encode_stats["seconds"] += time.perf_counter() - start
+        encode_stats["passages"] += len(missing)
+        for (doc_id, rows), vector in zip(missing.items(), vectors):
+            embedding_cache.put(doc_id, vector)
+            for i in rows:
+                embeddings[i] = vector
+    return ids, embeddings
+
+def print_encode_stats():
+    print(f"Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} misses.")
+    if encode_stats["passages"]:
+        rate = encode_stats["passages"] / max(encode_stats["seconds"], 1e-9)
+        print(f"Encoded {encode_stats['passages']} passages in {encode_stats['seconds']:.1f}s "
+              f"({rate:.1f} passages/sec, length bucketing {'on' if LENGTH_BUCKETING else 'off'}).")
+
+# Every passage as an index action, embedding from the cache or BERT. Documents are keyed by content hash,
+# so writing an existing one again is a no-op overwrite and no es.exists round-trip is needed.
+def generate_actions(data):
+    for start in range(0, len(data), ENCODE_WINDOW):
+        window = data[start:start + ENCODE_WINDOW]
+        ids, embeddings = embed_passages(window)
+        for passage, doc_id, embedding in zip(window, ids, embeddings):
+            yield {
+                "_index": INDEX_NAME,
+                "_id": doc_id,
+                "_source": {
+                    **passage,
+                    "embedding": embedding.tolist()
+                }
+            }
+
+# High throughput load for full (re)indexing: actions are streamed to parallel bulk writers with refresh
+# and replicas switched off until the load is done
+def bulk_index_data(data, chunk_size=BULK_CHUNK_SIZE, threads=BULK_THREADS, prune=False):
     try:
+        stats = bulk_load(es, INDEX_NAME, generate_actions(data), chunk_size=chunk_size, threads=threads)
+        index_stats["documents"] += stats.docs
+        index_stats["seconds"] += stats.seconds
+        print_encode_stats()
+        if prune:
+            prune_index({passage_id(passage["text"]) for passage in data}, indexed_metadata())
+        return stats
+    except Exception as e:
+        print("Error bulk indexing data:", str(e))
+    finally:
+        embedding_cache.flush()
+
+# Metadata fields of a passage as they are stored, to compare what is indexed with what should be
+def passage_metadata(passage):
+    metadata = {field: passage.get(field) for field in METADATA_MAPPING}
+    metadata["locations"] = metadata["locations"] or []
+    return metadata
+
+# Metadata of the indexed passages (all of them, or those of the given ids), by id, without their embeddings
+def indexed_metadata(ids=None):
+    if ids is None:
+        return {hit["_id"]: hit["_source"] for hit in helpers.scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}},
+                                                                    _source_includes=list(METADATA_MAPPING))}
+    ids = list(ids)
+    metadata = {}
+    for start in range(0, len(ids), MGET_CHUNK_SIZE):
+        response = es.mget(index=INDEX_NAME, body={"ids": ids[start:start + MGET_CHUNK_SIZE]},
+                           _source_includes=list(METADATA_MAPPING))
+        metadata.update((doc["_id"], doc["_source"]) for doc in response["docs"] if doc.get("found"))
+    return metadata
+
+# Delete the indexed passages that are not in keep (the ids of every current passage): boilerplate stripped or
+# near-duplicates collapsed since they were indexed, leftovers of retired or failed uploads
+def prune_index(keep, indexed):
+    stale = [doc_id for doc_id in indexed if doc_id not in keep]
+    if stale:
+        helpers.bulk(es, ({"_op_type": "delete", "_index": INDEX_NAME, "_id": doc_id} for doc_id in stale))
+        es.indices.refresh(index=INDEX_NAME)
+        print(f"Removed {len(stale)} indexed passages that no current document has.")
+    return stale
+
+# With prune, passages that are indexed but not in data are deleted
+def index_data(data, prune=False):
+    try:
+        # One scan of what is indexed replaces an es.exists call per passage
+        indexed = indexed_metadata()
+        if prune:
+            prune_index({passage_id(passage["text"]) for passage in data}, indexed)
+        new_passages = [passage for passage in data if passage_id(passage["text"]) not in indexed]
+        # Passages indexed before a metadata field existed (or with other locations) only get their metadata
+        # rewritten, their embeddings stay as they are
+        updates = []
+        for passage in data:
+            doc_id = passage_id(passage["text"])
+            if doc_id in indexed and passage_metadata(indexed[doc_id]) != passage_metadata(passage):
+                updates.append({"_op_type": "update", "_index": INDEX_NAME, "_id": doc_id,
+                                "doc": passage_metadata(passage)})
+        # Generate embeddings only for documents that do not exist and were never encoded before
+        ids, embeddings = embed_passages(new_passages)
         actions = []
-        for text in data:
-            # Create a hash of the text content to recognize if it was previously indexed
-            doc_id = hashlib.sha256(text.encode()).hexdigest()
-            # Check if the document already exists by cross referencing with hash
-            if not es.exists(index=INDEX_NAME, id=doc_id):
-                # Generate embedding only if the document does not exist
-                embedding = bc.encode([text])[0].tolist()
-                action = {
-                    "_index": INDEX_NAME,
-                    "_id": doc_id,  # Set the document ID
-                    "_source": {
-                        "text": text,
-                        "embedding": embedding
-                    }
+        for passage, doc_id, embedding in zip(new_passages, ids, embeddings):
+            action = {
+                "_index": INDEX_NAME,
+                "_id": doc_id,  # Set the document ID
+                "_source": {
+                    **passage,
+                    "embedding": embedding.tolist()
                 }
-                actions.append(action)
-        if actions:
+            }
+            actions.append(action)
+        print_encode_stats()
+        if actions or updates:
             #helps to bulk process actions that are stored in the actions "queue"
-            helpers.bulk(es, actions)
+            start = time.perf_counter()
+            helpers.bulk(es, actions + updates)
             es.indices.refresh(index=INDEX_NAME)
-            print("Data indexed/updated successfully.")
+            index_stats["documents"] += len(actions) + len(updates)
+            index_stats["seconds"] += time.perf_counter() - start
+            print(f"Data indexed/updated successfully: {len(actions)} new passages, metadata of {len(updates)} updated.")
         else:
             print("No data to index or data already indexed.")
     except Exception as e:
         print("Error indexing data:", str(e))
+    finally:
+        # Persist whatever was encoded, even if indexing failed part way through
+        embedding_cache.flush()
+
+# Bring the documents of the given ids in line with passages, the passages of every current document, collapsed
+# as at startup so an upload leaves the index as a restart would. Ids are text hashes, so a passage one upload
+# drops may still be in another document: ids some document has are (re)written with the locations they have
+# now, only the others are deleted. Every passage of a near-duplicate group the ids are in, or were in (their
+# indexed locations), is synced too: a group's canonical passage changes when a member comes or goes. The
+# quantized search gets the current metadata of every id, written or not. Returns (written, deleted).
+def sync_passages(ids, passages):
+    groups = passage_groups(passages)
+    current = {passage_id(passage["text"]): passage for passage in collapse_passages(passages, groups)[0]}
+    ids = set(ids)
+    indexed = indexed_metadata(sorted(ids))
+    locations = {location_key(location) for metadata in indexed.values() for location in metadata.get("locations") or []}
+    for group in groups:
+        members = {passage_id(passages[i]["text"]) for i in group}
+        if members & ids or any(passage_location_keys(passages[i]) & locations for i in group):
+            ids |= members
+    ids = sorted(ids)
+    indexed = {**indexed, **indexed_metadata([doc_id for doc_id in ids if doc_id not in indexed])}
+    written = [current[doc_id] for doc_id in ids if doc_id in current and
+               (doc_id not in indexed or passage_metadata(indexed[doc_id]) != passage_metadata(current[doc_id]))]
+    deleted = [doc_id for doc_id in ids if doc_id not in current and doc_id in indexed]
+    actions = [{"_op_type": "delete", "_index": INDEX_NAME, "_id": doc_id} for doc_id in deleted]
+    new_passages = [passage for passage in written if passage_id(passage["text"]) not in indexed]
+    for passage in written:
+        if passage_id(passage["text"]) in indexed:
+            actions.append({"_op_type": "update", "_index": INDEX_NAME, "_id": passage_id(passage["text"]),
+                            "doc": passage_metadata(passage)})
+    # embeddings come from the cache, every current passage was encoded when its document was indexed
+    ids_new, embeddings = embed_passages(new_passages)
+    embedding_cache.flush()
+    actions.extend({"_index": INDEX_NAME, "_id": doc_id, "_source": {**passage, "embedding": embedding.tolist()}}
+                   for passage, doc_id, embedding in zip(new_passages, ids_new, embeddings))
+    if actions:
+        start = time.perf_counter()
+        helpers.bulk(es, actions)
+        es.indices.refresh(index=INDEX_NAME)
+        index_stats["documents"] += len(actions)
+        index_stats["seconds"] += time.perf_counter() - start
+    refresh_quantized_index([current[doc_id] for doc_id in ids if doc_id in current], deleted)
+    return written, deleted
+
+# Build (or bring up to date) the quantized copy of the embedding cache used when VECTOR_STORAGE is int8 or pq
+def load_quantized_index(kind):
+    try:
+        ids = embedding_cache.ids()
+        if not ids:
+            print("No embeddings to quantize.")
+            return None
+        path = os.path.join(EMBEDDING_CACHE_DIR, f"quantized_{kind}.npz")
+        index = None
+        if os.path.exists(path):
+            index = QuantizedIndex.load(path)
+            # The cache is append-only, so a saved index stays valid for the rows it already covers
+            if index.ids == ids[:len(index)]:
+                index.add(ids[len(index):], embedding_cache.vectors()[len(index):])
+            else:
+                index = None
+        if index is None:
+            index = QuantizedIndex.build(kind, ids, embedding_cache.vectors())
+        index.save(path)
+        print(f"Quantized index ({kind}) ready: {len(index)} vectors, {index.nbytes()} bytes.")
+        return index
+    except Exception as e:
+        print("Error building quantized index:", str(e))
+        return None
+
+# Extend the quantized index and its row metadata with newly indexed passages (uploads), and take the rows of
+# deleted ones out of the search
+def refresh_quantized_index(passages, removed=()):
+    global quantized_index, row_metadata
+    if VECTOR_STORAGE not in ("int8", "pq"):
+        return
+    with quantized_refresh_lock:
+        passages_by_id.update((passage_id(passage["text"]), passage) for passage in passages)
+        for doc_id in removed:
+            passages_by_id.pop(doc_id, None)
+        index = load_quantized_index(VECTOR_STORAGE)
+        if index is not None:
+            row_metadata = RowMetadata(index.ids, passages_by_id)
+            quantized_index = index
+
+# Passages of the documents added through the upload API, kept next to each upload, oldest upload first so the
+# newest revision of a passage wins when duplicates are collapsed. Only uploads whose job finished count: a job
+# that failed (or was cut short by a restart) leaves nothing in the index. Jobs in skip are left out, files that
+# cannot be read are added to errors.
+def load_uploaded_passages(skip=(), errors=None):
+    passages = []
+    uploads = []
+    for path in glob.glob(os.path.join(UPLOAD_DIR, "*", "passages.json")):
+        record = upload_record(path)
+        if os.path.basename(os.path.dirname(path)) not in skip and record.get("status", "done") == "done":
+            uploads.append((record.get("created") or os.path.getmtime(path), path))
+    for _, path in sorted(uploads):
+        try:
+            with open(path) as f:
+                passages.extend(json.load(f))
+        except Exception as e:
+            print(f"Error loading uploaded passages from {path}:", str(e))
+            if errors is not None:
+                errors.append(path)
+    return passages
+
+# Job record of the upload a passages file belongs to (see elastic/ingest.py), empty for uploads made before
+# jobs kept one
+def upload_record(path):
+    try:
+        with open(os.path.join(os.path.dirname(path), "job.json")) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+# Ids of the indexed passages that cite document_url, as their source or as one of their locations
+def document_passage_ids(document_url):
+    query = {"query": {"bool": {"should": [
+        {"term": {"document_url": document_url}},
+        {"term": {"locations.document_url": document_url}}
+    ], "minimum_should_match": 1}}}
+    return {hit["_id"] for hit in helpers.scan(es, index=INDEX_NAME, query=query, _source=False)}
+
+def cosine_query(embedding, query):
+    return {
+        "script_score": {
+            "query": query,
+            "script": {
+                "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0", #assigns and normalizes score between -1 and 1
+                "params": {"query_vector": embedding.tolist()}
+            }
+        }
+    }
+
+# Text, score and page citation of a search hit
+def format_hit(doc_id, score, source):
+    return {
+        "id": doc_id,
+        "score": score,
+        "text": source.get("text"),
+        "document_url": source.get("document_url"),
+        "document_title": source.get("document_title"),
+        "page_number": source.get("page_number"),
+        "locations": source.get("locations", [])
+    }
+
+#finds the source document and the text stored along with it and returns the "hit" at each of the hit keys
+def format_hits(response):
+    return [format_hit(hit["_id"], hit["_score"], hit["_source"]) for hit in response["hits"]["hits"]]
+
+# Exact search: ES scores every document that passes the filters with cosineSimilarity against the float vectors
+def vector_body(embedding, size, filters=None, timeout=ES_TIMEOUT):
+    return {
+        "size": size,
+        "timeout": f"{int(timeout * 1000)}ms",
+        "query": cosine_query(embedding, filtered_query({"match_all": {}}, filters)), #matches the query against all indexed strings
+        "_source": {"includes": CITATION_FIELDS}
+    }
+
+def vector_search(embedding, size, filters=None, timeout=ES_TIMEOUT):
+    return format_hits(es.search(index=INDEX_NAME, request_timeout=timeout,
+                                 body=vector_body(embedding, size, filters, timeout)))
+
+# Quantized search: candidates come from the compressed vectors in memory, ES is only asked for the texts
+def quantized_candidates(embedding, size, filters=None):
+    index = quantized_index
+    mask = row_metadata.mask(filters) if row_metadata is not None else None
+    if mask is not None:
+        mask = mask[:len(index)]  # refreshes swap in the metadata before the index, it may cover newer rows
+    return index.search(embedding, size, RESCORE_DEPTH, embedding_cache.vectors(), mask)
+
+# Texts and citations of lists of (id, score) candidates, all fetched with one mget
+def fetch_hits(candidate_lists, timeout=ES_TIMEOUT):
+    ids = list(dict.fromkeys(doc_id for candidates in candidate_lists for doc_id, _ in candidates))
+    if not ids:
+        return [[] for _ in candidate_lists]
+    response = es.mget(index=INDEX_NAME, body={"ids": ids}, _source_includes=CITATION_FIELDS, request_timeout=timeout)
+    sources = {doc["_id"]: doc["_source"] for doc in response["docs"] if doc.get("found")}
+    return [[format_hit(doc_id, score, sources[doc_id]) for doc_id, score in candidates if doc_id in sources]
+            for candidates in candidate_lists]
+
+def quantized_search(embedding, size, filters=None, timeout=ES_TIMEOUT):
+    return fetch_hits([quantized_candidates(embedding, size, filters)], timeout)[0]
+
+# Quantized search of several embeddings: the in-process scoring runs under the stage limit too, and the mget
+# gets what is left of it
+def batch_quantized_search(embeddings, size, filters, timeout):
+    stage = Deadline(timeout)
+    candidate_lists = call_with_timeout(timeout, lambda: [quantized_candidates(embedding, size, filters)
+                                                          for embedding in embeddings])
+    return fetch_hits(candidate_lists, stage.stage_timeout(timeout))
+
+# Hybrid search: a BM25 match picks the candidates and only those get the cosine script, through an ES rescore
+# window, so the cost follows the candidate depth instead of the corpus size
+def hybrid_body(query, embedding, size, candidates, vector_weight, filters=None, timeout=ES_TIMEOUT):
+    return {
+        "size": size,
+        "timeout": f"{int(timeout * 1000)}ms",
+        "query": filtered_query({"match": {"text": query}}, filters),
+        "rescore": {
+            "window_size": max(candidates, size),
+            "query": {
+                "rescore_query": cosine_query(embedding, {"match_all": {}}),
+                "query_weight": 1.0 - vector_weight,
+                "rescore_query_weight": vector_weight
+            }
+        },
+        "_source": {"includes": CITATION_FIELDS}
+    }
+
+def hybrid_search(query, embedding, size, candidates, vector_weight, filters=None, timeout=ES_TIMEOUT):
+    return format_hits(es.search(index=INDEX_NAME, request_timeout=timeout,
+                                 body=hybrid_body(query, embedding, size, candidates, vector_weight, filters, timeout)))
+
+# Degraded path: plain BM25, no encoder and no script scoring
+def lexical_body(query, size, filters=None, timeout=ES_TIMEOUT):
+    return {
+        "size": size,
+        "timeout": f"{int(timeout * 1000)}ms",
+        "query": filtered_query({"match": {"text": query}}, filters),
+        "_source": {"includes": CITATION_FIELDS}
+    }
+
+def lexical_search(query, size, filters=None, timeout=ES_TIMEOUT):
+    return format_hits(es.search(index=INDEX_NAME, request_timeout=timeout,
+                                 body=lexical_body(query, size, filters, timeout)))
+
+# Several search bodies in one _msearch round trip, hits of each in order. A failed search fails them all,
+# like a failed single search would.
+def multi_search(bodies, timeout=ES_TIMEOUT):
+    body = []
+    for search_body in bodies:
+        body.extend(({"index": INDEX_NAME}, search_body))
+    response = es.msearch(body=body, request_timeout=timeout)
+    results = []
+    for item in response["responses"]:
+        if "error" in item:
+            raise TransportError(item.get("status", "N/A"), "multi search failed", item["error"])
+        results.append(format_hits(item))
+    return results
+
+# Time a stage into the shared histogram and into the timings of this request
+@contextmanager
+def stage_timer(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[stage] = elapsed
+        search_stage_seconds.observe(elapsed, stage=stage)
+
+# Encoder plus vector query, each stage bounded by its own limit and by what is left of the request budget.
+# Returns the hits and the path that served them.
+def semantic_results(query, size, mode, filters, options, deadline, timings):
+    #creates embedd for the query
+    with stage_timer(timings, "encode"):
+        embedding = encoder_breaker.call(call_with_timeout, deadline.stage_timeout(ENCODE_TIMEOUT_MS / 1000),
+                                         encoder.encode, [query])[0]
+    if mode == "hybrid":
+        candidates = int(options.get("candidates", HYBRID_CANDIDATES))
+        vector_weight = float(options.get("vector_weight", HYBRID_VECTOR_WEIGHT))
+        with stage_timer(timings, "hybrid_query"):
+            results = vector_breaker.call(hybrid_search, query, embedding, size, candidates, vector_weight, filters,
+                                          deadline.stage_timeout(VECTOR_TIMEOUT_MS / 1000))
+        if results:
+            return results, "hybrid"
+    #no keyword overlap at all (or plain vector mode), so score against every passage
+    timeout = deadline.stage_timeout(VECTOR_TIMEOUT_MS / 1000)
+    if quantized_index is not None:
+        with stage_timer(timings, "quantized_query"):
+            return vector_breaker.call(quantized_search, embedding, size, filters, timeout), "quantized"
+    with stage_timer(timings, "vector_query"):
+        return vector_breaker.call(vector_search, embedding, size, filters, timeout), "vector"
+
+# Budget and stage limits of a batch: the single search ones plus BATCH_MS_PER_QUERY for every query
+def batch_limit(limit_ms, count):
+    return (limit_ms + count * BATCH_MS_PER_QUERY) / 1000
+
+# semantic_results for several queries at once: one encoder call for all of them and one round trip per search
+# stage (an _msearch, or one mget for the quantized index). Returns {query: (hits, path)}.
+def batch_semantic_results(queries, size, mode, filters, options, deadline, timings):
+    with stage_timer(timings, "encode"):
+        embeddings = batch_encoder_breaker.call(call_with_timeout,
+                                                deadline.stage_timeout(batch_limit(ENCODE_TIMEOUT_MS, len(queries))),
+                                                encoder.encode, queries)
+    results = {}
+    pending = list(zip(queries, embeddings))
+    if mode == "hybrid":
+        candidates = int(options.get("candidates", HYBRID_CANDIDATES))
+        vector_weight = float(options.get("vector_weight", HYBRID_VECTOR_WEIGHT))
+        timeout = deadline.stage_timeout(batch_limit(VECTOR_TIMEOUT_MS, len(pending)))
+        with stage_timer(timings, "hybrid_query"):
+            hits = batch_vector_breaker.call(multi_search, [
+                hybrid_body(query, embedding, size, candidates, vector_weight, filters, timeout)
+                for query, embedding in pending], timeout)
+        results = {query: (query_hits, "hybrid") for (query, _), query_hits in zip(pending, hits) if query_hits}
+        pending = [(query, embedding) for query, embedding in pending if query not in results]
+    if not pending:
+        return results
+    #queries without any keyword overlap (or plain vector mode) are scored against every passage
+    timeout = deadline.stage_timeout(batch_limit(VECTOR_TIMEOUT_MS, len(pending)))
+    if quantized_index is not None:
+        with stage_timer(timings, "quantized_query"):
+            hits = batch_vector_breaker.call(batch_quantized_search, [embedding for _, embedding in pending],
+                                             size, filters, timeout)
+        path = "quantized"
+    else:
+        with stage_timer(timings, "vector_query"):
+            hits = batch_vector_breaker.call(multi_search, [vector_body(embedding, size, filters, timeout)
+                                                            for _, embedding in pending], timeout)
+        path = "vector"
+    results.update((query, (query_hits, path)) for (query, _), query_hits in zip(pending, hits))
+    return results
+
+# Values read on every /metrics scrape
+Callback("semantic_corpus_passages", "Passages in the search index.", "gauge",
+         lambda: es.count(index=INDEX_NAME)["count"])
+Callback("embedding_cache_entries", "Embeddings stored in the on-disk cache.", "gauge", lambda: len(embedding_cache))
+Callback("embedding_cache_lookups_total", "Embedding cache lookups by result.", "counter",
+         lambda: [({"result": "hit"}, embedding_cache.hits), ({"result": "miss"}, embedding_cache.misses)])
+Callback("encoder_passages_total", "Passages encoded while indexing.", "counter", lambda: encode_stats["passages"])
+Callback("encoder_seconds_total", "Time spent encoding passages while indexing.", "counter", lambda: encode_stats["seconds"])
+Callback("index_documents_total", "Documents written to the search index.", "counter", lambda: index_stats["documents"])
+Callback("index_seconds_total", "Time spent writing documents to the search index.", "counter", lambda: index_stats["seconds"])
+Callback("query_log_records_total", "Search records written to or dropped by the query log.", "counter",
+         lambda: [({"result": "written"}, query_log.written), ({"result": "dropped"}, query_log.dropped)] if query_log else [])
+Callback("search_circuit_open", "1 while a circuit breaker of the search path is not closed.", "gauge",
+         lambda: [({"breaker": b.name}, int(b.state != "closed"))
+                  for b in (encoder_breaker, vector_breaker, batch_encoder_breaker, batch_vector_breaker)])
+
+# Why a search request cannot be run, or None. Checked before any stage runs, so malformed input is answered
+# with a 400 and never reaches the encoder or ES (where it would count against the breakers).
+def search_request_error(data):
+    size = data.get("size", 5)
+    if isinstance(size, bool) or not isinstance(size, int) or size < 1:
+        return "size must be a positive integer"
+    if data.get("mode", SEARCH_MODE) not in ("vector", "hybrid"):
+        return "mode must be vector or hybrid"
+    for option, kind in (("candidates", int), ("vector_weight", float)):
+        if data.get(option) is not None:
+            try:
+                kind(data[option])
+            except (TypeError, ValueError, OverflowError):
+                return f"{option} must be a number"
+    return filter_error(data.get("filters"))
+
+# Hand the request to the query log, only the enqueue happens on the request thread
+def log_search(data, path, results, timings, total, error=None):
+    if not isinstance(data, dict):
+        data = {}
+    #replayed traffic sends "log": false so it is not recorded twice
+    if query_log is None or data.get("log") is False:
+        return
+    query_log.log({
+        "timestamp": time.time(),
+        "query": data.get("user_input"),
+        "size": data.get("size", 5),
+        "mode": data.get("mode", SEARCH_MODE),
+        "filters": data.get("filters"),
+        "vector_storage": VECTOR_STORAGE,
+        "path": path,
+        "ids": [hit["id"] for hit in results],
+        "scores": [hit["score"] for hit in results],
+        "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()},
+        "total_ms": round(total * 1000, 3),
+        "error": error,
+    })
 
 @semantic.route('/api/elastic_search', methods=["POST"])
 def semantic_search():
+    start = time.perf_counter()
+    data = None
+    timings = {}
     try:
         #assigns the user_data post request as the query
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "request body must be a JSON object"}), 400
         query = data.get("user_input")
+        error = search_request_error(data) if isinstance(query, str) and query.strip() else \
+            "user_input must be a non-empty string"
+        if error:
+            return jsonify({"error": error}), 400
         size = data.get("size", 5)
-        #creates embedd for the query
-        embedding = bc.encode([query])[0].tolist()
-        script_query = {
-            "script_score": {
-                "query": {"match_all": {}}, #matches the query against all indexed strings
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0", #assigns and normalizes score between -1 and 1
-                    "params": {"query_vector": embedding}
-                }
-            }
-        }
-        response = es.search(index=INDEX_NAME, body={
-            "size": size,
-            "query": script_query,
-            "_source": {"includes": ["text"]}
-        })
+        mode = data.get("mode", SEARCH_MODE)
+        #optional {"document", "page_from", "page_to", "source"} restricting which passages get scored
+        filters = data.get("filters")
+        deadline = Deadline(SEARCH_BUDGET_MS / 1000)
+        try:
+            results, path = semantic_results(query, size, mode, filters, data, deadline, timings)
+        except Exception as e:
+            #over budget, breaker open or a failing stage: answer from BM25 instead of holding the request open
+            print("Falling back to lexical search:", str(e))
+            with stage_timer(timings, "lexical_query"):
+                results = lexical_search(query, size, filters, max(deadline.remaining(), LEXICAL_TIMEOUT_MS / 1000))
+            path = "lexical-fallback"
         print("Search executed successfully.")
-        #finds the source document and the text stored along with it and returns the "hit" at each of the hit keys
-        return [hit["_source"]["text"] for hit in response["hits"]["hits"]] #returns all the answers
+        with stage_timer(timings, "serialize"):
+            #the chat UI reads a plain list of answers, citations=true returns the page and score of each one
+            if data.get("citations"):
+                response = jsonify(results)
+            else:
+                response = jsonify([hit["text"] for hit in results]) #returns all the answers
+        #which path served the request: vector, hybrid, quantized or lexical-fallback
+        response.headers["X-Search-Path"] = path
+        total = time.perf_counter() - start
+        search_request_seconds.observe(total, path=path)
+        log_search(data, path, results, timings, total)
+        return response
     except Exception as e:
         print("Error executing search:", str(e))
+        total = time.perf_counter() - start
+        search_request_seconds.observe(total, path="error")
+        log_search(data, "error", [], timings, total, str(e))
         return jsonify({"error": str(e)})
 
-# Load data from file
-data = load_data('./data/extracted_data.json')
+# Many searches in one request, for evaluation runs and the multi-chatbox layout: {"queries": [...]} plus the
+# size, mode, filters, citations and hybrid options of /api/elastic_search, applied to every query. Answers
+# {query: answers} after one encoder call and one search round trip for the whole batch, instead of one of
+# each per query. X-Search-Path lists the paths that served the queries.
+@semantic.route('/api/elastic_search/batch', methods=["POST"])
+def batch_search():
+    start = time.perf_counter()
+    data = None
+    timings = {}
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "request body must be a JSON object"}), 400
+        queries = data.get("queries")
+        if not isinstance(queries, list) or not queries or \
+                not all(isinstance(query, str) and query.strip() for query in queries):
+            return jsonify({"error": "queries must be a non-empty list of non-empty strings"}), 400
+        #repeated queries are searched once
+        queries = list(dict.fromkeys(queries))
+        if len(queries) > BATCH_MAX_QUERIES:
+            return jsonify({"error": f"at most {BATCH_MAX_QUERIES} queries per batch"}), 400
+        error = search_request_error(data)
+        if error:
+            return jsonify({"error": error}), 400
+        size = data.get("size", 5)
+        mode = data.get("mode", SEARCH_MODE)
+        filters = data.get("filters")
+        deadline = Deadline(batch_limit(SEARCH_BUDGET_MS, len(queries)))
+        try:
+            results = batch_semantic_results(queries, size, mode, filters, data, deadline, timings)
+        except Exception as e:
+            print("Falling back to lexical search:", str(e))
+            timeout = max(deadline.remaining(), LEXICAL_TIMEOUT_MS / 1000)
+            with stage_timer(timings, "lexical_query"):
+                hits = multi_search([lexical_body(query, size, filters, timeout) for query in queries], timeout)
+            results = {query: (query_hits, "lexical-fallback") for query, query_hits in zip(queries, hits)}
+        print(f"Batch search of {len(queries)} queries executed successfully.")
+        with stage_timer(timings, "serialize"):
+            if data.get("citations"):
+                response = jsonify({query: hits for query, (hits, _) in results.items()})
+            else:
+                response = jsonify({query: [hit["text"] for hit in hits] for query, (hits, _) in results.items()})
+        response.headers["X-Search-Path"] = ",".join(sorted({path for _, path in results.values()}))
+        total = time.perf_counter() - start
+        search_request_seconds.observe(total, path="batch")
+        #one log record per query, with the batch's stage timings
+        for query, (hits, path) in results.items():
+            log_search({**data, "user_input": query}, path, hits, timings, total)
+        return response
+    except Exception as e:
+        print("Error executing batch search:", str(e))
+        total = time.perf_counter() - start
+        search_request_seconds.observe(total, path="error")
+        return jsonify({"error": str(e)})
+
+# Load data from file, plus every document uploaded since the image was built
+upload_errors = []
+data, _ = collapse_passages(load_data(BUNDLED_DATA) + load_uploaded_passages(errors=upload_errors))
+
+# Index data. What is indexed but no longer in data is removed, unless an upload could not be read and its
+# passages are only missing for now.
+if BULK_INGEST:
+    bulk_index_data(data, prune=not upload_errors)
+else:
+    index_data(data, prune=not upload_errors)
 
-# Index data
-index_data(data)
\ No newline at end of file
+if VECTOR_STORAGE in ("int8", "pq"):
+    quantized_index = load_quantized_index(VECTOR_STORAGE)
+    if quantized_index is not None:
+        passages_by_id.update((passage_id(passage["text"]), passage) for passage in data)
+        row_metadata = RowMetadata(quantized_index.ids, passages_by_id)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Batch search endpoint against the same queries sent one request at a time
+
+For every batch size, sends N queries to /api/elastic_search one after the other and then as one request to
+/api/elastic_search/batch (one encoder call, one _msearch), and reports the wall time of both, the speedup and
+whether the batch returned the same results. Queries come from a query log (QUERY_LOG_PATH) or a text file with
+one query per line; every round takes the next N distinct queries, wrapping around.
+
+Requests are sent with "log": false so they do not end up in the query log.
+
+Usage:
+    python benchmarks/bench_batch_search.py --queries app/logs/queries.jsonl --sizes 1 8 32 64
+    python benchmarks/bench_batch_search.py --queries questions.txt --url http://localhost:5000 --set mode=hybrid
+"""
+
+import argparse
+import json
+import os
+import time
+import urllib.request
+
+from common import RESULTS_DIR, percentile_ms, save_results
+from elastic.query_log import read_query_log
+from replay_queries import parse_overrides
+
+DEFAULT_URL = "http://localhost:5000"
+RESULTS_PATH = os.path.join(RESULTS_DIR, "batch_search.json")
+
+
+def load_queries(path):
+    if path.endswith(".jsonl") or ".jsonl." in path:
+        queries = [record.get("query") for record in read_query_log(path) if not record.get("error")]
+    else:
+        with open(path) as f:
+            queries = [line.strip() for line in f]
+    return list(dict.fromkeys(query for query in queries if query))
+
+
+def post(url, body, timeout):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        payload = json.load(response)
+    if isinstance(payload, dict) and "error" in payload:
+        raise RuntimeError(payload["error"])
+    return payload
+
+
+# N single requests in a row; returns the seconds taken and the result ids of each query
+def sequential(url, queries, overrides, timeout):
+    start = time.perf_counter()
+    results = {}
+    for query in queries:
+        hits = post(f"{url}/api/elastic_search",
+                    {"user_input": query, "citations": True, "log": False, **overrides}, timeout)
+        results[query] = [hit["id"] for hit in hits]
+    return time.perf_counter() - start, results
+
+
+def batch(url, queries, overrides, timeout):
+    start = time.perf_counter()
+    payload = post(f"{url}/api/elastic_search/batch",
+                   {"queries": queries, "citations": True, "log": False, **overrides}, timeout)
+    return time.perf_counter() - start, {query: [hit["id"] for hit in hits] for query, hits in payload.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", required=True, help="query log (.jsonl) or text file with one query per line")
+    parser.add_argument("--url", default=DEFAULT_URL, help="base URL of the app")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 8, 32, 64], help="queries per batch")
+    parser.add_argument("--rounds", type=int, default=10, help="batches sent per size")
+    parser.add_argument("--set", nargs="*", dest="overrides", metavar="KEY=VALUE", help="request overrides")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    if not queries:
+        raise SystemExit("no queries found in " + args.queries)
+    overrides = parse_overrides(args.overrides)
+    print(f"[INFO] {len(queries)} distinct queries, batch sizes {args.sizes}, {args.rounds} rounds each")
+
+    results = []
+    offset = 0
+    for size in args.sizes:
+        sequential_seconds, batch_seconds = [], []
+        compared = identical = 0
+        for _ in range(args.rounds):
+            chunk = [queries[(offset + i) % len(queries)] for i in range(min(size, len(queries)))]
+            offset += len(chunk)
+            seconds, expected = sequential(args.url, chunk, overrides, args.timeout)
+            sequential_seconds.append(seconds)
+            seconds, got = batch(args.url, chunk, overrides, args.timeout)
+            batch_seconds.append(seconds)
+            compared += len(expected)
+            identical += sum(got.get(query) == ids for query, ids in expected.items())
+        row = {
+            "batch_size": size,
+            "rounds": args.rounds,
+            "sequential_p50_ms": percentile_ms(sequential_seconds, 50),
+            "sequential_p95_ms": percentile_ms(sequential_seconds, 95),
+            "batch_p50_ms": percentile_ms(batch_seconds, 50),
+            "batch_p95_ms": percentile_ms(batch_seconds, 95),
+            "speedup_p50": round(percentile_ms(sequential_seconds, 50) / max(percentile_ms(batch_seconds, 50), 1e-6), 2),
+            "identical_results": round(identical / compared, 4) if compared else None,
+        }
+        results.append(row)
+
+    print(f"{'batch':>6}{'sequential p50':>16}{'batch p50':>12}{'speedup':>9}{'identical':>11}")
+    for row in results:
+        print(f"{row['batch_size']:>6}{row['sequential_p50_ms']:>14.1f}ms{row['batch_p50_ms']:>10.1f}ms"
+              f"{row['speedup_p50']:>8.1f}x{row['identical_results']:>11}")
+    save_results(args.output, "batch_search", args, results)
+
+
+if __name__ == "__main__":
+    main()
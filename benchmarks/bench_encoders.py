@@ -0,0 +1,123 @@
+"""
+Encoder backend benchmark
+
+Compares the bert-as-service zmq server against the in-process CPU encoder on the passages of
+app/data/extracted_data.json:
+- throughput: passages/sec when encoding the corpus in batches, with and without length bucketing
+- padding overhead: padded tokens / real tokens of those batches
+- single-query latency: p50 / p95 milliseconds of one-text encode calls, as done per search request
+
+The bert-service backend needs running `bert` replicas (pass --bert-endpoints localhost:5555:5556 when it runs
+under docker compose, list several to measure how throughput scales), the cpu backend needs the packages from
+app/requirements-cpu.txt.
+
+Usage:
+    python benchmarks/bench_encoders.py --backends bert-service cpu --passages 2000 --queries 100
+"""
+
+import argparse
+import json
+import os
+import time
+
+from common import APP_DIR, RESULTS_DIR, percentile_ms, save_results
+from elastic.encoders import create_encoder, encode_bucketed
+
+DATA_PATH = os.path.join(APP_DIR, "data", "extracted_data.json")
+RESULTS_PATH = os.path.join(RESULTS_DIR, "encoders.json")
+
+
+# Same passages semantic.load_data indexes: every non-empty subheader content
+def load_passages(path=DATA_PATH):
+    with open(path, "r") as f:
+        data = json.load(f)
+    return [content for item in data for content in item.get("subheader", {}).values()
+            if isinstance(content, str) and content.strip()]
+
+
+# Tokens each batch is padded to (its longest sequence) over the tokens actually present
+def padding_overhead(lengths, batch_size, bucketing):
+    ordered = sorted(lengths) if bucketing else lengths
+    padded = sum(max(ordered[i:i + batch_size]) * len(ordered[i:i + batch_size])
+                 for i in range(0, len(ordered), batch_size))
+    return round(padded / max(sum(ordered), 1), 3)
+
+
+def bench_backend(encoder, passages, queries, batch_size):
+    encoder.encode(passages[:batch_size])  # warm up
+    lengths = encoder.token_lengths(passages)
+    throughput = {}
+    for bucketing in (False, True):
+        start = time.perf_counter()
+        encode_bucketed(encoder, passages, batch_size, bucketing)
+        throughput[bucketing] = len(passages) / (time.perf_counter() - start)
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        encoder.encode([query])
+        latencies.append(time.perf_counter() - start)
+    return {
+        "backend": encoder.name,
+        "passages": len(passages),
+        "batch_size": batch_size,
+        "passages_per_second": round(throughput[False], 1),
+        "passages_per_second_bucketed": round(throughput[True], 1),
+        "padding_overhead": padding_overhead(lengths, batch_size, False),
+        "padding_overhead_bucketed": padding_overhead(lengths, batch_size, True),
+        "single_query_p50_ms": percentile_ms(latencies, 50),
+        "single_query_p95_ms": percentile_ms(latencies, 95),
+    }
+
+
+def backend_options(backend, args):
+    if backend == "bert-service":
+        return {"endpoints": args.bert_endpoints, "max_retries": 1}
+    if backend == "cpu":
+        options = {"threads": args.threads, "quantize": not args.fp32}
+        if args.model:
+            options["model_name"] = args.model
+        return options
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["bert-service", "cpu"])
+    parser.add_argument("--passages", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--bert-endpoints", default="bert:5555:5556", help="comma separated host:port:port_out")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model", help="model name or local path for the cpu encoder")
+    parser.add_argument("--fp32", action="store_true", help="do not quantize the cpu encoder")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    corpus = load_passages()
+    passages = (corpus * (args.passages // max(len(corpus), 1) + 1))[:args.passages]
+    queries = passages[::max(len(passages) // args.queries, 1)][:args.queries]
+
+    results = []
+    for backend in args.backends:
+        try:
+            encoder = create_encoder(backend, **backend_options(backend, args))
+        except Exception as e:
+            print(f"[WARNING] Skipping {backend}: {e}")
+            continue
+        try:
+            results.append(bench_backend(encoder, passages, queries, args.batch_size))
+        finally:
+            encoder.close()
+
+    print(f"{'backend':<16}{'passages/sec':>14}{'bucketed':>10}{'padding':>9}{'bucketed':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in results:
+        print(f"{row['backend']:<16}{row['passages_per_second']:>14}{row['passages_per_second_bucketed']:>10}"
+              f"{row['padding_overhead']:>9}{row['padding_overhead_bucketed']:>10}"
+              f"{row['single_query_p50_ms']:>10}{row['single_query_p95_ms']:>10}")
+
+    save_results(args.output, "encoders", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Parser data model memory benchmark
+
+Measures the memory the parser holds per 1,000 pages of extracted content, with the nested dicts it used to
+keep (a {"subheading", "images", "tables"} dict per page plus the full list of output dicts built before
+json.dump) against the slotted model in utils/parser_model.py (runs stored flat per page with interned font
+ids, serialized a page at a time).
+
+Pages are copies of the pages of an extracted JSON output (every string copied, so pages share nothing),
+split into one passage per text block and spread over a small font table, as in the bundled manual
+(about one passage per block, 11 fonts). Reported per configuration, with tracemalloc:
+- retained_mb: memory held by the extracted pages of the whole document
+- structure_mb: the same without the text strings themselves, which both representations hold once
+- peak_mb: peak while the pages are serialized to the JSON output (written to a null device)
+
+Usage:
+    python benchmarks/bench_model.py --pages 1000 10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+from common import APP_DIR, RESULTS_DIR, save_results
+from parser_model import FontTable, Block, Page
+
+RESULTS_PATH = os.path.join(RESULTS_DIR, "model.json")
+DEFAULT_SOURCE = os.path.join(APP_DIR, "data", "extracted_data.json")
+FONTS = 11
+
+
+def copy_text(text):
+    return (text + ".")[:-1]
+
+
+def source_pages(path, count):
+    with open(path) as f:
+        pages = json.load(f)
+    for pagenum in range(count):
+        yield pagenum, pages[pagenum % len(pages)]
+
+
+# The representation the parser used to keep: text_per_page dicts, then a list of output dicts
+def build_dicts(path, count):
+    text_per_page = {}
+    for pagenum, page in source_pages(path, count):
+        text_per_page[f"Page_{pagenum}"] = {
+            "subheading": {copy_text(k): copy_text(v) for k, v in page.get("subheader", {}).items()},
+            "images": [copy_text(page["image_text"])] if page.get("image_text") else [],
+            "tables": [copy_text(page["table_text"])] if page.get("table_text") else [],
+        }
+    return text_per_page
+
+
+def structure_dicts(text_per_page, document_url):
+    data = []
+    for page_num, content_dict in text_per_page.items():
+        data.append({
+            "document_id": "",
+            "document_title": "",
+            "document_url": document_url,
+            "page_number": f"Page_{page_num}",
+            "subheader": content_dict.get("subheading", {}),
+            "table_text": "\n".join(content_dict.get("tables", [])),
+            "image_text": "\n".join(content_dict.get("images", [])),
+            "vector": "<BERT_Embedding_of_combined_text>",
+            "traceability": {
+                "source": "Tinker Air Force Base",
+                "manual_reference": "",
+                "exact_location": f"n{page_num}",
+            },
+        })
+    return data
+
+
+def build_model(path, count):
+    fonts = FontTable()
+    font_ids = [fonts.intern(f"Font-{i}", 8.0 + i) for i in range(FONTS)]
+    pages = []
+    for pagenum, page in source_pages(path, count):
+        model_page = Page(pagenum,
+                          [copy_text(page["image_text"])] if page.get("image_text") else [],
+                          [copy_text(page["table_text"])] if page.get("table_text") else [])
+        for i, (subheader, content) in enumerate(page.get("subheader", {}).items()):
+            block = Block()
+            block.add_run(font_ids[i % FONTS], copy_text(subheader))
+            block.add_run(font_ids[(i + 1) % FONTS], copy_text(content))
+            model_page.add_block(block)
+        pages.append(model_page)
+    return fonts, pages
+
+
+# Size of the text strings a document of count pages holds, common to both representations
+def text_bytes(path, count):
+    total = 0
+    for _, page in source_pages(path, count):
+        strings = [*page.get("subheader", {}).keys(), *page.get("subheader", {}).values()]
+        strings += [page[key] for key in ("image_text", "table_text") if page.get(key)]
+        total += sum(sys.getsizeof(text) for text in strings)
+    return total
+
+
+def measure(name, build, serialize, pages, text):
+    tracemalloc.start()
+    held = build()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    with open(os.devnull, "w") as f:
+        serialize(held, f)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"config": name, "pages": pages, "retained_mb": round(retained / 2 ** 20, 2),
+            "retained_mb_per_1000_pages": round(retained / 2 ** 20 * 1000 / pages, 2),
+            "structure_mb": round((retained - text) / 2 ** 20, 2), "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def dump_dicts(text_per_page, f):
+    json.dump(structure_dicts(text_per_page, "manual.pdf"), f, indent=4)
+
+
+def dump_model(held, f):
+    _, pages = held
+    for page in pages:
+        f.write(json.dumps(page.to_output("manual.pdf"), indent=4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000])
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="extracted JSON output to copy pages from")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    results = []
+    for pages in args.pages:
+        text = text_bytes(args.source, pages)
+        results.append(measure("dicts", lambda: build_dicts(args.source, pages), dump_dicts, pages, text))
+        results.append(measure("slotted", lambda: build_model(args.source, pages), dump_model, pages, text))
+
+    print(f"{'config':<10}{'pages':>8}{'retained MB':>13}{'MB / 1000 pages':>17}{'structure MB':>14}{'peak MB':>10}")
+    for row in results:
+        print(f"{row['config']:<10}{row['pages']:>8}{row['retained_mb']:>13}{row['retained_mb_per_1000_pages']:>17}"
+              f"{row['structure_mb']:>14}{row['peak_mb']:>10}")
+    save_results(args.output, "model", args, results)
+
+
+if __name__ == "__main__":
+    main()
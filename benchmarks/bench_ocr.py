@@ -0,0 +1,189 @@
+"""
+OCR front end benchmark
+
+Runs a labelled sample of figure crops through the parser's original OCR path (rasterize at the pdf2image
+default DPI, Tesseract with default settings) and through the adaptive front end in utils/ocr_frontend.py
+(size threshold, DPI from the bounding box, grayscale + Otsu binarization, page segmentation mode from the
+shape), and reports for each:
+- CPU time, including the pdftoppm and tesseract child processes, and wall time
+- character accuracy against the labels: 1 - (edit distance / label characters) over the whole sample,
+  so text read from figures whose label is empty (icons) counts against a configuration
+
+A sample is a directory of one-page PDFs (one figure crop each) with the expected text next to each one in
+<name>.txt. --make-sample writes a synthetic one: icons, single-line labels, light-on-dark labels, text blocks
+and large diagrams with scattered callouts. Needs Tesseract and Poppler.
+
+Usage:
+    python benchmarks/bench_ocr.py --make-sample benchmarks/results/ocr_sample
+    python benchmarks/bench_ocr.py --sample benchmarks/results/ocr_sample
+"""
+
+import argparse
+import glob
+import os
+import random
+import resource
+import time
+import PyPDF2
+import pytesseract
+from pdf2image import convert_from_path
+from PIL import Image, ImageDraw, ImageFont
+
+from common import RESULTS_DIR, save_results
+from ocr_frontend import choose_dpi, recognize, should_ocr
+
+RESULTS_PATH = os.path.join(RESULTS_DIR, "ocr.json")
+SAMPLE_DPI = 300  # resolution the synthetic figures are drawn at
+WORDS = ("HYDRAULIC", "PUMP", "VALVE", "TORQUE", "ACTUATOR", "FITTING", "P/N", "BOLT", "SEAL", "FILTER",
+         "INSPECT", "GEAR", "PANEL", "SWITCH", "LEVER", "WARNING", "CAUTION", "FUEL", "LINE", "CLAMP")
+
+
+def _font(points):
+    pixels = int(points * SAMPLE_DPI / 72)
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", pixels)
+    except OSError:
+        return ImageFont.load_default(size=pixels)
+
+
+def _phrase(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + f" {rng.randint(10, 9999)}"
+
+
+def _canvas(width_pt, height_pt, background=255):
+    size = (int(width_pt * SAMPLE_DPI / 72), int(height_pt * SAMPLE_DPI / 72))
+    return Image.new("L", size, background)
+
+
+def _save(directory, name, image, text):
+    image.save(os.path.join(directory, name + ".pdf"), "PDF", resolution=SAMPLE_DPI)
+    with open(os.path.join(directory, name + ".txt"), "w") as f:
+        f.write(text)
+
+
+# Synthetic labelled figures of the kinds found in the manuals
+def make_sample(directory, per_kind=10, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(per_kind):
+        icon = _canvas(18, 18)
+        ImageDraw.Draw(icon).ellipse((10, 10, icon.width - 10, icon.height - 10), outline=0, width=6)
+        ImageDraw.Draw(icon).text((icon.width // 2, icon.height // 2), "!", font=_font(12), fill=0, anchor="mm")
+        _save(directory, f"icon_{i}", icon, "")
+
+        text = _phrase(rng, 3)
+        label = _canvas(12 + 6.5 * len(text), 20)
+        ImageDraw.Draw(label).text((20, label.height // 2), text, font=_font(10), fill=0, anchor="lm")
+        _save(directory, f"label_{i}", label, text)
+
+        text = _phrase(rng, 2)
+        dark = _canvas(12 + 6.5 * len(text), 20, background=40)
+        ImageDraw.Draw(dark).text((20, dark.height // 2), text, font=_font(10), fill=230, anchor="lm")
+        _save(directory, f"dark_label_{i}", dark, text)
+
+        lines = [_phrase(rng, 4) for _ in range(4)]
+        block = _canvas(260, 80)
+        for row, line in enumerate(lines):
+            ImageDraw.Draw(block).text((20, 20 + row * int(16 * SAMPLE_DPI / 72)), line, font=_font(10), fill=0)
+        _save(directory, f"block_{i}", block, "\n".join(lines))
+
+        callouts = [_phrase(rng, 1) for _ in range(5)]
+        diagram = _canvas(500, 400)
+        draw = ImageDraw.Draw(diagram)
+        draw.rectangle((300, 300, diagram.width - 300, diagram.height - 300), outline=0, width=8)
+        for n, callout in enumerate(callouts):
+            x = 40 + (n % 2) * (diagram.width // 2)
+            y = 60 + n * (diagram.height // 6)
+            draw.text((x, y), callout, font=_font(9), fill=0)
+            draw.line((x, y + 40, diagram.width // 2, diagram.height // 2), fill=0, width=3)
+        _save(directory, f"diagram_{i}", diagram, "\n".join(callouts))
+    print(f"[INFO] Wrote {per_kind * 5} labelled figures to {directory}")
+
+
+def load_sample(directory):
+    sample = []
+    for pdf_path in sorted(glob.glob(os.path.join(directory, "*.pdf"))):
+        with open(os.path.splitext(pdf_path)[0] + ".txt") as f:
+            label = f.read()
+        with open(pdf_path, "rb") as f:
+            box = PyPDF2.PdfReader(f).pages[0].mediabox
+        sample.append((pdf_path, label, float(box.width), float(box.height)))
+    return sample
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def ocr_baseline(pdf_path, width, height):
+    image = convert_from_path(pdf_path)[0]
+    return pytesseract.image_to_string(image)
+
+
+def ocr_adaptive(pdf_path, width, height):
+    if not should_ocr(width, height):
+        return ""
+    image = convert_from_path(pdf_path, dpi=choose_dpi(width, height), grayscale=True)[0]
+    return recognize(image, width, height)
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run(name, ocr, sample):
+    edits = 0
+    characters = 0
+    cpu = cpu_seconds()
+    wall = time.perf_counter()
+    for pdf_path, label, width, height in sample:
+        text = normalize_text(ocr(pdf_path, width, height))
+        label = normalize_text(label)
+        edits += edit_distance(text, label)
+        characters += len(label)
+    return {
+        "config": name,
+        "figures": len(sample),
+        "cpu_seconds": round(cpu_seconds() - cpu, 3),
+        "wall_seconds": round(time.perf_counter() - wall, 3),
+        "char_accuracy": round(1 - edits / max(characters, 1), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", help="directory of <name>.pdf / <name>.txt labelled figures")
+    parser.add_argument("--make-sample", help="write a synthetic labelled sample to this directory and exit")
+    parser.add_argument("--per-kind", type=int, default=10)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    if args.make_sample:
+        make_sample(args.make_sample, args.per_kind)
+        return
+    if not args.sample:
+        parser.error("--sample or --make-sample is required")
+
+    sample = load_sample(args.sample)
+    results = [run("baseline", ocr_baseline, sample), run("adaptive", ocr_adaptive, sample)]
+    print(f"{'config':<12}{'figures':>9}{'CPU s':>10}{'wall s':>10}{'char accuracy':>15}")
+    for row in results:
+        print(f"{row['config']:<12}{row['figures']:>9}{row['cpu_seconds']:>10}{row['wall_seconds']:>10}"
+              f"{row['char_accuracy']:>15}")
+    save_results(args.output, "ocr", args, results)
+
+
+if __name__ == "__main__":
+    main()
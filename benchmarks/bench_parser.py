@@ -0,0 +1,111 @@
+"""
+PDF parser benchmark
+
+Runs utils/pdf_parser_json_printing.py end to end on the bundled manual and on synthetic manuals of
+10, 100 and 1,000 pages (see synthetic_pdf.py). Every run happens in a scratch working directory, so the
+real app/data/extracted_data.json is never overwritten.
+
+Reports, per document:
+- pages per second (median of --repeats runs, including interpreter start-up and imports)
+- peak RSS of the parser process
+- the three most expensive stages from the parser's own profile report
+- how many table detection / OCR calls the page triage skipped
+
+Synthetic pages carry an embedded image that goes through OCR, which needs Tesseract and Poppler.
+Pass --no-images to benchmark text and table extraction only.
+
+Usage:
+    python benchmarks/bench_parser.py --pages 10 100 1000 --repeats 3
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import PyPDF2
+
+from common import APP_DIR, RESULTS_DIR, UTILS_DIR, save_results
+from synthetic_pdf import write_pdf
+
+PARSER = os.path.join(UTILS_DIR, "pdf_parser_json_printing.py")
+BUNDLED_PDF = os.path.join(APP_DIR, "data", "00-25-195.pdf")
+RESULTS_PATH = os.path.join(RESULTS_DIR, "parser.json")
+
+
+def page_count(path):
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+# One parser run in a scratch directory laid out like the repo root; returns (seconds, profile report)
+def run_parser(pdf_path, workdir):
+    data_dir = os.path.join(workdir, "app", "data")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, PARSER, os.path.abspath(pdf_path)], cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.decode(errors="replace").strip().splitlines()[-1])
+    with open(os.path.join(data_dir, "parser_profile", "profile.json")) as f:
+        return seconds, json.load(f)
+
+
+def bench_document(name, pdf_path, repeats, workdir):
+    pages = page_count(pdf_path)
+    runs = [run_parser(pdf_path, workdir) for _ in range(repeats)]
+    seconds = statistics.median(run[0] for run in runs)
+    profile = runs[-1][1]
+    stages = sorted(((stage, row) for stage, row in profile["stages"].items() if stage != "page_total"),
+                    key=lambda item: -item[1]["wall_s"])
+    return {
+        "document": name,
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "pages_per_second": round(pages / seconds, 2),
+        "peak_rss_mb": round(max(run[1]["peak_rss_bytes"] or 0 for run in runs) / 2 ** 20, 1),
+        "top_stages": {stage: round(row["wall_s"], 3) for stage, row in stages[:3]},
+        "skipped_invocations": profile.get("triage", {}).get("skipped_invocations"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000],
+                        help="sizes of the synthetic documents")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-images", action="store_true", help="synthetic pages without an image to OCR")
+    parser.add_argument("--skip-bundled", action="store_true", help=f"do not parse {BUNDLED_PDF}")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_parser_") as workdir:
+        documents = [] if args.skip_bundled else [(os.path.basename(BUNDLED_PDF), BUNDLED_PDF)]
+        for pages in args.pages:
+            path = write_pdf(os.path.join(workdir, f"synthetic_{pages}.pdf"), pages, not args.no_images)
+            documents.append((f"synthetic {pages} pages", path))
+
+        print(f"{'document':<26}{'pages':>7}{'seconds':>10}{'pages/s':>10}{'peak MB':>10}  top stages")
+        for name, path in documents:
+            try:
+                row = bench_document(name, path, args.repeats, workdir)
+            except Exception as e:
+                print(f"Error parsing {name}:", str(e))
+                continue
+            results.append(row)
+            stages = ", ".join(f"{stage} {seconds}s" for stage, seconds in row["top_stages"].items())
+            print(f"{name:<26}{row['pages']:>7}{row['seconds']:>10}{row['pages_per_second']:>10}"
+                  f"{row['peak_rss_mb']:>10}  {stages}")
+
+    save_results(args.output, "parser", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Quantized vector storage benchmark
+
+Compares the full precision cosine search done by the ES `cosineSimilarity` script against the int8 and
+product-quantized indexes in app/elastic/quantization.py, with and without full-precision rescoring.
+Runs on a synthetic clustered corpus, so it needs no BERT server and no Elasticsearch.
+
+Reports, per configuration:
+- memory per million passages (vector payload only)
+- query latency (p50 / p95, milliseconds)
+- recall@k against the exact float32 results
+
+Usage:
+    python benchmarks/bench_quantization.py --passages 100000 --queries 200 --k 10
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+from common import DIMS, RESULTS_DIR, percentile_ms, save_results, synthetic_corpus
+from elastic.quantization import QuantizedIndex, normalize
+
+RESULTS_PATH = os.path.join(RESULTS_DIR, "quantization.json")
+
+
+def exact_top_k(corpus, query, k):
+    scores = corpus @ normalize(query)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return set(top[np.argsort(-scores[top])].tolist())
+
+
+def run(passages, queries, k, rescore_depth):
+    corpus, query_set = synthetic_corpus(passages, queries)
+    unit_corpus = normalize(corpus)
+    ids = [str(i) for i in range(passages)]
+
+    latencies = []
+    truth = []
+    for query in query_set:
+        start = time.perf_counter()
+        truth.append(exact_top_k(unit_corpus, query, k))
+        latencies.append(time.perf_counter() - start)
+    results = [{
+        "config": "float32 exact",
+        "bytes_per_passage": DIMS * 4,
+        "mb_per_million": DIMS * 4,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "recall_at_k": 1.0,
+    }]
+
+    for kind in ("int8", "pq"):
+        start = time.perf_counter()
+        index = QuantizedIndex.build(kind, ids, corpus)
+        build_seconds = time.perf_counter() - start
+        bytes_per_passage = index.nbytes() / passages
+        for full_vectors in (None, corpus):
+            latencies = []
+            recalls = []
+            for query, expected in zip(query_set, truth):
+                start = time.perf_counter()
+                hits = index.search(query, k, rescore_depth, full_vectors)
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(expected & {int(doc_id) for doc_id, _ in hits}) / k)
+            results.append({
+                "config": f"{kind} " + ("approximate" if full_vectors is None else f"+ rescore top {rescore_depth}"),
+                "bytes_per_passage": bytes_per_passage,
+                "mb_per_million": round(bytes_per_passage, 1),  # bytes per passage x 1e6 / 1e6
+                "p50_ms": percentile_ms(latencies, 50),
+                "p95_ms": percentile_ms(latencies, 95),
+                "recall_at_k": round(float(np.mean(recalls)), 4),
+                "build_seconds": round(build_seconds, 2),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--passages", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-depth", type=int, default=100)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    results = run(args.passages, args.queries, args.k, args.rescore_depth)
+    print(f"{'config':<28}{'MB/1M passages':>16}{'p50 ms':>10}{'p95 ms':>10}{'recall@' + str(args.k):>12}")
+    for row in results:
+        print(f"{row['config']:<28}{row['mb_per_million']:>16}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['recall_at_k']:>12}")
+
+    save_results(args.output, "quantization", args, results)
+
+
+if __name__ == "__main__":
+    main()
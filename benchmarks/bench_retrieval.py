@@ -0,0 +1,104 @@
+"""
+Vector retrieval benchmark across corpus sizes
+
+Times every retrieval backend the app can serve from on synthetic clustered 768-dim corpora of growing
+size (10k, 100k and 1M passages by default):
+- exact: brute-force cosine over float32 vectors, what the ES `cosineSimilarity` script_score does
+- int8 / pq: the in-process quantized indexes (VECTOR_STORAGE=int8 / pq), approximate scores only
+- int8+rescore / pq+rescore: the same, with the top --rescore-depth re-ranked at full precision
+
+Reports, per corpus size and backend: single-query QPS, p50 / p95 / p99 latency in milliseconds and
+recall@k against the exact results. Needs no BERT server and no Elasticsearch. The 1M corpus takes about
+3 GB for the float32 vectors plus a temporary copy while a quantized index is built.
+
+Usage:
+    python benchmarks/bench_retrieval.py --sizes 10000 100000 1000000 --queries 200 --k 10
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+from common import GENERATION_CHUNK, RESULTS_DIR, percentile_ms, save_results, synthetic_corpus
+from elastic.quantization import QuantizedIndex, normalize
+
+RESULTS_PATH = os.path.join(RESULTS_DIR, "retrieval.json")
+BACKENDS = ("exact", "int8", "int8+rescore", "pq", "pq+rescore")
+
+
+def exact_search(unit_corpus, query, k):
+    scores = unit_corpus @ normalize(query)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])].tolist()
+
+
+def measure(search, query_set, truth, k):
+    latencies = []
+    recalls = []
+    started = time.perf_counter()
+    for query, expected in zip(query_set, truth):
+        start = time.perf_counter()
+        hits = search(query)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(expected & set(hits)) / k)
+    elapsed = time.perf_counter() - started
+    return {
+        "qps": round(len(query_set) / elapsed, 1),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+    }
+
+
+def run(size, queries, k, rescore_depth, backends):
+    corpus, query_set = synthetic_corpus(size, queries)
+    # normalize in place, chunk by chunk, so the 1M corpus is only held once
+    for start in range(0, size, GENERATION_CHUNK):
+        corpus[start:start + GENERATION_CHUNK] = normalize(corpus[start:start + GENERATION_CHUNK])
+    truth = [set(exact_search(corpus, query, k)) for query in query_set]
+    ids = list(range(size))
+
+    results = []
+    if "exact" in backends:
+        results.append({"backend": "exact", **measure(lambda q: exact_search(corpus, q, k), query_set, truth, k)})
+    for kind in ("int8", "pq"):
+        wanted = [backend for backend in (kind, kind + "+rescore") if backend in backends]
+        if not wanted:
+            continue
+        start = time.perf_counter()
+        index = QuantizedIndex.build(kind, ids, corpus)
+        build_seconds = round(time.perf_counter() - start, 2)
+        for backend in wanted:
+            full_vectors = corpus if backend.endswith("+rescore") else None
+            row = measure(lambda q: [doc_id for doc_id, _ in index.search(q, k, rescore_depth, full_vectors)],
+                          query_set, truth, k)
+            results.append({"backend": backend, "build_seconds": build_seconds, **row})
+        del index
+    return [{"passages": size, **row} for row in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-depth", type=int, default=100)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'passages':>10}  {'backend':<14}{'QPS':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'recall@' + str(args.k):>11}")
+    for size in args.sizes:
+        for row in run(size, args.queries, args.k, args.rescore_depth, args.backends):
+            results.append(row)
+            print(f"{row['passages']:>10}  {row['backend']:<14}{row['qps']:>9}{row['p50_ms']:>10}"
+                  f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['recall_at_k']:>11}")
+
+    save_results(args.output, "retrieval", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Helpers shared by the benchmark scripts: synthetic embedding corpora, latency percentiles and
+result files that carry enough context (commit, machine, arguments) to be compared across runs.
+"""
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(REPO_DIR, "app")
+UTILS_DIR = os.path.join(REPO_DIR, "utils")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DIMS = 768
+GENERATION_CHUNK = 100000  # rows generated at a time, keeps 1M-vector corpora from doubling peak memory
+
+for path in (APP_DIR, UTILS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+# Gaussian clusters around random centres, closer to real sentence embeddings than uniform noise
+def synthetic_corpus(passages, queries, dims=DIMS, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dims)).astype(np.float32)
+    corpus = np.empty((passages, dims), dtype=np.float32)
+    for start in range(0, passages, GENERATION_CHUNK):
+        rows = min(GENERATION_CHUNK, passages - start)
+        corpus[start:start + rows] = centres[rng.integers(clusters, size=rows)]
+        corpus[start:start + rows] += 0.6 * rng.standard_normal(size=(rows, dims), dtype=np.float32)
+    query_set = centres[rng.integers(clusters, size=queries)] + 0.6 * rng.standard_normal(size=(queries, dims), dtype=np.float32)
+    return corpus, query_set
+
+
+def percentile_ms(latencies, pct):
+    return round(float(np.percentile(latencies, pct)) * 1000, 3)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+# Write results with the context needed to tell whether two runs are comparable
+def save_results(path, benchmark, args, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "benchmark": benchmark,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "machine": {
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "processor": platform.processor(),
+                "cpus": os.cpu_count(),
+            },
+            "args": vars(args),
+            "results": results,
+        }, f, indent=4)
+    print(f"[INFO] Results saved to {path}")
@@ -0,0 +1,98 @@
+"""
+Compare two benchmark result files and flag regressions
+
+Rows of the two files are matched on their identifying fields (config, backend, document, passages, ...)
+and every shared numeric metric is compared. Latencies, durations and memory count as regressions when they
+go up, throughput and recall when they go down. Exits with status 1 when any metric moved the wrong way by
+more than --threshold (a fraction, 0.10 = 10%), so it can gate a CI job.
+
+Usage:
+    python benchmarks/compare.py baseline/retrieval.json benchmarks/results/retrieval.json --threshold 0.10
+"""
+
+import argparse
+import json
+import sys
+
+KEY_FIELDS = ("benchmark", "backend", "config", "document", "passages", "batch_size")
+HIGHER_IS_BETTER = ("per_second", "qps", "recall", "overlap", "agreement")
+LOWER_IS_BETTER = ("_ms", "seconds", "rss", "bytes", "_mb", "overhead")
+
+
+def direction(metric):
+    if any(part in metric for part in HIGHER_IS_BETTER):
+        return 1
+    if any(part in metric for part in LOWER_IS_BETTER):
+        return -1
+    return 0  # informational, e.g. page counts
+
+
+def row_key(row):
+    return tuple((field, row[field]) for field in KEY_FIELDS if field in row)
+
+
+def load_rows(path):
+    with open(path) as f:
+        report = json.load(f)
+    rows = {}
+    for row in report["results"]:
+        rows[row_key(row)] = row
+    return report, rows
+
+
+def compare(baseline_rows, current_rows, threshold):
+    changes = []
+    for key, current in current_rows.items():
+        baseline = baseline_rows.get(key)
+        if baseline is None:
+            continue
+        for metric, value in current.items():
+            old = baseline.get(metric)
+            sign = direction(metric)
+            if (metric in KEY_FIELDS or sign == 0 or isinstance(value, bool)
+                    or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0):
+                continue
+            change = (value - old) / abs(old)
+            changes.append({
+                "row": ", ".join(f"{field}={value}" for field, value in key),
+                "metric": metric,
+                "baseline": old,
+                "current": value,
+                "change": change,
+                "regression": change * sign < -threshold,
+            })
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    baseline_report, baseline_rows = load_rows(args.baseline)
+    current_report, current_rows = load_rows(args.current)
+    if baseline_report.get("benchmark") != current_report.get("benchmark"):
+        print(f"[INFO] Comparing different benchmarks: {baseline_report.get('benchmark')} vs {current_report.get('benchmark')}")
+    if baseline_report.get("machine") != current_report.get("machine"):
+        print("[INFO] Results come from different machines, timings may not be comparable")
+    print(f"[INFO] Baseline commit {baseline_report.get('commit')}, current commit {current_report.get('commit')}")
+
+    changes = compare(baseline_rows, current_rows, args.threshold)
+    print(f"{'row':<44}{'metric':<20}{'baseline':>12}{'current':>12}{'change':>9}")
+    for change in changes:
+        flag = "  REGRESSION" if change["regression"] else ""
+        print(f"{change['row'][:43]:<44}{change['metric']:<20}{change['baseline']:>12}{change['current']:>12}"
+              f"{100 * change['change']:>8.1f}%{flag}")
+
+    missing = [key for key in baseline_rows if key not in current_rows]
+    if missing:
+        print(f"[INFO] {len(missing)} baseline rows have no match in the current results")
+    regressions = sum(change["regression"] for change in changes)
+    print(f"[INFO] {regressions} regressions beyond {100 * args.threshold:.0f}% in {len(changes)} compared metrics")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
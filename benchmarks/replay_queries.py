@@ -0,0 +1,178 @@
+"""
+Replay logged search traffic against a retrieval configuration
+
+Reads the query log the app writes (QUERY_LOG_PATH, ./logs/queries.jsonl inside the app container) and sends
+every logged query to /api/elastic_search again, either once against one deployment (compared with what the
+log recorded) or against two deployments / request settings side by side. Use it to try ANN storage
+(VECTOR_STORAGE), hybrid settings or caching on real traffic before rolling them out.
+
+A configuration is a search URL plus request overrides given as key=value (values parsed as JSON), e.g.
+`--set mode=hybrid candidates=500 vector_weight=0.7`. Replayed requests are sent with "log": false so they
+do not end up in the query log themselves.
+
+Reports latency p50 / p95 / p99 of each side (the log side is the server time recorded in the log, replays
+are timed by this client and include the HTTP round trip), the mean top-k overlap, top-1 agreement and which
+search path served the requests.
+
+Usage:
+    python benchmarks/replay_queries.py app/logs/queries.jsonl --set mode=hybrid
+    python benchmarks/replay_queries.py app/logs/queries.jsonl --url http://localhost:5000/api/elastic_search \\
+        --against-url http://localhost:5001/api/elastic_search
+"""
+
+import argparse
+import json
+import os
+import time
+import urllib.request
+from collections import Counter
+
+from common import RESULTS_DIR, percentile_ms, save_results
+from elastic.query_log import read_query_log
+
+DEFAULT_URL = "http://localhost:5000/api/elastic_search"
+RESULTS_PATH = os.path.join(RESULTS_DIR, "replay.json")
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+
+def load_queries(paths, limit, distinct):
+    records = []
+    seen = set()
+    for path in paths:
+        for record in read_query_log(path):
+            if not record.get("query") or record.get("error"):
+                continue
+            if distinct:
+                key = json.dumps([record["query"], record.get("filters"), record.get("mode")], sort_keys=True)
+                if key in seen:
+                    continue
+                seen.add(key)
+            records.append(record)
+    return records[:limit] if limit else records
+
+
+# One search against a configuration; returns the result ids, seconds taken and the serving path
+def search(url, record, overrides, timeout):
+    body = {
+        "user_input": record["query"],
+        "size": record.get("size", 5),
+        "mode": record.get("mode"),
+        "filters": record.get("filters"),
+        "citations": True,
+        "log": False,
+        **overrides,
+    }
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        payload = json.load(response)
+        path = response.headers.get("X-Search-Path", "unknown")
+    seconds = time.perf_counter() - start
+    if isinstance(payload, dict):
+        raise RuntimeError(payload.get("error", "unexpected response"))
+    return [hit["id"] for hit in payload], seconds, path
+
+
+def overlap(a, b):
+    if not a and not b:
+        return 1.0
+    return len(set(a) & set(b)) / max(len(a), len(b))
+
+
+def summarize(name, latencies, paths, errors):
+    return {
+        "config": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile_ms(latencies, 50) if latencies else None,
+        "p95_ms": percentile_ms(latencies, 95) if latencies else None,
+        "p99_ms": percentile_ms(latencies, 99) if latencies else None,
+        "paths": dict(paths),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="query log files, e.g. queries.jsonl.1 queries.jsonl")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--set", nargs="*", dest="overrides", metavar="KEY=VALUE", help="request overrides")
+    parser.add_argument("--against-url", help="second configuration, instead of comparing with the log")
+    parser.add_argument("--against-set", nargs="*", dest="against_overrides", metavar="KEY=VALUE")
+    parser.add_argument("--limit", type=int, help="replay at most this many queries")
+    parser.add_argument("--distinct", action="store_true", help="replay every distinct query only once")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    records = load_queries(args.logs, args.limit, args.distinct)
+    print(f"[INFO] Replaying {len(records)} logged queries")
+    overrides = parse_overrides(args.overrides)
+    compare_live = args.against_url is not None or args.against_overrides is not None
+    against_url = args.against_url or args.url
+    against_overrides = parse_overrides(args.against_overrides)
+
+    baseline_latencies, baseline_paths = [], Counter()
+    candidate_latencies, candidate_paths = [], Counter()
+    baseline_errors = candidate_errors = 0
+    overlaps = []
+    top1 = []
+    for record in records:
+        if compare_live:
+            try:
+                baseline_ids, seconds, path = search(args.url, record, overrides, args.timeout)
+                baseline_latencies.append(seconds)
+                baseline_paths[path] += 1
+            except Exception as e:
+                print(f"Error replaying {record['query']!r} against the baseline:", str(e))
+                baseline_errors += 1
+                continue
+        else:
+            baseline_ids = record.get("ids", [])
+            baseline_latencies.append(record["total_ms"] / 1000)
+            baseline_paths[record.get("path", "unknown")] += 1
+        try:
+            ids, seconds, path = search(against_url if compare_live else args.url, record,
+                                        against_overrides if compare_live else overrides, args.timeout)
+        except Exception as e:
+            print(f"Error replaying {record['query']!r}:", str(e))
+            candidate_errors += 1
+            continue
+        candidate_latencies.append(seconds)
+        candidate_paths[path] += 1
+        overlaps.append(overlap(baseline_ids, ids))
+        top1.append(bool(baseline_ids) and bool(ids) and baseline_ids[0] == ids[0])
+
+    baseline_name = f"{args.url} {overrides}" if compare_live else "query log"
+    candidate_name = f"{against_url} {against_overrides}" if compare_live else f"{args.url} {overrides}"
+    results = [
+        summarize(baseline_name, baseline_latencies, baseline_paths, baseline_errors),
+        summarize(candidate_name, candidate_latencies, candidate_paths, candidate_errors),
+    ]
+    agreement = {
+        "config": "agreement",
+        "compared": len(overlaps),
+        "mean_overlap_at_k": round(sum(overlaps) / len(overlaps), 4) if overlaps else None,
+        "top1_agreement": round(sum(top1) / len(top1), 4) if top1 else None,
+    }
+
+    print(f"{'config':<60}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in results:
+        print(f"{row['config'][:59]:<60}{row['requests']:>9}{row['errors']:>8}{str(row['p50_ms']):>10}"
+              f"{str(row['p95_ms']):>10}{str(row['p99_ms']):>10}  {row['paths']}")
+    print(f"[INFO] Top-k overlap {agreement['mean_overlap_at_k']}, top-1 agreement {agreement['top1_agreement']} "
+          f"over {agreement['compared']} queries")
+    save_results(args.output, "replay", args, results + [agreement])
+
+
+if __name__ == "__main__":
+    main()
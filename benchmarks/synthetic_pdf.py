@@ -0,0 +1,128 @@
+"""
+Synthetic technical-manual PDFs for the parser benchmark
+
+Writes deterministic PDFs of any length without extra dependencies. Each page looks like a page of the
+manuals the parser was written for: a bold heading, sub-headings and body text in different font sizes,
+a ruled table (found by pdfplumber's find_tables) and, optionally, an embedded image (an LTFigure for
+pdfminer, which sends the page through crop / rasterize / OCR).
+
+Usage:
+    python benchmarks/synthetic_pdf.py --pages 1000 --output benchmarks/results/synthetic_1000.pdf
+"""
+
+import argparse
+import random
+import zlib
+
+WORDS = (
+    "aircraft engine inspection hydraulic pressure valve assembly torque wrench panel access bolt "
+    "fuel line seal gasket install remove replace check verify ensure maintenance procedure manual "
+    "warning caution note figure table landing gear actuator cylinder pump filter electrical connector "
+    "wiring harness circuit breaker switch lever cockpit nacelle fairing rivet bracket clamp fitting"
+).split()
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+IMAGE_SIZE = 64  # pixels per side of the embedded grayscale image
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _text(x, y, font, size, text):
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"BT /{font} {size} Tf {x} {y} Td ({text}) Tj ET"
+
+
+# Drawing operators for one page
+def page_content(rng, pagenum, images):
+    ops = [_text(72, 740, "F2", 18, f"Section {pagenum + 1} {rng.choice(WORDS).capitalize()} Procedures")]
+    y = 710
+    for _ in range(3):
+        ops.append(_text(72, y, "F2", 12, f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}"))
+        y -= 16
+        for _ in range(4):
+            ops.append(_text(72, y, "F1", 10, _sentence(rng, 12)))
+            y -= 13
+        y -= 8
+
+    # 4 x 3 ruled table
+    rows, cols, cell_w, cell_h = 4, 3, 150, 18
+    top = y - 10
+    ops.append("0.5 w")
+    for row in range(rows + 1):
+        ops.append(f"72 {top - row * cell_h} m {72 + cols * cell_w} {top - row * cell_h} l S")
+    for col in range(cols + 1):
+        ops.append(f"{72 + col * cell_w} {top} m {72 + col * cell_w} {top - rows * cell_h} l S")
+    for row in range(rows):
+        for col in range(cols):
+            ops.append(_text(76 + col * cell_w, top - (row + 1) * cell_h + 5, "F1", 9,
+                             f"{rng.choice(WORDS)} {rng.randint(1, 999)}"))
+    y = top - rows * cell_h - 20
+
+    if images:
+        ops.append(f"q 160 0 0 120 72 {y - 120} cm /Im1 Do Q")
+        y -= 140
+    while y > 72:
+        ops.append(_text(72, y, "F1", 10, _sentence(rng, 12)))
+        y -= 13
+    return "\n".join(ops).encode("latin-1")
+
+
+def _image_stream():
+    pixels = bytes((x * 4 + y * 2) % 256 for y in range(IMAGE_SIZE) for x in range(IMAGE_SIZE))
+    data = zlib.compress(pixels)
+    header = (f"<< /Type /XObject /Subtype /Image /Width {IMAGE_SIZE} /Height {IMAGE_SIZE} "
+              f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>")
+    return header.encode() + b"\nstream\n" + data + b"\nendstream"
+
+
+def write_pdf(path, pages, images=True, seed=0):
+    rng = random.Random(seed)
+    # 1 catalog, 2 pages, 3-4 fonts, 5 image, then a (page, content) pair per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>",
+        _image_stream(),
+    ]
+    resources = "<< /Font << /F1 3 0 R /F2 4 0 R >> /XObject << /Im1 5 0 R >> >>"
+    kids = []
+    for pagenum in range(pages):
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                       f"/Resources {resources} /Contents {page_id + 1} 0 R >>".encode())
+        content = zlib.compress(page_content(rng, pagenum, images))
+        objects.append(f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode()
+                       + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--no-images", action="store_true", help="leave out the embedded image (no OCR work)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    write_pdf(args.output, args.pages, not args.no_images, args.seed)
+    print(f"[INFO] Wrote {args.pages} pages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
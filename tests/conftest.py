@@ -0,0 +1,154 @@
+"""
+Shared fixtures: the app's search and upload modules running against an in-memory Elasticsearch and a
+deterministic encoder, in a scratch copy of the app's data directory
+"""
+
+import copy
+import hashlib
+import json
+import os
+import shutil
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from elasticsearch.serializer import JSONSerializer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+sys.path.insert(0, APP_DIR)
+
+
+# The parts of the Elasticsearch 7 client the app and its bulk/scan helpers call, over a dict of documents
+class MemoryElasticsearch:
+    def __init__(self, *args, **kwargs):
+        self.docs = {}
+        self.indices = MemoryIndices()
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+
+    def bulk(self, body, **kwargs):
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = []
+        while lines:
+            (op, meta), = lines.pop(0).items()
+            doc_id = meta["_id"]
+            source = lines.pop(0) if op in ("index", "create", "update") else None
+            status = 200
+            if op == "create" and doc_id in self.docs:
+                status = 409
+            elif op in ("update", "delete") and doc_id not in self.docs:
+                status = 404
+            elif op == "update":
+                self.docs[doc_id].update(source["doc"])
+            elif op == "delete":
+                del self.docs[doc_id]
+            else:
+                self.docs[doc_id] = source
+            item = {"_id": doc_id, "status": status}
+            if status >= 300:
+                item["error"] = {"type": "version_conflict_engine_exception" if status == 409 else "not_found"}
+            items.append({op: item})
+        return {"errors": any(next(iter(item.values()))["status"] >= 300 for item in items), "items": items}
+
+    def search(self, body=None, _source=True, **kwargs):
+        query = (body or {}).get("query", {"match_all": {}})
+        hits = [{"_id": doc_id, **({"_source": copy.deepcopy(doc)} if _source is not False else {})}
+                for doc_id, doc in self.docs.items() if matches(doc, query)]
+        return {"_scroll_id": "scroll", "_shards": {"total": 1, "successful": 1, "skipped": 0},
+                "hits": {"hits": hits}}
+
+    def scroll(self, **kwargs):
+        return {"_scroll_id": None, "_shards": {"total": 1, "successful": 1, "skipped": 0}, "hits": {"hits": []}}
+
+    def clear_scroll(self, **kwargs):
+        pass
+
+    def mget(self, body, _source_includes=None, **kwargs):
+        docs = []
+        for doc_id in body["ids"]:
+            doc = self.docs.get(doc_id)
+            if doc is None:
+                docs.append({"_id": doc_id, "found": False})
+                continue
+            source = {field: value for field, value in doc.items()
+                      if _source_includes is None or field in _source_includes}
+            docs.append({"_id": doc_id, "found": True, "_source": copy.deepcopy(source)})
+        return {"docs": docs}
+
+    def count(self, **kwargs):
+        return {"count": len(self.docs)}
+
+
+class MemoryIndices:
+    def exists(self, **kwargs):
+        return False
+
+    def create(self, **kwargs):
+        pass
+
+    def put_mapping(self, **kwargs):
+        pass
+
+    def refresh(self, **kwargs):
+        pass
+
+
+def field_values(doc, field):
+    if field.startswith("locations."):
+        return [location.get(field[len("locations."):]) for location in doc.get("locations") or []]
+    return [doc.get(field)]
+
+
+# match_all and the bool/term queries the app scans with
+def matches(doc, query):
+    if "match_all" in query:
+        return True
+    if "term" in query:
+        (field, value), = query["term"].items()
+        return value in field_values(doc, field)
+    clauses = query["bool"]
+    if "should" in clauses and not any(matches(doc, clause) for clause in clauses["should"]):
+        return False
+    return all(matches(doc, clause) for clause in clauses.get("filter", []))
+
+
+# Same text, same vector: a seeded random unit vector per text
+class HashEncoder:
+    name = "hash"
+    concurrency = 1
+
+    def encode(self, texts):
+        vectors = [np.random.default_rng(int(hashlib.sha256(text.encode()).hexdigest()[:16], 16)).standard_normal(768)
+                   for text in texts]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), 768)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-9)
+
+    def token_lengths(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def close(self):
+        pass
+
+
+# elastic.semantic and elastic.ingest, imported once with the int8 quantized search, indexing the bundled manual
+# at import as the app does at startup
+@pytest.fixture(scope="session")
+def app_modules(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("app")
+    os.makedirs(workdir / "data")
+    shutil.copy(os.path.join(APP_DIR, "data", "extracted_data.json"), workdir / "data")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    os.environ.update({"VECTOR_STORAGE": "int8", "QUERY_LOG": "false", "NEAR_DUPLICATES": "true"})
+    import elasticsearch
+    from elastic import encoders
+    patch = pytest.MonkeyPatch()
+    patch.setattr(elasticsearch, "Elasticsearch", MemoryElasticsearch)
+    patch.setattr(encoders, "create_encoder", lambda backend: HashEncoder())
+    try:
+        from elastic import semantic, ingest
+        yield semantic, ingest
+    finally:
+        patch.undo()
+        os.chdir(previous_dir)
@@ -0,0 +1,52 @@
+"""
+Near-duplicate collapse: copies within a document that differ in whitespace, hyphenation or a date are one
+passage, passages whose numbers differ or that come from different manuals are not
+"""
+
+from elastic.near_duplicates import collapse_near_duplicates
+
+PROCEDURE = ("Install the retaining bolt through the actuator lug and torque it to {torque} in-lb, then safety wire "
+             "the bolt head to the adjacent bracket and inspect the installation for freedom of movement.")
+
+
+def passage(text, document_url="manual-a.pdf", page_number=1):
+    return {"text": text, "document_url": document_url, "document_title": document_url, "page_number": page_number,
+            "traceability": {"source": "", "manual_reference": "", "exact_location": ""}}
+
+
+def test_passages_differing_only_in_a_number_both_survive():
+    passages = [passage(PROCEDURE.format(torque=25), page_number=1),
+                passage(PROCEDURE.format(torque=35), page_number=2)]
+    canonical, collapsed = collapse_near_duplicates(passages)
+    assert collapsed == 0
+    assert [p["text"] for p in canonical] == [p["text"] for p in passages]
+
+
+def test_part_numbers_are_numbers():
+    text = PROCEDURE.format(torque=25) + " Use bolt P/N MS20995C{}."
+    canonical, _ = collapse_near_duplicates([passage(text.format(32)), passage(text.format(41), page_number=2)])
+    assert len(canonical) == 2
+
+
+def test_changed_date_and_whitespace_collapse_within_a_document():
+    first = passage(PROCEDURE.format(torque=25) + " Revised 12 May 2023.", page_number=1)
+    second = passage(PROCEDURE.format(torque=25).replace(" the ", "  the ") + " Revised 3 June 2024.", page_number=2)
+    canonical, collapsed = collapse_near_duplicates([first, second])
+    assert collapsed == 1
+    assert [location["page_number"] for location in canonical[0]["locations"]] == [1, 2]
+
+
+def test_near_copies_in_different_manuals_stay_apart():
+    a = passage(PROCEDURE.format(torque=25) + " Revised 12 May 2023.", "manual-a.pdf")
+    b = passage(PROCEDURE.format(torque=25) + " Revised 3 June 2024.", "manual-b.pdf")
+    canonical, collapsed = collapse_near_duplicates([a, b])
+    assert collapsed == 0
+    assert [p["document_url"] for p in canonical] == ["manual-a.pdf", "manual-b.pdf"]
+
+
+def test_identical_texts_in_different_manuals_are_one_passage():
+    text = PROCEDURE.format(torque=25)
+    canonical, collapsed = collapse_near_duplicates([passage(text, "manual-a.pdf"), passage(text, "manual-b.pdf")])
+    assert collapsed == 1
+    assert canonical[0]["document_url"] == "manual-b.pdf"
+    assert {location["document_url"] for location in canonical[0]["locations"]} == {"manual-a.pdf", "manual-b.pdf"}
@@ -0,0 +1,58 @@
+"""
+The parser's streamed page records, with page workers running, each arrive as one valid JSON line
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pdfplumber")
+pytest.importorskip("pytesseract")
+pytest.importorskip("pdf2image")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARSER = os.path.join(ROOT, "utils", "pdf_parser_json_printing.py")
+MANUAL = os.path.join(ROOT, "app", "data", "00-25-195.pdf")
+PAGE_RECORD = "[PAGE] "
+
+
+def run_parser(workdir, pages_fd=None, stderr=subprocess.STDOUT):
+    os.makedirs(os.path.join(workdir, "app", "data"), exist_ok=True)
+    env = {**os.environ, "PARSER_MEMORY_CEILING_MB": "1024", "PARSER_EMIT_PAGES": "true"}
+    if pages_fd is not None:
+        env["PARSER_PAGES_FD"] = str(pages_fd)
+    return subprocess.Popen([sys.executable, PARSER, MANUAL], cwd=workdir, env=env,
+                            pass_fds=(pages_fd,) if pages_fd is not None else (),
+                            stdout=subprocess.PIPE, stderr=stderr, text=True)
+
+
+def parse_records(lines):
+    records = [line for line in lines if line.startswith(PAGE_RECORD)]
+    return [json.loads(line[len(PAGE_RECORD):]) for line in records]
+
+
+def expected_pages(workdir):
+    with open(os.path.join(workdir, "app", "data", "extracted_data.json")) as f:
+        return json.load(f)
+
+
+def test_pages_fd_carries_every_page(tmp_path):
+    pages_read, pages_write = os.pipe()
+    process = run_parser(str(tmp_path), pages_write)
+    os.close(pages_write)
+    with open(pages_read) as pages:
+        records = parse_records(pages)
+    output = process.stdout.read()
+    assert process.wait() == 0, output
+    assert PAGE_RECORD not in output
+    assert records == expected_pages(str(tmp_path))
+
+
+def test_stdout_records_are_not_interleaved_with_worker_output(tmp_path):
+    process = run_parser(str(tmp_path), stderr=subprocess.DEVNULL)
+    records = parse_records(process.stdout)
+    assert process.wait() == 0
+    assert records == expected_pages(str(tmp_path))
@@ -0,0 +1,84 @@
+"""
+An upload that shares a passage with an older manual keeps that passage searchable under the older manual
+"""
+
+import json
+import os
+
+import pytest
+
+
+def parser_pages(document_url, texts):
+    return [{"document_url": document_url, "document_title": "Uploaded manual", "page_number": str(page),
+             "subheader": {"Body": text},
+             "traceability": {"source": "upload", "manual_reference": "", "exact_location": ""}}
+            for page, text in enumerate(texts, start=1)]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_quantized_document_filter_keeps_shared_passage(app_modules, monkeypatch, streaming):
+    semantic, ingest = app_modules
+    bundled = semantic.load_data(semantic.BUNDLED_DATA)
+    shared = bundled[5]
+    shared_id = semantic.passage_id(shared["text"])
+    own_text = f"Torque the upload-only fastener ({'streaming' if streaming else 'batch'})."
+
+    job = ingest.new_job("manual.pdf", f"manual-{streaming}")
+    job_dir = os.path.join(semantic.UPLOAD_DIR, job["job_id"])
+    os.makedirs(job_dir)
+
+    def run_parser(job, job_dir, filename, previous, stream_pages=False):
+        pages = parser_pages(filename, [shared["text"], own_text])
+        os.makedirs(os.path.dirname(ingest.extracted_path(job_dir)), exist_ok=True)
+        with open(ingest.extracted_path(job_dir), "w") as f:
+            json.dump(pages, f)
+        ingest.update(job, pages_total=len(pages))
+        if stream_pages:
+            yield from pages
+
+    monkeypatch.setattr(ingest, "run_parser", run_parser)
+    monkeypatch.setattr(ingest, "STREAMING_INGEST", streaming)
+    ingest._slots.acquire()
+    ingest.run_job(job, job_dir, "manual.pdf")
+    assert job["status"] == "done", job["error"]
+
+    # the upload is the newest copy, the bundled manual is one of its locations
+    indexed = semantic.es.mget(index=semantic.INDEX_NAME, body={"ids": [shared_id]})["docs"][0]["_source"]
+    assert indexed["document_url"] == os.path.join(semantic.UPLOAD_DIR, job["job_id"], "manual.pdf")
+    assert shared["document_url"] in [location["document_url"] for location in indexed["locations"]]
+
+    embedding = semantic.encoder.encode([shared["text"]])[0]
+    candidates = semantic.quantized_candidates(embedding, 5, {"document": shared["document_url"]})
+    assert shared_id in [doc_id for doc_id, _ in candidates]
+    own = semantic.quantized_candidates(semantic.encoder.encode([own_text])[0], 5, {"document": indexed["document_url"]})
+    assert semantic.passage_id(own_text) in [doc_id for doc_id, _ in own]
+
+
+def test_upload_indexes_what_a_restart_would(app_modules, monkeypatch):
+    semantic, ingest = app_modules
+    bundled = semantic.load_data(semantic.BUNDLED_DATA)
+    # a near-duplicate of a bundled passage and two near-duplicates of each other
+    near_bundled = "  ".join(bundled[7]["text"].split(" "))
+    own_text = "Inspect the hydraulic reservoir sight glass for fluid level before every flight and record it."
+    texts = [near_bundled, own_text, own_text.replace("record it", "record  it")]
+
+    job = ingest.new_job("revision.pdf", "revision")
+    job_dir = os.path.join(semantic.UPLOAD_DIR, job["job_id"])
+    os.makedirs(job_dir)
+
+    def run_parser(job, job_dir, filename, previous, stream_pages=False):
+        pages = parser_pages(filename, texts)
+        os.makedirs(os.path.dirname(ingest.extracted_path(job_dir)), exist_ok=True)
+        with open(ingest.extracted_path(job_dir), "w") as f:
+            json.dump(pages, f)
+        ingest.update(job, pages_total=len(pages))
+        if stream_pages:
+            yield from pages
+
+    monkeypatch.setattr(ingest, "run_parser", run_parser)
+    ingest._slots.acquire()
+    ingest.run_job(job, job_dir, "revision.pdf")
+    assert job["status"] == "done", job["error"]
+
+    restart, _ = semantic.collapse_passages(semantic.load_data(semantic.BUNDLED_DATA) + semantic.load_uploaded_passages())
+    assert set(semantic.es.docs) == {semantic.passage_id(passage["text"]) for passage in restart}
@@ -0,0 +1,208 @@
+"""
+Persistent cache of pdfminer's layout analysis for the PDF parser.
+
+Layout analysis (extract_pages) is the slowest step of the parser and its result only depends on the PDF,
+the page and the LAParams, not on the classification rules applied to it afterwards. Each analyzed page is
+stored on disk in a compact form (text boxes, lines, characters with an interned font table, figures,
+images and rulings with their bounding boxes) under
+
+    <cache dir>/<sha256 of the PDF>/<hash of LAParams and pdfminer version>/page_<n>.pkl
+
+and rebuilt into pdfminer layout objects on the next run, so isinstance checks, get_text(), fontname, size
+and bboxes behave as before while the layout step is skipped. Pages holding an object the compact form does
+not know are simply not cached.
+
+Pages can be analyzed from an open PdfDocument (see pdf_document.py), which also provides the hash, so the PDF
+is not opened and parsed again for the cache.
+
+Usage:
+    cache = LayoutCache("./app/data/layout_cache")
+    for page in cache.pages(pdf_path, page_numbers, document):
+        ...
+    cache.report()
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import pdfminer
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import (
+    LAParams, LTPage, LTComponent, LTTextBoxHorizontal, LTTextBoxVertical, LTTextLineHorizontal,
+    LTTextLineVertical, LTChar, LTAnno, LTFigure, LTImage, LTRect, LTLine, LTCurve,
+)
+from pdfminer.pdfpage import PDFPage
+
+CACHE_FORMAT = 1  # bump when the compact form changes, old entries are then never read
+HASH_CHUNK_BYTES = 1 << 20
+
+# Tags of the compact form, in isinstance order (LTRect and LTLine are LTCurve subclasses)
+CONTAINERS = (("box_h", LTTextBoxHorizontal), ("box_v", LTTextBoxVertical),
+              ("line_h", LTTextLineHorizontal), ("line_v", LTTextLineVertical))
+SHAPES = (("rect", LTRect), ("ruling", LTLine), ("curve", LTCurve))
+CLASSES = dict(CONTAINERS + SHAPES + (("figure", LTFigure), ("image", LTImage)))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def laparams_key(laparams):
+    params = json.dumps({"laparams": vars(laparams), "pdfminer": pdfminer.__version__, "format": CACHE_FORMAT},
+                        sort_keys=True, default=str)
+    return hashlib.sha256(params.encode()).hexdigest()[:16]
+
+
+class UncachableLayout(Exception):
+    pass
+
+
+# Layout object -> nested tuples of plain values, font names replaced by their index in fonts
+def _encode(obj, fonts):
+    if isinstance(obj, LTChar):
+        if obj.fontname not in fonts:
+            fonts[obj.fontname] = len(fonts)
+        return ("char", obj.get_text(), fonts[obj.fontname], obj.size, obj.bbox)
+    if isinstance(obj, LTAnno):
+        return ("anno", obj.get_text())
+    for tag, cls in CONTAINERS:
+        if isinstance(obj, cls):
+            return (tag, obj.bbox, [_encode(child, fonts) for child in obj])
+    if isinstance(obj, LTFigure):
+        return ("figure", obj.bbox, [_encode(child, fonts) for child in obj], obj.name)
+    if isinstance(obj, LTImage):
+        return ("image", obj.bbox, obj.name)
+    for tag, cls in SHAPES:
+        if isinstance(obj, cls):
+            return (tag, obj.bbox, obj.pts)
+    raise UncachableLayout(type(obj).__name__)
+
+
+# Rebuild a layout object without running pdfminer's constructors, which need the fonts and content streams
+def _decode(node, fonts):
+    tag = node[0]
+    if tag == "anno":
+        return LTAnno(node[1])
+    if tag == "char":
+        obj = LTChar.__new__(LTChar)
+        LTComponent.__init__(obj, node[4])
+        obj._text = node[1]
+        obj.fontname = fonts[node[2]]
+        obj.size = node[3]
+        return obj
+    cls = CLASSES[tag]
+    obj = cls.__new__(cls)
+    LTComponent.__init__(obj, node[1])
+    if tag == "image":
+        obj.name = node[2]
+    elif tag in ("rect", "ruling", "curve"):
+        obj.pts = node[2]
+    else:
+        obj._objs = [_decode(child, fonts) for child in node[2]]
+        if tag == "figure":
+            obj.name = node[3]
+    return obj
+
+
+def encode_page(page):
+    fonts = {}
+    objs = [_encode(obj, fonts) for obj in page]
+    return (CACHE_FORMAT, page.pageid, page.bbox, page.rotate, list(fonts), objs)
+
+
+def decode_page(data):
+    _, pageid, bbox, rotate, fonts, objs = data
+    page = LTPage(pageid, bbox, rotate)
+    page._objs = [_decode(node, fonts) for node in objs]
+    return page
+
+
+class LayoutCache:
+    def __init__(self, directory="./app/data/layout_cache", laparams=None, enabled=True):
+        self.directory = directory
+        self.laparams = laparams or LAParams()
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.uncachable = 0
+        self._pdf_hashes = {}
+
+    def _page_path(self, pdf_path, pagenum, document=None):
+        if pdf_path not in self._pdf_hashes:
+            self._pdf_hashes[pdf_path] = document.sha256() if document is not None else file_sha256(pdf_path)
+        return os.path.join(self.directory, self._pdf_hashes[pdf_path], laparams_key(self.laparams),
+                            f"page_{pagenum}.pkl")
+
+    def load(self, pdf_path, pagenum, document=None):
+        try:
+            with open(self._page_path(pdf_path, pagenum, document), "rb") as f:
+                return decode_page(pickle.load(f))
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, KeyError, IndexError):
+            return None
+
+    def store(self, pdf_path, pagenum, page, document=None):
+        try:
+            data = encode_page(page)
+        except UncachableLayout as e:
+            print(f"[DEBUG] Layout of page {pagenum + 1} not cached, unsupported object {e}")
+            self.uncachable += 1
+            return
+        path = self._page_path(pdf_path, pagenum, document)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, an interrupted run never leaves a truncated entry behind
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    # Layout of the given 0 based pages (all pages when None), in page order. Cached pages are read back one
+    # at a time as they are reached, the others go through a single layout pass and are stored on the way.
+    def pages(self, pdf_path, page_numbers=None, document=None):
+        if page_numbers is None:
+            if document is not None:
+                page_numbers = range(document.page_count())
+            else:
+                with open(pdf_path, "rb") as f:
+                    page_numbers = range(sum(1 for _ in PDFPage.get_pages(f)))
+        if not self.enabled:
+            yield from self._analyze(pdf_path, page_numbers, document)
+            return
+        page_numbers = sorted(set(page_numbers))
+        missing = [pagenum for pagenum in page_numbers
+                   if not os.path.isfile(self._page_path(pdf_path, pagenum, document))]
+        analyzed = self._analyze(pdf_path, missing, document) if missing else iter(())
+        missing = set(missing)
+        for pagenum in page_numbers:
+            page = None if pagenum in missing else self.load(pdf_path, pagenum, document)
+            if page is not None:
+                self.hits += 1
+                yield page
+                continue
+            if pagenum in missing:
+                page = next(analyzed)
+            else:  # unreadable entry, analyze that page again
+                page = next(self._analyze(pdf_path, [pagenum], document))
+            self.misses += 1
+            self.store(pdf_path, pagenum, page, document)
+            yield page
+
+    def _analyze(self, pdf_path, page_numbers, document):
+        if document is not None:
+            return document.page_layouts(page_numbers, self.laparams)
+        return extract_pages(pdf_path, page_numbers=page_numbers, laparams=self.laparams)
+
+    def merge(self, other):
+        self.hits += other.hits
+        self.misses += other.misses
+        self.uncachable += other.uncachable
+
+    def summary(self):
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses, "uncachable": self.uncachable}
+
+    def report(self):
+        print(f"[INFO] Layout cache: {self.hits} pages read from {self.directory}, "
+              f"{self.misses} analyzed ({self.uncachable} not cacheable)")
@@ -0,0 +1,135 @@
+"""
+OCR front end for the figures of the PDF parser.
+
+Chooses how (and whether) a cropped figure is rasterized and handed to Tesseract, from the size of its bounding
+box in PDF points:
+- figures under a minimum area or side (icons, bullets, symbols) are not OCRed at all
+- figures are rasterized at DEFAULT_DPI (200, pdf2image's default and what the parser always used), except
+  large diagrams, whose DPI is lowered to stay within MAX_FIGURE_PIXELS, and thin strips, whose DPI is raised
+  until their short side spans MIN_STRIP_PIXELS (about one line of text at a readable glyph height); always
+  within [MIN_DPI, MAX_DPI]
+- the image is rasterized in grayscale, contrast stretched and binarized with Otsu's threshold
+- the Tesseract page segmentation mode follows the shape: a single line for wide short strips, sparse text
+  for large diagrams with scattered callouts, a uniform block otherwise
+
+Usage:
+    if should_ocr(width, height):
+        dpi = choose_dpi(width, height)
+        text = recognize(rasterized_image, width, height)
+"""
+
+import numpy as np
+import pytesseract
+from PIL import Image, ImageOps
+
+MIN_OCR_AREA = 1600  # square points (e.g. 40 x 40 pt), smaller figures are icons and symbols
+MIN_OCR_SIDE = 10  # points, thinner figures are rules and borders
+DEFAULT_DPI = 200
+MIN_DPI = 150
+MAX_DPI = 300
+MAX_FIGURE_PIXELS = 4_000_000  # a full page figure at DEFAULT_DPI is 3.7 MP, larger diagrams get a lower DPI
+MIN_STRIP_PIXELS = 40  # short side of the rasterized figure, thin label strips get a higher DPI to reach it
+LINE_MIN_ASPECT = 5.0  # width / height from which a short figure is read as one line of text
+LINE_MAX_HEIGHT = 36  # points
+SPARSE_MIN_AREA = 250 * 250  # square points from which a figure is treated as a diagram with scattered labels
+PSM_SINGLE_LINE = 7
+PSM_BLOCK = 6
+PSM_SPARSE = 11
+FULL_PAGE_DPI = 300  # scanned pages, Tesseract picks the page layout itself (automatic segmentation)
+
+
+def should_ocr(width, height):
+    return width * height >= MIN_OCR_AREA and min(width, height) >= MIN_OCR_SIDE
+
+
+def choose_dpi(width, height):
+    dpi = DEFAULT_DPI
+    if width * height * (dpi / 72) ** 2 > MAX_FIGURE_PIXELS:
+        dpi = 72 * (MAX_FIGURE_PIXELS / (width * height)) ** 0.5
+    elif min(width, height) * dpi / 72 < MIN_STRIP_PIXELS:
+        dpi = 72 * MIN_STRIP_PIXELS / max(min(width, height), 1)
+    return int(max(MIN_DPI, min(MAX_DPI, dpi)))
+
+
+def choose_psm(width, height):
+    if height <= LINE_MAX_HEIGHT and width / max(height, 1) >= LINE_MIN_ASPECT:
+        return PSM_SINGLE_LINE
+    if width * height >= SPARSE_MIN_AREA:
+        return PSM_SPARSE
+    return PSM_BLOCK
+
+
+# Threshold that best separates the two modes of a grayscale histogram
+def otsu_threshold(pixels):
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    total = histogram.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_dark = np.cumsum(histogram)
+    weight_light = total - weight_dark
+    mean_dark = np.cumsum(histogram * levels) / np.maximum(weight_dark, 1)
+    mean_light = ((histogram * levels).sum() - np.cumsum(histogram * levels)) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(np.argmax(between))
+
+
+# Grayscale, stretch the contrast and binarize to black text on white
+def preprocess(image):
+    gray = ImageOps.autocontrast(image.convert("L"))
+    pixels = np.asarray(gray)
+    threshold = otsu_threshold(pixels)
+    binary = np.where(pixels > threshold, 255, 0).astype(np.uint8)
+    # keep the text dark: if most of the image came out black it was light text on a dark background
+    if binary.mean() < 127:
+        binary = 255 - binary
+    return Image.fromarray(binary)
+
+
+def tesseract_config(width, height):
+    return f"--psm {choose_psm(width, height)}"
+
+
+# OCR a rasterized figure whose bounding box is width x height points
+def recognize(image, width, height):
+    return pytesseract.image_to_string(preprocess(image), config=tesseract_config(width, height))
+
+
+# OCR a whole scanned page rasterized at FULL_PAGE_DPI
+def recognize_page(image):
+    return pytesseract.image_to_string(preprocess(image))
+
+
+# What the front end did over a whole document
+class OcrStats:
+    def __init__(self):
+        self.figures = 0
+        self.skipped_small = 0
+        self.dpi = {}
+        self.psm = {}
+
+    def record(self, width, height):
+        self.figures += 1
+        if not should_ocr(width, height):
+            self.skipped_small += 1
+            return
+        dpi = choose_dpi(width, height)
+        psm = choose_psm(width, height)
+        self.dpi[dpi] = self.dpi.get(dpi, 0) + 1
+        self.psm[psm] = self.psm.get(psm, 0) + 1
+
+    def merge(self, other):
+        self.figures += other.figures
+        self.skipped_small += other.skipped_small
+        for counts, other_counts in ((self.dpi, other.dpi), (self.psm, other.psm)):
+            for key, count in other_counts.items():
+                counts[key] = counts.get(key, 0) + count
+
+    def summary(self):
+        return {"figures": self.figures, "skipped_small": self.skipped_small,
+                "dpi": {str(dpi): count for dpi, count in sorted(self.dpi.items())},
+                "psm": {str(psm): count for psm, count in sorted(self.psm.items())}}
+
+    def report(self):
+        print(f"[INFO] OCR front end: {self.skipped_small} of {self.figures} figures below the size threshold, "
+              f"DPI used {self.summary()['dpi']}, page segmentation modes {self.summary()['psm']}")
@@ -0,0 +1,121 @@
+"""
+Cheap page triage for the PDF parser.
+
+Before the expensive extractors run, each page is classified from the layout objects pdfminer has already
+produced (no extra parsing): how much text layer it has, how many ruling lines / rectangles it draws and how
+much of it is covered by raster images. From that:
+- table detection (pdfplumber find_tables) only runs on pages that draw at least one ruling or rectangle
+- a figure is only cropped and OCRed when it holds a raster image, or when the page has no text layer;
+  vector drawings on a page with text carry no text OCR could add
+- pages with (almost) no text layer that are mostly raster image are scanned pages and go to full-page OCR
+
+Usage:
+    triage = PageTriage(page)
+    stats.record(triage)
+    if triage.run_tables: ...
+"""
+
+from pdfminer.layout import LTTextContainer, LTFigure, LTImage, LTCurve
+
+TABLE_MIN_RULINGS = 1  # lines, rectangles and curves needed before table detection is worth running
+TEXT_LAYER_MIN_CHARS = 20  # fewer extracted characters than this and the page has no usable text layer
+SCANNED_MIN_IMAGE_COVERAGE = 0.5  # share of the page covered by raster images for a page to count as scanned
+
+
+def _area(element):
+    return max(element.x1 - element.x0, 0) * max(element.y1 - element.y0, 0)
+
+
+# Every layout object inside a figure, figures can nest
+def _walk(element):
+    yield element
+    if isinstance(element, LTFigure):
+        for child in element:
+            yield from _walk(child)
+
+
+class PageTriage:
+    def __init__(self, page, enabled=True):
+        self.enabled = enabled
+        self.text_chars = 0
+        self.rulings = 0  # LTLine and LTRect are LTCurve subclasses
+        self.figures = []
+        self._raster_figures = set()
+        text_area = 0.0
+        image_area = 0.0
+        for element in page:
+            if isinstance(element, LTTextContainer):
+                self.text_chars += len(element.get_text().strip())
+                text_area += _area(element)
+            elif isinstance(element, LTFigure):
+                self.figures.append(element)
+                for child in _walk(element):
+                    if isinstance(child, LTImage):
+                        image_area += _area(child)
+                        self._raster_figures.add(id(element))
+                    elif isinstance(child, LTCurve):
+                        self.rulings += 1
+            elif isinstance(element, LTImage):
+                image_area += _area(element)
+            elif isinstance(element, LTCurve):
+                self.rulings += 1
+        page_area = max(_area(page), 1.0)
+        self.text_coverage = min(text_area / page_area, 1.0)
+        self.image_coverage = min(image_area / page_area, 1.0)
+        self.has_text_layer = self.text_chars >= TEXT_LAYER_MIN_CHARS
+
+        if not enabled:
+            self.full_page_ocr = False
+            self.run_tables = True
+        else:
+            self.full_page_ocr = not self.has_text_layer and self.image_coverage >= SCANNED_MIN_IMAGE_COVERAGE
+            self.run_tables = not self.full_page_ocr and self.rulings >= TABLE_MIN_RULINGS
+
+    # Whether a figure of this page should be cropped, rasterized and OCRed
+    def ocr_figure(self, figure):
+        if not self.enabled:
+            return True
+        if self.full_page_ocr:
+            return False  # the whole page is OCRed once instead
+        return id(figure) in self._raster_figures or not self.has_text_layer
+
+
+# Counts of the extractor invocations triage let through or skipped over a whole document
+class TriageStats:
+    def __init__(self):
+        self.pages = 0
+        self.table_detection = {"run": 0, "skipped": 0}
+        self.figure_ocr = {"run": 0, "skipped": 0}
+        self.full_page_ocr = 0
+
+    def record(self, triage):
+        ocr_figures = sum(triage.ocr_figure(figure) for figure in triage.figures)
+        self.pages += 1
+        self.table_detection["run" if triage.run_tables else "skipped"] += 1
+        self.figure_ocr["run"] += ocr_figures
+        self.figure_ocr["skipped"] += len(triage.figures) - ocr_figures
+        self.full_page_ocr += int(triage.full_page_ocr)
+
+    # Add the counts of another run, e.g. of a worker process
+    def merge(self, other):
+        self.pages += other.pages
+        for counts, other_counts in ((self.table_detection, other.table_detection), (self.figure_ocr, other.figure_ocr)):
+            for key in counts:
+                counts[key] += other_counts[key]
+        self.full_page_ocr += other.full_page_ocr
+
+    def summary(self):
+        return {
+            "pages": self.pages,
+            "table_detection": dict(self.table_detection),
+            "figure_ocr": dict(self.figure_ocr),
+            "full_page_ocr": self.full_page_ocr,
+            "skipped_invocations": self.table_detection["skipped"] + self.figure_ocr["skipped"],
+        }
+
+    def report(self):
+        print(f"[INFO] Page triage over {self.pages} pages: "
+              f"table detection skipped on {self.table_detection['skipped']} of {self.pages} pages, "
+              f"figure OCR skipped for {self.figure_ocr['skipped']} of "
+              f"{self.figure_ocr['run'] + self.figure_ocr['skipped']} figures, "
+              f"{self.full_page_ocr} scanned pages sent to full-page OCR")
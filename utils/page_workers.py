@@ -0,0 +1,123 @@
+"""
+Memory ceiling for the PDF parser through recycled worker processes.
+
+The PDF libraries cache what they parse (pdfminer's document object cache, PyPDF2's resolved objects,
+pdfplumber's page objects) for as long as the document stays open, so a single process working through a
+2,000 page manual keeps growing. PageWorkers runs the per-page work in a forked worker process instead, and
+the worker hands every page result back to the parent as soon as it is done. Once the worker's resident memory
+passes the ceiling it finishes the page at hand and exits, and a fresh worker (with the documents opened anew,
+caches empty) takes over at the next page. The parent only ever holds the page being passed through.
+
+Without a ceiling, or where processes cannot be forked (Windows), the work runs in the calling process.
+
+Usage:
+    workers = PageWorkers(ceiling_mb=1024, reset=reset_stats, collect=collect_stats, merge=merge_stats)
+    for pagenum, result in workers.map(process_pages, page_numbers):
+        ...
+    workers.report()
+"""
+
+import multiprocessing
+import traceback
+from parser_profiler import current_rss_bytes
+
+
+class WorkerFailed(Exception):
+    pass
+
+
+class PageWorkers:
+    # reset() runs in a new worker before it starts, collect() in the worker when it is done and returns
+    # something picklable (e.g. its counters) that merge() receives in the parent
+    def __init__(self, ceiling_mb=0, reset=None, collect=None, merge=None):
+        self.ceiling_bytes = ceiling_mb * 2 ** 20
+        self.reset = reset
+        self.collect = collect
+        self.merge = merge
+        self.workers = 0
+        self.recycled = 0
+        self.peak_worker_rss = 0
+        self._context = None
+        if ceiling_mb:
+            try:
+                self._context = multiprocessing.get_context("fork")
+            except ValueError:
+                print("[INFO] Worker processes need fork, pages are processed in this process without a memory ceiling")
+
+    # work(pagenums) is a generator yielding (pagenum, result) for the given pages in order
+    def map(self, work, pagenums):
+        pagenums = list(pagenums)
+        if self._context is None:
+            yield from work(pagenums)
+            return
+        while pagenums:
+            receiver, sender = self._context.Pipe(duplex=False)
+            process = self._context.Process(target=self._run, args=(work, pagenums, sender), daemon=True)
+            process.start()
+            sender.close()
+            self.workers += 1
+            done = 0
+            last = None
+            try:
+                while True:
+                    try:
+                        kind, payload = receiver.recv()
+                    except EOFError:
+                        process.join()
+                        raise WorkerFailed(f"page worker exited with code {process.exitcode} "
+                                           f"before finishing page {pagenums[done] + 1}")
+                    if kind == "result":
+                        done += 1
+                        if done < len(pagenums):
+                            yield payload
+                        else:
+                            last = payload  # handed on once the worker has reported its counters
+                    elif kind == "error":
+                        raise WorkerFailed(payload)
+                    else:
+                        stats, recycled, rss = payload
+                        if self.merge is not None:
+                            self.merge(stats)
+                        self.peak_worker_rss = max(self.peak_worker_rss, rss)
+                        if recycled:
+                            self.recycled += 1
+                            print(f"[INFO] Worker reached {rss / 2 ** 20:.0f} MB after page {pagenums[done - 1] + 1}, "
+                                  f"starting a new one")
+                        break
+            finally:
+                receiver.close()
+                process.join(timeout=5)
+                if process.is_alive():  # the parent stopped reading early
+                    process.terminate()
+                    process.join()
+            if last is not None:
+                yield last
+            pagenums = pagenums[done:]
+
+    def _run(self, work, pagenums, sender):
+        try:
+            if self.reset is not None:
+                self.reset()
+            recycled = False
+            peak = 0
+            for item in work(pagenums):
+                sender.send(("result", item))
+                rss = current_rss_bytes() or 0
+                peak = max(peak, rss)
+                if rss > self.ceiling_bytes and item[0] != pagenums[-1]:
+                    recycled = True
+                    break
+            sender.send(("done", (self.collect() if self.collect is not None else None, recycled, peak)))
+        except BaseException:
+            sender.send(("error", traceback.format_exc()))
+        finally:
+            sender.close()
+
+    def summary(self):
+        return {"ceiling_mb": self.ceiling_bytes // 2 ** 20, "workers": self.workers, "recycled": self.recycled,
+                "peak_worker_rss_bytes": self.peak_worker_rss}
+
+    def report(self):
+        if self.workers:
+            print(f"[INFO] Page workers: {self.workers} started, {self.recycled} recycled at the "
+                  f"{self.ceiling_bytes // 2 ** 20} MB ceiling, peak worker RSS {self.peak_worker_rss / 2 ** 20:.0f} MB")
@@ -0,0 +1,164 @@
+"""
+Compact in-memory model of what the PDF parser extracts.
+
+A document is a list of pages, a page a list of text blocks (one per pdfminer text container) plus its OCR and
+table text, a block a list of font runs (consecutive words set in the same font) and the runs pair up into
+passages: a subheader run followed by its content run. Fonts are interned once per document in a FontTable
+and referred to by a small integer id.
+
+A page stores its runs flat: one list of run texts, an array of font ids and an array of block boundaries.
+Blocks, runs and passages are slotted views built on demand, so a page costs a few bytes per run on top of
+its text instead of a dict entry per passage and a tuple per font change.
+
+Pages serialize straight to the JSON output format with Page.to_output().
+
+Usage:
+    fonts = FontTable()
+    block = Block()
+    block.add_run(fonts.intern("Times-Roman", 10.0), "Some text")
+    page = Page(number=0)
+    page.add_block(block)
+    page.to_output(document_url)
+"""
+
+import sys
+from array import array
+
+NO_FONT = 0xFFFF  # font id of runs rebuilt from a previous output, which does not record fonts
+
+
+class FontTable:
+    __slots__ = ("fonts", "_ids")
+
+    def __init__(self):
+        self.fonts = []  # font id -> (fontname, size)
+        self._ids = {}
+
+    def intern(self, fontname, size):
+        key = (fontname, size)
+        font_id = self._ids.get(key)
+        if font_id is None:
+            font_id = len(self.fonts)
+            self.fonts.append((sys.intern(fontname), size))
+            self._ids[key] = font_id
+        return font_id
+
+    def detail(self, font_id):
+        return self.fonts[font_id] if font_id != NO_FONT else None
+
+
+class FontRun:
+    __slots__ = ("font", "text")
+
+    def __init__(self, font, text):
+        self.font = font  # id in the FontTable, NO_FONT if unknown
+        self.text = text
+
+
+class Passage:
+    __slots__ = ("subheader", "content")
+
+    def __init__(self, subheader, content):
+        self.subheader = subheader  # FontRun
+        self.content = content  # FontRun, or None for a subheader with no content after it
+
+
+class Block:
+    __slots__ = ("fonts", "texts")
+
+    def __init__(self, fonts=None, texts=None):
+        self.fonts = fonts if fonts is not None else array("H")
+        self.texts = texts if texts is not None else []
+
+    def add_run(self, font, text):
+        self.fonts.append(font)
+        self.texts.append(text)
+
+    def runs(self):
+        for font, text in zip(self.fonts, self.texts):
+            yield FontRun(font, text)
+
+    # Runs alternate subheader, content, subheader, ... within a block
+    def passages(self):
+        runs = list(self.runs())
+        for i in range(0, len(runs), 2):
+            yield Passage(runs[i], runs[i + 1] if i + 1 < len(runs) else None)
+
+    def subheaders_and_contents(self):
+        return {passage.subheader.text: passage.content.text if passage.content is not None else ""
+                for passage in self.passages()}
+
+    # Distinct font ids of the block in order of first use
+    def font_ids(self):
+        return list(dict.fromkeys(self.fonts))
+
+
+class Page:
+    __slots__ = ("number", "texts", "fonts", "block_ends", "images", "tables", "fingerprint")
+
+    def __init__(self, number, images=None, tables=None, fingerprint=None):
+        self.number = number  # 0 based
+        self.texts = []  # text of every run of the page, block after block
+        self.fonts = array("H")  # font id of every run
+        self.block_ends = array("I")  # index in texts after the last run of each block
+        self.images = images if images is not None else []  # OCR text, one entry per figure or scanned page
+        self.tables = tables if tables is not None else []  # one "|a|b|" string per table
+        self.fingerprint = fingerprint
+
+    def add_block(self, block):
+        self.texts.extend(block.texts)
+        self.fonts.extend(block.fonts)
+        self.block_ends.append(len(self.texts))
+
+    # Point the runs at font_table, for a page built against another table (fonts: its id -> (fontname, size))
+    def remap_fonts(self, fonts, font_table):
+        self.fonts = array("H", (font_table.intern(*fonts[font]) if font != NO_FONT else NO_FONT
+                                 for font in self.fonts))
+
+    def blocks(self):
+        start = 0
+        for end in self.block_ends:
+            yield Block(self.fonts[start:end], self.texts[start:end])
+            start = end
+
+    # Subheader -> content over the whole page, later blocks overwrite repeated subheaders
+    def subheader(self):
+        subheaders = {}
+        for block in self.blocks():
+            subheaders.update(block.subheaders_and_contents())
+        return subheaders
+
+    def to_output(self, document_url):
+        return {
+            "document_id": "",
+            "document_title": "",
+            "document_url": document_url,
+            "page_number": f"Page_Page_{self.number}",
+            "subheader": self.subheader(),
+            "table_text": "\n".join(self.tables),
+            "image_text": "\n".join(self.images),
+            "vector": "<BERT_Embedding_of_combined_text>",
+            "fingerprint": self.fingerprint,
+            "traceability": {
+                "source": "Tinker Air Force Base",
+                "manual_reference": "",
+                "exact_location": f"nPage_{self.number}",
+            },
+        }
+
+    # Rebuild a page from an entry of a previous JSON output, as one block without fonts
+    @classmethod
+    def from_output(cls, number, output):
+        page = cls(
+            number,
+            images=[output["image_text"]] if output.get("image_text") else [],
+            tables=[output["table_text"]] if output.get("table_text") else [],
+            fingerprint=output.get("fingerprint"),
+        )
+        block = Block()
+        for subheader, content in output.get("subheader", {}).items():
+            block.add_run(NO_FONT, subheader)
+            block.add_run(NO_FONT, content)
+        if block.texts:
+            page.add_block(block)
+        return page
@@ -0,0 +1,203 @@
+"""
+Per-page, per-stage profiling for the PDF parser.
+
+Every stage (layout analysis, image extraction, OCR, text classification, table detection, ...) is timed
+on every page: wall time, CPU time and the process peak memory it reached. For a chosen page range the
+profiler can also capture cProfile statistics and tracemalloc allocation peaks. At the end of a run it
+prints a summary table and writes a JSON report (plus .prof / top allocation files for the detail pages).
+
+Usage:
+    profiler = ParserProfiler(detail_pages=(10, 12))
+    with profiler.page(pagenum):
+        with profiler.stage("tables", pagenum):
+            ...
+    profiler.write_report()
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# High-water mark of the process memory in bytes, or None if the platform gives no way to read it
+def peak_rss_bytes():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # macOS reports bytes, Linux kilobytes
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+# Current resident memory of the process in bytes, or its high-water mark where that is all there is
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return peak_rss_bytes()
+
+
+class ParserProfiler:
+    def __init__(self, enabled=True, detail_pages=None, output_dir="./app/data/parser_profile"):
+        self.enabled = enabled
+        self.detail_pages = detail_pages  # (first, last) page numbers, 0 based and inclusive
+        self.output_dir = output_dir
+        self.records = []
+        self._stack = []  # running tracemalloc peaks of the open stages
+        self._profile = None
+        self._started = time.perf_counter()
+
+    def _is_detail_page(self, pagenum):
+        return (self.detail_pages is not None and pagenum is not None
+                and self.detail_pages[0] <= pagenum <= self.detail_pages[1])
+
+    # Wrap the processing of one page, turning on cProfile and tracemalloc inside the detail range
+    @contextmanager
+    def page(self, pagenum):
+        if not self.enabled or not self._is_detail_page(pagenum):
+            yield
+            return
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        self._profile.enable()
+        try:
+            yield
+        finally:
+            self._profile.disable()
+            if started_tracing:
+                self._write_allocations(pagenum, tracemalloc.take_snapshot())
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name, pagenum=None):
+        if not self.enabled:
+            yield
+            return
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Hand the peak reached so far to the enclosing stage before measuring this one from zero
+            if self._stack:
+                self._stack[-1] = max(self._stack[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._stack.append(tracemalloc.get_traced_memory()[0])
+        rss_before = peak_rss_bytes()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                "page": pagenum,
+                "stage": name,
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+            if rss_before is not None and record["peak_rss_bytes"] is not None:
+                record["peak_rss_growth_bytes"] = record["peak_rss_bytes"] - rss_before
+            if tracing and tracemalloc.is_tracing():
+                peak = max(self._stack.pop(), tracemalloc.get_traced_memory()[1])
+                record["traced_peak_bytes"] = peak
+                if self._stack:
+                    self._stack[-1] = max(self._stack[-1], peak)
+                tracemalloc.reset_peak()
+            elif tracing:
+                self._stack.pop()
+            self.records.append(record)
+
+    # Time each step of an iterator as a stage, e.g. pdfminer producing the next page layout.
+    # pages gives the page number of each step when the iterator skips pages.
+    def iterate(self, name, iterable, pages=None):
+        iterator = iter(iterable)
+        index = 0
+        while True:
+            try:
+                with self.stage(name, pages[index] if pages is not None and index < len(pages) else index):
+                    item = next(iterator)
+            except StopIteration:
+                # the exhausted call is not a page, drop its record
+                if self.enabled:
+                    self.records.pop()
+                return
+            yield item
+            index += 1
+
+    def summary(self):
+        stages = defaultdict(lambda: {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0,
+                                      "slowest_page": None, "peak_rss_growth_bytes": 0})
+        for record in self.records:
+            row = stages[record["stage"]]
+            row["calls"] += 1
+            row["wall_s"] += record["wall_s"]
+            row["cpu_s"] += record["cpu_s"]
+            row["peak_rss_growth_bytes"] += record.get("peak_rss_growth_bytes", 0)
+            if record["wall_s"] > row["max_wall_s"]:
+                row["max_wall_s"] = record["wall_s"]
+                row["slowest_page"] = record["page"]
+        return dict(stages)
+
+    def _write_allocations(self, pagenum, snapshot):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"allocations_page_{pagenum}.txt")
+        with open(path, "w") as f:
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"{stat}\n")
+
+    # extra: further sections for the JSON report, e.g. the page triage counts
+    def write_report(self, extra=None):
+        if not self.enabled:
+            return None
+        total = time.perf_counter() - self._started
+        summary = self.summary()
+
+        print("[INFO] Parser profile (per stage, all pages):")
+        print(f"{'stage':<16}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'% run':>8}{'max s':>9}{'slowest page':>14}")
+        for name, row in sorted(summary.items(), key=lambda item: -item[1]["wall_s"]):
+            print(f"{name:<16}{row['calls']:>7}{row['wall_s']:>10.2f}{row['cpu_s']:>10.2f}"
+                  f"{100 * row['wall_s'] / max(total, 1e-9):>8.1f}{row['max_wall_s']:>9.2f}{str(row['slowest_page']):>14}")
+        print(f"[INFO] Total run time {total:.2f}s, peak RSS {(peak_rss_bytes() or 0) / 2 ** 20:.1f} MB")
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = os.path.join(self.output_dir, "profile.json")
+        with open(report_path, "w") as f:
+            json.dump({
+                "total_s": total,
+                "peak_rss_bytes": peak_rss_bytes(),
+                "detail_pages": self.detail_pages,
+                "stages": summary,
+                "records": self.records,
+                **(extra or {}),
+            }, f, indent=4)
+        if self._profile is not None:
+            self._profile.dump_stats(os.path.join(self.output_dir, "detail_pages.prof"))
+            text = io.StringIO()
+            pstats.Stats(self._profile, stream=text).sort_stats("cumulative").print_stats(40)
+            with open(os.path.join(self.output_dir, "detail_pages_top.txt"), "w") as f:
+                f.write(text.getvalue())
+        print(f"[INFO] Profile report saved to {report_path}")
+        return report_path
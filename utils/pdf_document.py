@@ -0,0 +1,187 @@
+"""
+One memory-mapped copy of the PDF, shared by PyPDF2, pdfplumber and pdfminer.
+
+The parser used to open the manual once per library and pass: PyPDF2 for the page fingerprints and again for
+the figures, pdfplumber for the tables, pdfminer's extract_pages for the font pass and again for the text,
+plus a full read to hash it for the layout cache. Each open parsed the cross-reference table and page tree
+again. PdfDocument opens and maps the file once and hands every library its own view of the mapping (a
+file-like object with its own position, so the libraries never move each other's cursor):
+
+- one PyPDF2 reader, used for the fingerprints and the figure crops
+- one pdfplumber document, whose pdfminer document (xref, object cache, page tree) and resource manager
+  (parsed fonts) also serve the layout analysis, in place of extract_pages
+- the layout cache key is hashed straight from the mapping
+
+What this saves is opens and cross-reference parses; the libraries still copy every byte they read out of the
+mapping (see summary()).
+
+Forked page workers inherit the mapping, so they never open the file either. The poppler render of scanned
+pages (pdf2image) runs in its own process and still opens the file by path.
+
+Usage:
+    with PdfDocument(pdf_path) as document:
+        document.reader.pages[0]
+        for layout in document.page_layouts([0, 1], LAParams()):
+            ...
+        document.report()
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import PyPDF2
+import pdfplumber
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.pdfinterp import PDFPageInterpreter
+
+
+# File-like view of the shared mapping. Every read copies the bytes asked for out of the mapping (the libraries
+# want bytes objects), what is saved is the open and the separate parse per library, not the copy.
+class MappedView(io.RawIOBase):
+    def __init__(self, document):
+        self._document = document
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._document.buffer[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        self._document.bytes_read += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._document.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+
+class PdfDocument:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self._map)
+        self.reset_counters()
+        self._reader = None
+        self._plumber = None
+        self._sha256 = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Counters of this process. library_opens counts the passes that opened the file (and, but for the hash,
+    # parsed its cross-reference table) for themselves before: each reader or plumber use, each layout pass (an
+    # extract_pages call) and each hash. xref_parses counts the documents actually parsed here.
+    def reset_counters(self):
+        self.library_opens = 0
+        self.xref_parses = 0
+        self.bytes_read = 0  # copied out of the mapping by the libraries' reads
+        self.bytes_hashed = 0  # hashed in place, without a copy
+
+    def view(self):
+        return MappedView(self)
+
+    def _reader_document(self):
+        if self._reader is None:
+            self.xref_parses += 1
+            self._reader = PyPDF2.PdfReader(self.view())
+        return self._reader
+
+    def _plumber_document(self):
+        if self._plumber is None:
+            self.xref_parses += 1
+            self._plumber = pdfplumber.open(self.view())
+        return self._plumber
+
+    # PyPDF2 reader, parsed on first use
+    @property
+    def reader(self):
+        self.library_opens += 1
+        return self._reader_document()
+
+    # pdfplumber document, parsed on first use. Its pdfminer document is the one the layout analysis uses.
+    @property
+    def plumber(self):
+        self.library_opens += 1
+        return self._plumber_document()
+
+    def page_count(self):
+        return len(self._plumber_document().pages)
+
+    # pdfminer layout of the given 0 based pages, in page order, the same LTPage objects extract_pages yields
+    def page_layouts(self, page_numbers, laparams):
+        self.library_opens += 1
+        plumber = self._plumber_document()
+        device = PDFPageAggregator(plumber.rsrcmgr, laparams=laparams)
+        interpreter = PDFPageInterpreter(plumber.rsrcmgr, device)
+        pages = plumber.pages
+        for pagenum in sorted(set(page_numbers)):
+            interpreter.process_page(pages[pagenum].page_obj)
+            yield device.get_result()
+
+    def sha256(self):
+        if self._sha256 is None:
+            self.library_opens += 1
+            self._sha256 = hashlib.sha256(self.buffer).hexdigest()
+            self.bytes_hashed += self.size
+        return self._sha256
+
+    # Drop what the libraries parsed, the mapping stays. A forked page worker starts from here so it does not
+    # carry the parent's object caches.
+    def release(self):
+        if self._plumber is not None:
+            self._plumber.close()
+        self._reader = None
+        self._plumber = None
+
+    def close(self):
+        self.release()
+        self.buffer.release()
+        self._map.close()
+        self._file.close()
+
+    # Counters of this process, and merge() for the ones a page worker sends back
+    def counters(self):
+        return {"library_opens": self.library_opens, "xref_parses": self.xref_parses,
+                "bytes_read": self.bytes_read, "bytes_hashed": self.bytes_hashed}
+
+    def merge(self, counters):
+        self.library_opens += counters["library_opens"]
+        self.xref_parses += counters["xref_parses"]
+        self.bytes_read += counters["bytes_read"]
+        self.bytes_hashed += counters["bytes_hashed"]
+
+    # Compared with opening the file per library: every library open became a read of the mapping (one open of
+    # the file, page workers inherit it), and the passes share the parsed documents. The bytes still get copied
+    # by every read, the saving is in opens and cross-reference parses, not in bytes.
+    def summary(self):
+        return {"size_bytes": self.size, "file_opens": 1, "library_opens": self.library_opens,
+                "opens_avoided": max(0, self.library_opens - 1), "xref_parses": self.xref_parses,
+                "xref_parses_avoided": max(0, self.library_opens - (1 if self.bytes_hashed else 0) - self.xref_parses),
+                "bytes_copied": self.bytes_read, "bytes_hashed": self.bytes_hashed}
+
+    def report(self):
+        summary = self.summary()
+        print(f"[INFO] Document: {summary['library_opens']} library opens served by one open of the file "
+              f"({summary['opens_avoided']} opens avoided) and {summary['xref_parses']} cross-reference parses "
+              f"({summary['xref_parses_avoided']} avoided); the libraries' reads copied "
+              f"{summary['bytes_copied'] / 2 ** 20:.1f} MB out of the mapping of {self.size / 2 ** 20:.1f} MB")
@@ -17,11 +17,25 @@ Features:
 
 Usage:
 1. Ensure the Tesseract OCR engine is installed and the path (`TESSERACT_PATH`) is correctly set.
-2. Specify the target PDF file path (`PDF_PATH`).
+2. Specify the target PDF file path (`PDF_PATH`), or pass it as the first argument.
 3. Run the script to process the PDF and save the extracted data in a JSON format.
+4. For a new revision of a manual, pass the JSON output of the previous revision as the second argument:
+   pages whose content fingerprint is unchanged are copied from it instead of being extracted and OCRed again.
 
 Note:
 - Temporary files generated during processing (e.g., cropped images) are automatically deleted post-processing.
+- Each page is triaged first (see page_triage.py): table detection and figure OCR only run where the page
+  layout says they can find something, and scanned pages are OCRed as a whole (`TRIAGE = False` runs everything).
+- pdfminer's layout analysis of every page is cached on disk (see layout_cache.py), reruns on the same PDF
+  skip it; delete `LAYOUT_CACHE_DIR` or set `LAYOUT_CACHE = False` to analyze again.
+- Pages are streamed: each one is written to the JSON output as soon as it is processed. With
+  `PARSER_MEMORY_CEILING_MB` set, pages are processed in a forked worker process that is replaced by a fresh one
+  whenever its memory passes the ceiling (see page_workers.py), so a 2,000 page manual parses in bounded memory.
+- With `PARSER_EMIT_PAGES=true` every output page is also printed as soon as it is done, as one `[PAGE] <json>`
+  line, for a caller that indexes pages while the parser is still running (see app/elastic/ingest.py). With
+  `PARSER_PAGES_FD` set the lines go to that file descriptor instead of stdout.
+- The PDF is opened and memory-mapped once (see pdf_document.py): PyPDF2, pdfplumber and the pdfminer layout
+  analysis all read from the mapping, and pdfplumber and pdfminer share one parsed document.
 
 Author: Zachary Knapp
 Date: 11/2/23
@@ -31,20 +45,44 @@ Version: 3.0
 # TODO: 25 character limit, continue to aggregate text
 
 import PyPDF2
-from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer, LTChar, LTFigure
-import pdfplumber
-from PIL import Image
 from pdf2image import convert_from_path
 import pytesseract
 import os
+import sys
 import json
+import hashlib
 import numpy as np
 from collections import defaultdict
+from parser_profiler import ParserProfiler
+from page_triage import PageTriage, TriageStats
+from ocr_frontend import OcrStats, FULL_PAGE_DPI, choose_dpi, recognize, recognize_page, should_ocr
+from layout_cache import LayoutCache
+from parser_model import FontTable, Block, Page
+from page_workers import PageWorkers
+from pdf_document import PdfDocument
 
 # Define constants
-TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-PDF_PATH = "./app/data/AFD-180201-00-5-3.pdf"
+TESSERACT_PATH = os.environ.get("TESSERACT_PATH", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+PDF_PATH = sys.argv[1] if len(sys.argv) > 1 else "./app/data/AFD-180201-00-5-3.pdf"
+PREVIOUS_OUTPUT = sys.argv[2] if len(sys.argv) > 2 else None  # extracted JSON of the previous revision
+PROFILE = True  # time every stage of every page and write a report at the end
+PROFILE_DETAIL_PAGES = None  # e.g. (10, 12) to also capture cProfile and tracemalloc for pages 11 to 13
+PROFILE_OUTPUT = "./app/data/parser_profile"
+TRIAGE = True  # classify each page first and only run the table detection / OCR it needs
+LAYOUT_CACHE = True  # keep pdfminer's per-page layout analysis on disk and reuse it on reruns
+LAYOUT_CACHE_DIR = "./app/data/layout_cache"
+# Resident memory at which a page worker process is replaced by a fresh one (0 works in this process)
+MEMORY_CEILING_MB = int(os.environ.get("PARSER_MEMORY_CEILING_MB", "0"))
+EMIT_PAGES = os.environ.get("PARSER_EMIT_PAGES", "false").lower() == "true"  # print each output page as it is done
+PAGES_FD = os.environ.get("PARSER_PAGES_FD")  # file descriptor the page lines go to instead of stdout
+
+profiler = ParserProfiler(PROFILE, PROFILE_DETAIL_PAGES, PROFILE_OUTPUT)
+triage_stats = TriageStats()
+ocr_stats = OcrStats()
+layout_cache = LayoutCache(LAYOUT_CACHE_DIR, enabled=LAYOUT_CACHE)
+fonts = FontTable()  # every (fontname, size) seen in the document, font runs refer to it by id
+document = None  # the open PdfDocument, shared by every pass over the PDF
 
 # Initialize script
 print("[INFO] Initializing...")
@@ -58,10 +96,10 @@ else:
     print("File does not exist.")
 
 
-# Set Tesseract command and open PDF with pdfplumber
+# Set Tesseract command and open the PDF for all three libraries
 def initialize_pdf(PDF_PATH):
     pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
-    return pdfplumber.open(PDF_PATH)
+    return PdfDocument(PDF_PATH)
 
 
 # Clear the content of the extracted data file
@@ -100,15 +138,12 @@ def replace_ligatures(text):
     return text
 
 
+# Split a text container into font runs, each run is a subheader or the content that follows it
 def extract_text(element):
-    word_formats = []
-    formatted_text = []
-    last_font_detail = None
+    block = Block()
+    last_font_id = None
     current_text = ""
 
-    subheaders_and_contents = {}
-    current_subheader = None
-
     for text_line in element:
         if isinstance(text_line, LTTextContainer):
             # Apply ligature replacement to the line of text
@@ -118,67 +153,49 @@ def extract_text(element):
             word_index = 0
             for character in text_line:
                 if isinstance(character, LTChar):
-                    font_detail = (
+                    font_id = fonts.intern(
                         normalize_fontname(character.fontname),
                         round(float(character.size), 2),
                     )
                     if word_index < len(words):
                         word = words[word_index]
                         if character.get_text() == word[0]:
-                            if font_detail != last_font_detail:
-                                if last_font_detail is not None:
-                                    formatted_text.append(
-                                        (last_font_detail, current_text.strip())
-                                    )
-
-                                    # Check if it's a subheader or content
-                                    if len(formatted_text) % 2 == 0:  # It's content
-                                        subheaders_and_contents[
-                                            current_subheader
-                                        ] = current_text.strip()
-                                    else:  # It's a subheader
-                                        current_subheader = current_text.strip()
-
-                                last_font_detail = font_detail
+                            if font_id != last_font_id:
+                                if last_font_id is not None:
+                                    block.add_run(last_font_id, current_text.strip())
+                                last_font_id = font_id
                                 current_text = ""
-                                if font_detail not in word_formats:
-                                    word_formats.append(font_detail)
                             current_text += word + " "
                             word_index += 1
 
-    # Store the text of the last font detail
-    if last_font_detail is not None:
-        formatted_text.append((last_font_detail, current_text.strip()))
-
-        # Last item logic
-        if len(formatted_text) % 2 == 0:  # It's content
-            subheaders_and_contents[current_subheader] = current_text.strip()
-        else:  # It's a subheader with no associated content
-            subheaders_and_contents[current_text.strip()] = ""
+    # Store the text of the last font run
+    if last_font_id is not None:
+        block.add_run(last_font_id, current_text.strip())
 
     with open(r"./app/data/extracted_data.txt", "a", encoding="utf-8") as file:
-        file.write(f"\nWord Formats: {word_formats}\n")
-        for subheader, content in subheaders_and_contents.items():
+        file.write(f"\nWord Formats: {[fonts.detail(font_id) for font_id in block.font_ids()]}\n")
+        for subheader, content in block.subheaders_and_contents().items():
             file.write(f"Subheading: {subheader}\nContent: {content}\n")
 
-    return word_formats, subheaders_and_contents
+    return block
 
 
-# Gather all font data from the PDF
-def gather_all_font_data(PDF_PATH):
-    font_data = []
+# Gather all font data from the PDF (or only from the given 0 based page numbers)
+def gather_all_font_data(PDF_PATH, page_numbers=None):
     print("[INFO] Gathering font data from PDF...")
 
-    for page in extract_pages(PDF_PATH):
-        text_elements = [e for e in page if isinstance(e, LTTextContainer)]
-
-        for element in text_elements:
-            _, format_per_line = extract_text(element)
-            font_data.extend(format_per_line)
-    print(f"[DEBUG] Total number of font data points: {len(font_data)}")
+    font_data = sum(count for _, count in workers.map(page_font_data, page_numbers))
+    print(f"[DEBUG] Total number of font data points: {font_data}")
     return font_data
 
 
+# Number of font data points of each page, run by gather_all_font_data (in a worker process if there is a ceiling)
+def page_font_data(page_numbers):
+    for pagenum, page in zip(page_numbers, layout_cache.pages(PDF_PATH, page_numbers, document)):
+        text_elements = [e for e in page if isinstance(e, LTTextContainer)]
+        yield pagenum, sum(len(extract_text(element).subheaders_and_contents()) for element in text_elements)
+
+
 # Crop an image element from a PDF page
 def crop_image(element, pageObj):
     print("[DEBUG] Inside crop_image function.")
@@ -202,31 +219,41 @@ def crop_image(element, pageObj):
         cropped_pdf_writer.write(cropped_pdf_file)
 
 
-# Convert a PDF page to an image
-def convert_to_image(input_file):
-    print("[DEBUG] Inside convert_to_image function.")
-    print("[DEBUG] Image saved as PDF_image.png")
+# Convert a cropped PDF figure to a grayscale image, at a DPI chosen from the figure size
+def convert_to_image(input_file, dpi):
+    print(f"[DEBUG] Inside convert_to_image function, {dpi} DPI.")
 
-    images = convert_from_path(input_file)
-    images[0].save("PDF_image.png", "PNG")
+    images = convert_from_path(input_file, dpi=dpi, grayscale=True)
+    return images[0]
 
 
-# Extract text from an image using Tesseract OCR
-def extract_text_from_image(image_path):
+# Extract text from a figure image using Tesseract OCR, binarized and segmented for the figure's shape
+def extract_text_from_image(image, width, height):
     print("[DEBUG] Inside extract_text_from_image function.")
 
-    img = Image.open(image_path)
-    text = pytesseract.image_to_string(img)
-    img.close()
+    text = recognize(image, width, height)
+    image.close()
     return text
 
 
-# Extract table from PDF
-def extract_table_from_pdf(PDF_PATH, pagenum, table_num):
+# OCR a whole page, for scanned pages that have no text layer
+def ocr_full_page(pagenum):
+    print("[DEBUG] Inside ocr_full_page function.")
+    with profiler.stage("rasterize", pagenum):
+        images = convert_from_path(PDF_PATH, dpi=FULL_PAGE_DPI, grayscale=True,
+                                   first_page=pagenum + 1, last_page=pagenum + 1)
+    with profiler.stage("ocr", pagenum):
+        text = recognize_page(images[0])
+    for image in images:
+        image.close()
+    return text
+
+
+# Extract table from the already opened pdfplumber document
+def extract_table_from_pdf(pdf, pagenum, table_num):
     print("[DEBUG] Inside extract_table_from_pdf function.")
-    with initialize_pdf(PDF_PATH) as pdf:
-        table_page = pdf.pages[pagenum]
-        return table_page.extract_tables()[table_num]
+    table_page = pdf.pages[pagenum]
+    return table_page.extract_tables()[table_num]
 
 
 # Convert table data to a structured string format
@@ -247,15 +274,40 @@ def convert_table_to_string(table):
     return table_string[:-1]
 
 
-# Extract data from PDF
-pdfFileObj = open(PDF_PATH, "rb")
-pdfReader = PyPDF2.PdfReader(pdfFileObj)
-text_per_page = {}
+# Content fingerprint of a page: its drawing operators, page box and the data of every image or form it
+# draws. Cheap to compute (no layout analysis, no OCR) and unchanged when a revision leaves the page alone.
+def page_fingerprint(pageObj):
+    digest = hashlib.sha256(str(list(pageObj.mediabox)).encode())
+    contents = pageObj.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = pageObj.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects):
+            digest.update(name.encode())
+            digest.update(xobjects[name].get_object().get_data())
+    return digest.hexdigest()
+
+
+# Pages of a previous output by fingerprint, for re-ingesting a revised manual
+def load_previous_pages(path):
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        pages = json.load(f)
+    return {page["fingerprint"]: page for page in pages if page.get("fingerprint")}
+
+
+# Page content in the shape process_page returns, rebuilt from a page of the previous output
+def reuse_page_content(pagenum, previous_page):
+    return Page.from_output(pagenum, previous_page)
 
 
 # Extract and process images from a given PDF page
 def extract_and_process_images(
-    pageObj_from_pdfminer, pdfReader, pagenum, page_elements
+    pageObj_from_pdfminer, pdfReader, pagenum, page_elements, triage
 ):
     print("[INFO] Extracting images...")
     print(f"[DEBUG] Number of page elements: {len(page_elements)}")
@@ -266,11 +318,18 @@ def extract_and_process_images(
     for i, component in enumerate(page_elements):
         _, element = component
 
-        if isinstance(element, LTFigure):
+        if isinstance(element, LTFigure) and triage.ocr_figure(element):
+            # Icons and symbols below the size threshold are not worth an OCR call
+            ocr_stats.record(element.width, element.height)
+            if not should_ocr(element.width, element.height):
+                continue
             # Handle Image
-            crop_image(element, pageObj_from_pypdf2)
-            convert_to_image("cropped_image.pdf")
-            image_text = extract_text_from_image("PDF_image.png")
+            with profiler.stage("crop_image", pagenum):
+                crop_image(element, pageObj_from_pypdf2)
+            with profiler.stage("rasterize", pagenum):
+                image = convert_to_image("cropped_image.pdf", choose_dpi(element.width, element.height))
+            with profiler.stage("ocr", pagenum):
+                image_text = extract_text_from_image(image, element.width, element.height)
             images_text.append(image_text)
     return images_text
 
@@ -295,61 +354,67 @@ def process_tables(page, pagenum, pdf):
 def process_page(page, pdfReader, pdf, pagenum):
     print(f"[INFO] Processing Page {pagenum + 1}...")
 
-    page_content = {
-        "subheading": {},
-        "images": [],
-        "tables": [],
-    }
-
-    current_subheading = None
+    page_content = Page(pagenum)
 
     page_elements = [(element.y1, element) for element in page._objs]
     page_elements.sort(key=lambda a: a[0], reverse=True)
 
-    page_content["images"] = extract_and_process_images(
-        page, pdfReader, pagenum, page_elements
-    )
-
-    for _, element in page_elements:
-        if isinstance(element, LTTextContainer):
-            _, extracted_texts_dict = extract_text(element)
-            page_content["subheading"].update(extracted_texts_dict)
-
-    page_content["tables"] = process_tables(page, pagenum, pdf)
+    # Decide from the layout objects which of the expensive extractors this page needs
+    with profiler.stage("triage", pagenum):
+        triage = PageTriage(page, TRIAGE)
+    triage_stats.record(triage)
+
+    with profiler.stage("images", pagenum):
+        if triage.full_page_ocr:
+            page_content.images = [ocr_full_page(pagenum)]
+        else:
+            page_content.images = extract_and_process_images(
+                page, pdfReader, pagenum, page_elements, triage
+            )
+
+    with profiler.stage("extract_text", pagenum):
+        for _, element in page_elements:
+            if isinstance(element, LTTextContainer):
+                page_content.add_block(extract_text(element))
+
+    if triage.run_tables:
+        with profiler.stage("tables", pagenum):
+            page_content.tables = process_tables(page, pagenum, pdf)
     return page_content
 
 
-# Convert extracted data from PDF pages to a structured format
-def structure_pdf_data(text_per_page):
+# Convert extracted data from PDF pages to a structured format, one output record per page
+def structure_pdf_data(pages):
     print("[INFO] Structuring extracted data...")
-    data = []
-
-    for page_num, content_dict in text_per_page.items():
-        page_data = {
-            "document_id": "",
-            "document_title": "",
-            "document_url": PDF_PATH,
-            "page_number": f"Page_{page_num}",
-            "subheader": content_dict.get("subheading", {}),
-            "table_text": "\n".join(content_dict.get("tables", [])),
-            "image_text": "\n".join(content_dict.get("images", [])),
-            "vector": "<BERT_Embedding_of_combined_text>",
-            "traceability": {
-                "source": "Tinker Air Force Base",
-                "manual_reference": "",
-                "exact_location": f"n{page_num}",
-            },
-        }
-        data.append(page_data)
-
-    return data
-
-
-# Save structured data to a JSON file
+    for page in pages:
+        yield page.to_output(PDF_PATH)
+
+
+# Print each output record as one "[PAGE] <json>" line on its way to the JSON file, on stdout or on PAGES_FD.
+# Only this process writes them, worker processes print to stderr (see reset_worker_stats).
+def emit_pages(data):
+    out = os.fdopen(int(PAGES_FD), "w") if PAGES_FD else sys.stdout
+    try:
+        for record in data:
+            out.write("[PAGE] " + json.dumps(record) + "\n")
+            out.flush()
+            yield record
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+# Save structured data to a JSON file, a page at a time so the whole document never exists as one dict tree.
+# The file is the same as json.dump(list(data), f, indent=4) would write.
 def save_data_to_json(data, path="./app/data/extracted_data.json"):
     print(f"[INFO] Saving extracted data to JSON file")
     with open(path, "w") as f:
-        json.dump(data, f, indent=4)
+        separator = "[\n"
+        for record in data:
+            f.write(separator)
+            f.write("\n".join("    " + line for line in json.dumps(record, indent=4).split("\n")))
+            separator = ",\n"
+        f.write("[]" if separator == "[\n" else "\n]")
     print("[INFO] Data successfully saved to JSON")
 
 
@@ -361,40 +426,106 @@ def output_to_txt(filename, format_data, text_data):
         f.write("Line Text: " + text_data + "\n\n")  # Two newlines for separation.
 
 
+# Process the given pages of the PDF, one at a time. Each page's content is handed on as soon as it is done and
+# the libraries' caches for it are released, only the parsed document stays.
+def process_pages(page_numbers):
+    pdfReader, pdf = document.reader, document.plumber
+    # Time pdfminer's layout analysis (or its cache read) of each page
+    layouts = profiler.iterate("layout", layout_cache.pages(PDF_PATH, page_numbers, document), page_numbers)
+    for pagenum, page in zip(page_numbers, layouts):
+        print(f"[DEBUG] Processing page number {pagenum + 1}...")
+        # Process the content of the current page
+        with profiler.page(pagenum), profiler.stage("page_total", pagenum):
+            processed = process_page(page, pdfReader, pdf, pagenum)
+        pdf.pages[pagenum].flush_cache()
+        yield pagenum, (processed, fonts.fonts)
+
+
+# Counters of a worker process start from zero, the parent adds them up. The worker keeps the inherited mapping of
+# the PDF but parses it again, so it does not carry the parent's object caches. Its progress output goes to
+# stderr: a block-buffered write to the shared stdout could land in the middle of a [PAGE] line.
+def reset_worker_stats():
+    global triage_stats, ocr_stats, fonts
+    sys.stdout = sys.stderr
+    triage_stats = TriageStats()
+    ocr_stats = OcrStats()
+    fonts = FontTable()
+    layout_cache.hits = layout_cache.misses = layout_cache.uncachable = 0
+    profiler.records = []
+    document.release()
+    document.reset_counters()
+
+
+def collect_worker_stats():
+    return triage_stats, ocr_stats, layout_cache, profiler.records, document.counters()
+
+
+def merge_worker_stats(stats):
+    worker_triage, worker_ocr, worker_layout_cache, records, document_counters = stats
+    triage_stats.merge(worker_triage)
+    ocr_stats.merge(worker_ocr)
+    layout_cache.merge(worker_layout_cache)
+    profiler.records.extend(records)
+    document.merge(document_counters)
+
+
+workers = PageWorkers(MEMORY_CEILING_MB, reset_worker_stats, collect_worker_stats, merge_worker_stats)
+
+
+# Every page in order: the changed ones processed, the others reused from the previous revision
+def document_pages(fingerprints, previous_pages, changed):
+    processed = workers.map(process_pages, changed)
+    changed = set(changed)
+    for pagenum, fingerprint in enumerate(fingerprints):
+        if pagenum in changed:
+            _, (page, page_fonts) = next(processed)
+            if page_fonts is not fonts.fonts:  # ids of the worker's font table
+                page.remap_fonts(page_fonts, fonts)
+        else:
+            page = reuse_page_content(pagenum, previous_pages[fingerprint])
+        page.fingerprint = fingerprint
+        yield page
+
+
 def main():
+    global document
     print("[INFO] Starting main execution...")
-
-    with open(PDF_PATH, "rb") as pdfFileObj:
-        pdfReader = PyPDF2.PdfReader(pdfFileObj)
-        print("[DEBUG] Initializing PDF...")
-        pdf = initialize_pdf(PDF_PATH)
-        text_per_page = {}
-        print("[DEBUG] Gathering all font data...")
-        font_data = gather_all_font_data(PDF_PATH)
-
-        # Loop through all the pages of the PDF
-        for pagenum, page in enumerate(extract_pages(PDF_PATH)):
-            print(f"[DEBUG] Processing page number {pagenum + 1}...")
-            # Process the content of the current page
-            page_content = process_page(page, pdfReader, pdf, pagenum)
-            # Store the processed content into the text_per_page dictionary
-            text_per_page[f"Page_{pagenum}"] = page_content
-        print("[DEBUG] Cleaning up temporary files...")
-        try:
-            os.remove("cropped_image.pdf")
-        except FileNotFoundError:
-            pass
-        try:
-            os.remove("PDF_image.png")
-        except FileNotFoundError:
-            pass
-
-        print("[DEBUG] Structuring processed PDF data...")
-        processed_data = structure_pdf_data(text_per_page)
-        print("[DEBUG] Saving processed data to JSON...")
-        save_data_to_json(processed_data)
-        pdf.close()
-        print("[INFO] Completed!")
+    document = initialize_pdf(PDF_PATH)
+
+    # Only pages that are new or changed since the previous revision are extracted again
+    with profiler.stage("fingerprint"):
+        fingerprints = [page_fingerprint(pageObj) for pageObj in document.reader.pages]
+    previous_pages = load_previous_pages(PREVIOUS_OUTPUT)
+    changed = [pagenum for pagenum, fingerprint in enumerate(fingerprints) if fingerprint not in previous_pages]
+    print(f"[INFO] Changed pages: {len(changed)} of {len(fingerprints)}")
+
+    print("[DEBUG] Gathering all font data...")
+    with profiler.stage("font_data"):
+        gather_all_font_data(PDF_PATH, changed)
+
+    # Pages are processed, structured and written out one at a time, so memory does not grow with the page count
+    print("[DEBUG] Structuring processed PDF data...")
+    processed_data = structure_pdf_data(document_pages(fingerprints, previous_pages, changed))
+    if EMIT_PAGES:
+        processed_data = emit_pages(processed_data)
+    print("[DEBUG] Saving processed data to JSON...")
+    save_data_to_json(processed_data)
+    document.close()
+
+    print("[DEBUG] Cleaning up temporary files...")
+    try:
+        os.remove("cropped_image.pdf")
+    except FileNotFoundError:
+        pass
+    triage_stats.report()
+    ocr_stats.report()
+    layout_cache.report()
+    workers.report()
+    document.report()
+    profiler.write_report(extra={"triage": triage_stats.summary(), "ocr": ocr_stats.summary(),
+                                 "layout_cache": layout_cache.summary(), "workers": workers.summary(),
+                                 "document": document.summary()})
+    print("[INFO] Completed!")
 
 
 if __name__ == "__main__":